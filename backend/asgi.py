@@ -0,0 +1,326 @@
+"""asyncio entry point: the read-heavy routes served by Quart over an async psycopg pool.
+
+    uvicorn asgi:application --workers 2
+
+Routes defined here run natively on the event loop and issue their
+independent queries concurrently, each on its own pooled connection. Every
+other request (and CORS preflight) is handed to the WSGI app from main.py in a
+thread, so the full API stays available from one process and both halves share
+the response cache and the dish catalog. Tokens are those of main.py's
+JWTManager; the error bodies match flask_jwt_extended's.
+"""
+import asyncio
+import random
+from functools import wraps
+from asgiref.wsgi import WsgiToAsgi
+from flask_jwt_extended import create_access_token, decode_token
+from jwt import ExpiredSignatureError, InvalidTokenError
+from quart import Quart, Response, g, jsonify, request
+from werkzeug.exceptions import HTTPException
+import async_db
+from conditional import make_etag
+from main import MAX_BATCH_RECIPES, MAX_MENU_COMBINATIONS, MAX_MENU_VARIANTS, is_count, menu_cooking_time
+from models.aggregate_ingredients import AGGREGATE_QUERY, group_ingredients
+from models.availability import LOGIN_QUERY
+from models.dish_catalog import CATALOG_DISHES_QUERY, CATALOG_INGREDIENTS_QUERY, DISH_COLUMNS, catalog as dish_catalog
+from models.matching_dishes import find_matching_dishes, find_menu_variants
+from models.recipe_details import DETAIL_FIELDS, DISHES_QUERY, INGREDIENTS_QUERY, STEPS_QUERY, assemble_recipes
+from models.recipe_update import recipe_version
+from warmup import warm_up
+from wsgi import app as flask_app
+
+app = Quart(__name__)
+app.config.from_mapping(flask_app.config)
+cache = flask_app.extensions['response_cache']
+FRONTEND_URL = flask_app.config.get("FRONTEND_URL", "http://localhost:5173")
+
+RECIPE_VERSION_QUERY = '''
+    SELECT d.edited, d.is_moderated, (SELECT max(published) FROM moderation WHERE dish_id = d.id)
+    FROM dishes d WHERE d.id = %s
+'''
+
+
+@app.before_serving
+async def open_pool():
+    await async_db.open_pool()
+    # The routes handed to main.app still use the psycopg2 pool and the catalog
+    await asyncio.to_thread(warm_up, flask_app)
+
+@app.after_serving
+async def close_pool():
+    await async_db.close_pool()
+
+@app.after_request
+async def add_cors_headers(response):
+    origin = request.headers.get('Origin')
+    if origin and origin == FRONTEND_URL:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Vary'] = 'Origin'
+    return response
+
+
+def jwt_required(view):
+    """Async counterpart of flask_jwt_extended.jwt_required() for access tokens in the Authorization header"""
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        header = request.headers.get('Authorization')
+        if not header:
+            return jsonify({'msg': 'Missing Authorization Header'}), 401
+        scheme, _, token = header.partition(' ')
+        if scheme != 'Bearer' or not token:
+            return jsonify({'msg': "Missing 'Bearer' type in 'Authorization' header. Expected 'Authorization: Bearer <JWT>'"}), 401
+        try:
+            with flask_app.app_context():
+                claims = decode_token(token)
+        except ExpiredSignatureError:
+            return jsonify({'msg': 'Token has expired'}), 401
+        except InvalidTokenError as e:
+            return jsonify({'msg': str(e)}), 422
+        if claims.get('type') != 'access':
+            return jsonify({'msg': 'Only non-refresh tokens are allowed'}), 422
+        g.jwt_identity = claims[flask_app.config.get('JWT_IDENTITY_CLAIM', 'sub')]
+        return await view(*args, **kwargs)
+    return wrapper
+
+def etag_from(version):
+    """Async counterpart of conditional.etag_from: `version` is a coroutine function
+    taking the view arguments; the ETag is computed the same way, so it stays valid
+    across both entry points."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view(*args, **kwargs)
+            etag = make_etag(request.full_path, await version(**kwargs))
+            # Weak comparison: the tags are issued as W/"..."
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = await app.make_response(await view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+_catalog_reload = asyncio.Lock()
+
+async def catalog_snapshot():
+    snapshot = dish_catalog.fresh_snapshot()
+    if snapshot is not None:
+        return snapshot
+    # One reload per process; requests arriving meanwhile wait for its snapshot
+    async with _catalog_reload:
+        snapshot = dish_catalog.fresh_snapshot()
+        if snapshot is None:
+            dishes, ingredients = await asyncio.gather(
+                async_db.fetch_all(CATALOG_DISHES_QUERY),
+                async_db.fetch_all(CATALOG_INGREDIENTS_QUERY),
+            )
+            # Building the bitsets is CPU-bound (seconds for a large catalog), keep it off the loop
+            snapshot = await asyncio.to_thread(dish_catalog.load_rows, dishes, ingredients)
+    return snapshot
+
+async def fetch_rows(query, dish_ids, wanted=True):
+    return await async_db.fetch_all(query, (dish_ids,)) if wanted else []
+
+async def fetch_recipe_details(dish_ids, fields=DETAIL_FIELDS):
+    """models.recipe_details.fetch_recipe_details with the three queries run concurrently"""
+    dish_ids = [int(dish_id) for dish_id in dish_ids]
+    dishes, steps, ingredients = await asyncio.gather(
+        fetch_rows(DISHES_QUERY, dish_ids),
+        fetch_rows(STEPS_QUERY, dish_ids, 'steps' in fields),
+        fetch_rows(INGREDIENTS_QUERY, dish_ids, 'ingredients' in fields),
+    )
+    return assemble_recipes(dish_ids, dishes, steps, ingredients, fields)
+
+
+@app.route("/login", methods=["POST"])
+async def login():
+    data = await request.get_json()
+    user = await async_db.fetch_one(LOGIN_QUERY, (data["username"], data["password"]))
+    if user is None:
+        return {"error": "Invalid username or password"}
+    with flask_app.app_context():
+        access_token = create_access_token(identity=user["id"])
+    return {"access_token": access_token}
+
+async def recipe_etag(dish_id):
+    row = await async_db.fetch_one(RECIPE_VERSION_QUERY, (dish_id,))
+    return tuple(row.values()) if row is not None else None
+
+@app.route('/recipes/<int:dish_id>', methods=['GET'])
+@jwt_required
+@etag_from(recipe_etag)
+async def get_recipe(dish_id):
+    async def load():
+        dish, ingredients, steps = await asyncio.gather(
+            async_db.fetch_one(f"SELECT {', '.join(DISH_COLUMNS)} FROM dishes WHERE id = %s", (dish_id,)),
+            async_db.fetch_all("SELECT * FROM ingredients WHERE dish_id = %s ORDER BY index", (dish_id,)),
+            async_db.fetch_all("SELECT * FROM steps WHERE dish_id = %s ORDER BY index", (dish_id,)),
+        )
+        if dish is None:
+            return None
+        return {
+            **dish,
+            "ingredients": ingredients,
+            "steps": steps
+        }
+
+    try:
+        # Same versioned key as main.get_recipe
+        row = await recipe_etag(dish_id)
+        if row is None:
+            return jsonify({"error": "Recipe not found"}), 404
+        full_recipe_info = await cache.get_or_load_async(f'recipe:{dish_id}:{make_etag(*row)}', load)
+        if full_recipe_info is None:
+            return jsonify({"error": "Recipe not found"}), 404
+        return jsonify({**full_recipe_info, "version": recipe_version(row[0])})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/createMenu', methods=['POST'])
+async def create_menu():
+    data = await request.get_json()
+    dinner_category = data.get('dinnerCategory')
+    dinner_time = data.get('dinnerTime')
+
+    if 'variants' in data or 'combinations' in data:
+        return await create_menu_variants(data)
+
+    try:
+        cooking_time = menu_cooking_time(data.get('cookingTime'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        snapshot = await catalog_snapshot()
+        dishes = find_matching_dishes(None, dinner_category, dinner_time, cooking_time, catalog=snapshot)
+        if not dishes:
+            return jsonify({'error': 'No dishes found matching the criteria'}), 404
+        return jsonify(dishes), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+async def create_menu_variants(data):
+    combinations = data.get('combinations') or [data]
+    variants = data.get('variants', 1)
+    seed = data.get('seed')
+    if seed is None:
+        seed = random.randrange(2 ** 31)
+
+    # bool is a subclass of int
+    if not isinstance(variants, int) or isinstance(variants, bool) or not 1 <= variants <= MAX_MENU_VARIANTS:
+        return jsonify({'error': f'variants must be between 1 and {MAX_MENU_VARIANTS}'}), 400
+    if not isinstance(combinations, list) or not all(isinstance(c, dict) for c in combinations):
+        return jsonify({'error': 'combinations must be a list of objects'}), 400
+    if len(combinations) > MAX_MENU_COMBINATIONS:
+        return jsonify({'error': f'At most {MAX_MENU_COMBINATIONS} combinations are allowed'}), 400
+
+    try:
+        keys = [(c.get('dinnerCategory'), c.get('dinnerTime'), menu_cooking_time(c.get('cookingTime'))) for c in combinations]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        results = find_menu_variants(None, keys, variants, seed, await catalog_snapshot())
+        menus = [
+            {'dinnerCategory': dinner_category, 'dinnerTime': dinner_time, 'cookingTime': cooking_time, 'variants': variant_menus}
+            for (dinner_category, dinner_time, cooking_time), variant_menus in zip(keys, results)
+        ]
+        if not any(menu['variants'] for menu in menus):
+            return jsonify({'error': 'No dishes found matching the criteria'}), 404
+        return jsonify({'seed': seed, 'menus': menus}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/aggregateIngredients', methods=['POST'])
+async def get_aggregated_ingredients():
+    data = await request.get_json()
+    dish_ids = data.get('recipes', [])
+
+    if not dish_ids:
+        return jsonify({'error': 'No dish IDs provided'}), 400
+
+    try:
+        rows = await async_db.fetch_all(AGGREGATE_QUERY, (dish_ids,))
+        return jsonify(group_ingredients(rows)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/recipeDetails', methods=['POST'])
+async def get_recipe_details():
+    data = await request.get_json()
+    dish_id = data.get('recipeId')
+
+    if not dish_id:
+        return jsonify({'error': 'No recipe ID provided'}), 400
+
+    async def load():
+        recipes = await fetch_recipe_details([dish_id])
+        return recipes[0] if recipes else None
+
+    try:
+        # Same versioned key as main.get_recipe_details
+        row = await recipe_etag(int(dish_id))
+        if row is None:
+            return jsonify({"error": "Recipe not found"}), 404
+        recipe = await cache.get_or_load_async(f'recipe_details:{int(dish_id)}:{make_etag(*row)}', load)
+        if recipe is None:
+            return jsonify({"error": "Recipe not found"}), 404
+        return jsonify(recipe), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/recipeDetails/batch', methods=['POST'])
+async def get_recipe_details_batch():
+    data = await request.get_json()
+    dish_ids = data.get('recipeIds', [])
+    fields = data.get('fields', DETAIL_FIELDS)
+
+    if not dish_ids:
+        return jsonify({'error': 'No recipe IDs provided'}), 400
+    if not isinstance(dish_ids, list) or not all(is_count(dish_id) for dish_id in dish_ids):
+        return jsonify({'error': 'recipeIds must be a list of recipe IDs'}), 400
+    if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+        return jsonify({'error': 'fields must be a list of field names'}), 400
+    if len(dish_ids) > MAX_BATCH_RECIPES:
+        return jsonify({'error': f'At most {MAX_BATCH_RECIPES} recipes can be requested at once'}), 400
+    unknown_fields = set(fields) - set(DETAIL_FIELDS)
+    if unknown_fields:
+        return jsonify({'error': 'Unknown fields: ' + ', '.join(sorted(unknown_fields))}), 400
+
+    try:
+        recipes = await fetch_recipe_details(dish_ids, fields)
+        return jsonify(recipes), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/asyncPoolStats', methods=['GET'])
+async def get_async_pool_stats():
+    return jsonify(async_db.pool_stats())
+
+
+wsgi_application = WsgiToAsgi(flask_app)
+_routes = app.url_map.bind('localhost')
+
+def serves(scope):
+    if scope['type'] == 'lifespan':
+        return True
+    if scope['type'] != 'http' or scope['method'] == 'OPTIONS':
+        return False
+    try:
+        _routes.match(scope['path'], scope['method'])
+        return True
+    except HTTPException:
+        return False
+
+async def application(scope, receive, send):
+    """Routes defined above go to the Quart app, everything else to main.app"""
+    if serves(scope):
+        await app(scope, receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
@@ -0,0 +1,47 @@
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from db import connect_kwargs, db_setting
+
+_pool = None
+
+def create_pool() -> AsyncConnectionPool:
+    """asyncio counterpart of db.get_pool(), sized by the same DB_POOL_* settings"""
+    settings = connect_kwargs()
+    settings.pop("connection_factory", None)
+    return AsyncConnectionPool(
+        make_conninfo(**settings),
+        min_size=int(db_setting("DB_POOL_MIN", 1)),
+        max_size=int(db_setting("DB_POOL_MAX", 10)),
+        timeout=float(db_setting("DB_POOL_TIMEOUT", 30)),
+        max_idle=float(db_setting("DB_POOL_MAX_IDLE", 60)),
+        max_lifetime=float(db_setting("DB_POOL_MAX_LIFETIME", 1800)),
+        kwargs={"autocommit": True, "row_factory": dict_row},
+        open=False,
+    )
+
+async def open_pool():
+    global _pool
+    _pool = create_pool()
+    await _pool.open()
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+# Every call checks out its own connection, so independent queries can run
+# concurrently with asyncio.gather
+async def fetch_all(query, params=None):
+    async with _pool.connection() as conn:
+        cursor = await conn.execute(query, params)
+        return await cursor.fetchall()
+
+async def fetch_one(query, params=None):
+    async with _pool.connection() as conn:
+        cursor = await conn.execute(query, params)
+        return await cursor.fetchone()
+
+def pool_stats():
+    return _pool.get_stats() if _pool is not None else {}
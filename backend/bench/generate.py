@@ -0,0 +1,195 @@
+"""Scale the database up with synthetic users, recipes and menus for benchmarks.
+
+    python -m bench.generate --dishes 100000 --users 20000 --menus 50000 --seed 1
+
+Dish attributes, ingredient lists and steps are resampled from the recipes already
+in the database (load db_filled.sql and run `flask migrate` first), so the menu
+matcher, ingredient aggregation and history endpoints see the same value
+distributions as with the real data. The same seed on the same starting data
+produces the same rows. Point FLASK_DB_NAME at a dedicated database: generated
+rows are ordinary rows and are not cleaned up.
+"""
+import os
+import random
+import time
+import click
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2.extras import RealDictCursor, execute_values
+from db import connect_kwargs
+from models.recipe_transfer import load_batch
+
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
+
+ATTRIBUTES = ('type', 'side_dish', 'category', 'cuisine', 'season', 'cooking_time', 'dinner_time')
+MODERATED_SHARE = 0.9
+BENCH_PASSWORD = 'bench'
+
+
+def load_templates(cursor):
+    cursor.execute('''
+        SELECT d.id, d.title, d.description, d.image_url, d.type, d.side_dish, d.category, d.cuisine, d.season,
+               d.cooking_time, d.dinner_time,
+               COALESCE((
+                   SELECT json_agg(json_build_object(
+                       'name', i.name, 'measurement', i.measurement, 'amount', i.amount,
+                       'category', i.category, 'is_main', i.is_main
+                   ) ORDER BY i.index)
+                   FROM ingredients i WHERE i.dish_id = d.id
+               ), '[]') AS ingredients,
+               COALESCE((
+                   SELECT json_agg(s.description ORDER BY s.index) FROM steps s WHERE s.dish_id = d.id
+               ), '[]') AS steps
+        FROM dishes d
+        WHERE d.is_moderated = TRUE AND d.title NOT LIKE '% (bench %)'
+        ORDER BY d.id
+    ''')
+    return cursor.fetchall()
+
+def jitter_amount(rng, amount, measurement):
+    if amount is None or not measurement:
+        return amount
+    # Keep amounts on quarter units so aggregation formats them like real recipes
+    return max(0.25, round(amount * rng.uniform(0.5, 2.0) * 4) / 4)
+
+def synthetic_recipe(rng, templates, ingredient_pool, number, seed, author_ids):
+    template = rng.choice(templates)
+    # Each attribute comes from an independently drawn template: the marginal
+    # distributions stay those of the real data while combinations vary
+    dish = {attribute: rng.choice(templates)[attribute] for attribute in ATTRIBUTES}
+    dish.update({
+        'title': f"{template['title']} (bench {seed}-{number})",
+        'description': template['description'],
+        'image_url': template['image_url'],
+        'author_id': rng.choice(author_ids),
+        'is_moderated': rng.random() < MODERATED_SHARE,
+    })
+
+    ingredients = [dict(ingredient) for ingredient in template['ingredients']]
+    if len(ingredients) > 3 and rng.random() < 0.1:
+        ingredients.pop(rng.randrange(len(ingredients)))
+    if rng.random() < 0.1:
+        ingredients.append(dict(rng.choice(ingredient_pool)))
+    for index, ingredient in enumerate(ingredients, start=1):
+        ingredient['index'] = index
+        ingredient['measurement'] = ingredient['measurement'] or ''
+        ingredient['amount'] = jitter_amount(rng, ingredient['amount'], ingredient['measurement'])
+        ingredient['is_main'] = bool(ingredient['is_main'])
+
+    steps = [{'index': index, 'description': step} for index, step in enumerate(template['steps'], start=1)]
+    return dish, ingredients, steps
+
+def create_users(cursor, count):
+    # Every 100th user is a moderator and every 20th an author, as in the seed data's role mix
+    cursor.execute('''
+        INSERT INTO users (username, password, email, role)
+        SELECT 'bench_user_' || n, %s, 'bench_user_' || n || '@example.com',
+               CASE WHEN n %% 100 = 0 THEN 'moderator' WHEN n %% 20 = 0 THEN 'author' ELSE 'user' END
+        FROM generate_series(1, %s) AS n
+        ON CONFLICT (username) DO NOTHING
+    ''', (BENCH_PASSWORD, count))
+
+def user_ids(cursor, role=None):
+    """Ids of the users with `role`, or of all users"""
+    if role is None:
+        cursor.execute("SELECT id FROM users ORDER BY id")
+    else:
+        cursor.execute("SELECT id FROM users WHERE role = %s ORDER BY id", (role,))
+    return [row['id'] for row in cursor.fetchall()]
+
+def create_dishes(db, cursor, rng, count, seed, batch_size):
+    templates = load_templates(cursor)
+    if not templates:
+        raise click.ClickException("No moderated recipes to sample from; load db_filled.sql first")
+    ingredient_pool = [ingredient for template in templates for ingredient in template['ingredients']]
+    author_ids = user_ids(cursor, 'author') or user_ids(cursor, 'admin') or user_ids(cursor)
+
+    db.autocommit = False
+    try:
+        for start in range(0, count, batch_size):
+            batch = [synthetic_recipe(rng, templates, ingredient_pool, number, seed, author_ids)
+                     for number in range(start, min(start + batch_size, count))]
+            load_batch(cursor, batch)
+            db.commit()
+            click.echo(f"dishes: {start + len(batch)}/{count}")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.autocommit = True
+
+    moderator_ids = user_ids(cursor, 'moderator') or user_ids(cursor, 'admin') or user_ids(cursor)
+    pattern = f"% (bench {seed}-%)"
+    # Spread creation dates over two years so the history filters have something to select
+    cursor.execute('''
+        UPDATE dishes
+        SET created = created - ((id * 7919) %% 730) * INTERVAL '1 day',
+            edited = created - ((id * 7919) %% 730) * INTERVAL '1 day'
+        WHERE title LIKE %s
+    ''', (pattern,))
+    cursor.execute('''
+        INSERT INTO moderation (dish_id, moderator_id, published)
+        SELECT d.id, (%s::int[])[1 + d.id %% %s], d.created + ((d.id %% 14) + 1) * INTERVAL '1 day'
+        FROM dishes d
+        WHERE d.is_moderated AND d.title LIKE %s
+        AND NOT EXISTS (SELECT 1 FROM moderation m WHERE m.dish_id = d.id)
+    ''', (moderator_ids, len(moderator_ids), pattern))
+
+def create_menus(cursor, rng, count, batch_size):
+    cursor.execute('''
+        SELECT id, type FROM dishes WHERE is_moderated = TRUE AND type IS NOT NULL ORDER BY id
+    ''')
+    dishes = cursor.fetchall()
+    if not dishes:
+        raise click.ClickException("No moderated dishes to build menus from")
+    # Menus belong to regular users; fall back to anyone when there are none
+    owners = user_ids(cursor, 'user') or user_ids(cursor)
+    if not owners:
+        raise click.ClickException("No users to own the menus; create some with --users")
+    categories = ('weeknight', 'family', 'guest', 'festive', 'romantic')
+    times = ('now', 'today', 'tomorrow', 'later')
+
+    for start in range(0, count, batch_size):
+        menus = []
+        for _ in range(min(batch_size, count - start)):
+            dish_ids = [dish['id'] for dish in rng.sample(dishes, min(len(dishes), rng.randint(3, 8)))]
+            menus.append((rng.choice(owners), f"Bench menu {start + len(menus)}", ', '.join(map(str, dish_ids)),
+                          rng.choice(categories), rng.choice(times), rng.randint(1, 4),
+                          None if rng.random() < 0.85 else 'now', dish_ids))
+        rows = execute_values(cursor, '''
+            INSERT INTO menus (user_id, title, dishes, dinner_category, dinner_time, cooking_time, removed)
+            VALUES %s RETURNING id
+        ''', [menu[:7] for menu in menus],
+            template="(%s, %s, %s, %s, %s, %s, %s::timestamp)", fetch=True)
+        execute_values(cursor, '''
+            INSERT INTO menu_dishes (menu_id, dish_id, position) VALUES %s
+        ''', [(row['id'], dish_id, position)
+              for row, menu in zip(rows, menus) for position, dish_id in enumerate(menu[7], start=1)])
+        click.echo(f"menus: {start + len(menus)}/{count}")
+
+
+@click.command()
+@click.option('--dishes', default=10000, help='Synthetic dishes to add')
+@click.option('--users', default=2000, help='Users bench_user_1..N (password "bench") to create')
+@click.option('--menus', default=5000, help='Saved menus to add')
+@click.option('--seed', default=1, help='Random seed; also part of the generated titles')
+@click.option('--batch-size', default=1000, help='Rows per COPY batch')
+def generate(dishes, users, menus, seed, batch_size):
+    rng = random.Random(seed)
+    started = time.monotonic()
+    db = psycopg2.connect(**connect_kwargs())
+    db.autocommit = True
+    cursor = db.cursor(cursor_factory=RealDictCursor)
+    try:
+        create_users(cursor, users)
+        create_dishes(db, cursor, rng, dishes, seed, batch_size)
+        create_menus(cursor, rng, menus, batch_size)
+        cursor.execute("ANALYZE")
+    finally:
+        cursor.close()
+        db.close()
+    click.echo(f"done in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    generate()
@@ -0,0 +1,242 @@
+"""Drive a running backend with a mix of requests and report throughput and latency percentiles.
+
+    python -m bench.load --url http://localhost:5000 --concurrency 16 --duration 60 --json results.json
+
+Logs in as the users created by bench.generate (bench_user_N / bench), then
+every worker thread keeps one HTTP connection open and picks scenarios at
+random with the weights from --mix. Results are printed per scenario; --json
+also writes them together with the current git commit so runs can be compared.
+With --server-pid (Linux only) the peak resident memory of that process and its
+children is sampled during the run, to compare entry points at equal memory:
+
+    gunicorn -w 4 main:app                  # WSGI, one connection per worker thread
+    uvicorn asgi:application --workers 1    # asyncio, see asgi.py
+"""
+import http.client
+import json
+import math
+import random
+import subprocess
+import threading
+import time
+from urllib.parse import urlsplit
+import click
+
+SCENARIOS = ('createMenu', 'aggregateIngredients', 'savedMenus', 'recipesHistory', 'login', 'images')
+DEFAULT_MIX = 'createMenu=4,aggregateIngredients=2,savedMenus=2,recipesHistory=1,login=1,images=2'
+DINNER_CATEGORIES = ('weeknight', 'family', 'guest', 'festive', 'romantic')
+DINNER_TIMES = ('now', 'today', 'tomorrow', 'later')
+
+
+class Client:
+    """One keep-alive connection; reconnects after errors"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.host = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.connection = None
+
+    def request(self, method, path, body=None, token=None, headers=None):
+        headers = dict(headers or {})
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        if self.connection is None:
+            self.connection = self.connection_class(self.host, timeout=60)
+        try:
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+            return response.status, data
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            raise
+
+    def json(self, method, path, body=None, token=None):
+        status, data = self.request(method, path, body, token)
+        if status != 200:
+            raise click.ClickException(f"{method} {path} returned {status}: {data[:200]!r}")
+        return json.loads(data)
+
+
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        if name not in SCENARIOS:
+            raise click.BadParameter(f"unknown scenario {name!r}, expected one of {', '.join(SCENARIOS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def setup(url, users, dish_sample):
+    """Tokens of the benchmark users plus dish ids and image names to request"""
+    client = Client(url)
+    accounts = []
+    for n in range(1, users + 1):
+        username = f'bench_user_{n}'
+        token = client.json('POST', '/login', {'username': username, 'password': 'bench'}).get('access_token')
+        if token is None:
+            raise click.ClickException(f"cannot log in as {username}; run python -m bench.generate first")
+        accounts.append((username, token))
+
+    page = client.json('GET', f'/recipesHistory?limit={dish_sample}&moderated=true', token=accounts[0][1])
+    dish_ids = [recipe['id'] for recipe in page['recipes']]
+    details = client.json('POST', '/recipeDetails/batch', {'recipeIds': dish_ids[:100], 'fields': ['image_url']})
+    # image_url is the path the frontend requests, /images/<file>
+    images = sorted({recipe['image_url'].removeprefix('/images/') for recipe in details if recipe.get('image_url')})
+    return accounts, dish_ids, images
+
+def run_scenario(name, client, rng, accounts, dish_ids, images):
+    username, token = rng.choice(accounts)
+    if name == 'createMenu':
+        return client.request('POST', '/createMenu', {
+            'dinnerCategory': rng.choice(DINNER_CATEGORIES),
+            'dinnerTime': rng.choice(DINNER_TIMES),
+            'cookingTime': rng.randint(1, 4),
+        })
+    if name == 'aggregateIngredients':
+        return client.request('POST', '/aggregateIngredients', {'recipes': rng.sample(dish_ids, min(len(dish_ids), rng.randint(3, 8)))})
+    if name == 'savedMenus':
+        return client.request('GET', '/savedMenus', token=token)
+    if name == 'recipesHistory':
+        return client.request('GET', f'/recipesHistory?limit=50&after_id={rng.choice(dish_ids)}', token=token)
+    if name == 'login':
+        return client.request('POST', '/login', {'username': username, 'password': 'bench'})
+    return client.request('GET', f'/images/{rng.choice(images)}?w=400', headers={'Accept': 'image/webp,*/*'})
+
+def worker(number, url, seed, weights, deadline, warmup_until, context, results, lock):
+    rng = random.Random(seed * 1000 + number)
+    client = Client(url)
+    names = list(weights)
+    scenario_weights = [weights[name] for name in names]
+    samples = []
+    while time.monotonic() < deadline:
+        name = rng.choices(names, scenario_weights)[0]
+        if name == 'images' and not context[2]:
+            continue
+        start = time.perf_counter()
+        try:
+            status, _ = run_scenario(name, client, rng, *context)
+        except (OSError, http.client.HTTPException):
+            status = 0
+        elapsed = time.perf_counter() - start
+        if time.monotonic() >= warmup_until:
+            samples.append((name, elapsed, status))
+    with lock:
+        results.extend(samples)
+
+def summarize(results, duration):
+    by_scenario = {}
+    for name, elapsed, status in results:
+        by_scenario.setdefault(name, []).append((elapsed, status))
+    by_scenario['all'] = [(elapsed, status) for _, elapsed, status in results]
+
+    summary = {}
+    for name, samples in by_scenario.items():
+        latencies = sorted(elapsed for elapsed, _ in samples)
+        errors = sum(1 for _, status in samples if not 200 <= status < 400)
+        summary[name] = {
+            'requests': len(samples),
+            'errors': errors,
+            'rps': round(len(samples) / duration, 2) if duration else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        }
+    return summary
+
+def process_tree_rss(pid):
+    """Resident memory in bytes of `pid` and all its descendants, from /proc"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status', encoding='ascii') as file:
+                for line in file:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+            with open(f'/proc/{current}/task/{current}/children', encoding='ascii') as file:
+                pending.extend(int(child) for child in file.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option('--url', default='http://localhost:5000', help='Base URL of the running backend')
+@click.option('--concurrency', default=8, help='Worker threads, each with its own connection')
+@click.option('--duration', default=30.0, help='Seconds to measure, after the warm-up')
+@click.option('--warmup', default=5.0, help='Seconds of load before measuring starts')
+@click.option('--mix', default=DEFAULT_MIX, help='Scenario weights, e.g. createMenu=4,login=1')
+@click.option('--users', default=20, help='bench_user_1..N accounts to log in as')
+@click.option('--dish-sample', default=500, help='Moderated dishes to draw recipe ids from')
+@click.option('--seed', default=1, help='Seed of the request sequence')
+@click.option('--json', 'json_path', default=None, help='Also write the results to this file')
+@click.option('--server-pid', default=None, type=int, help='Sample the peak RSS of this server process and its children')
+def load(url, concurrency, duration, warmup, mix, users, dish_sample, seed, json_path, server_pid):
+    weights = parse_mix(mix)
+    context = setup(url, users, dish_sample)
+
+    results = []
+    lock = threading.Lock()
+    warmup_until = time.monotonic() + warmup
+    deadline = warmup_until + duration
+    threads = [threading.Thread(target=worker, args=(number, url, seed, weights, deadline, warmup_until, context, results, lock))
+               for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    peak_rss = None
+    if server_pid is not None:
+        peak_rss = 0
+        while any(thread.is_alive() for thread in threads):
+            peak_rss = max(peak_rss, process_tree_rss(server_pid))
+            time.sleep(0.5)
+    for thread in threads:
+        thread.join()
+
+    summary = summarize(results, duration)
+    click.echo(f"{'scenario':<22}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name in [name for name in SCENARIOS if name in summary] + ['all']:
+        row = summary.get(name)
+        if row:
+            click.echo(f"{name:<22}{row['requests']:>10}{row['errors']:>8}{row['rps']:>10}"
+                       f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}")
+    if peak_rss is not None:
+        click.echo(f"server peak RSS: {peak_rss / 2 ** 20:.1f} MiB")
+
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as file:
+            json.dump({
+                'commit': git_commit(),
+                'url': url,
+                'concurrency': concurrency,
+                'duration': duration,
+                'mix': weights,
+                'seed': seed,
+                'server_peak_rss': peak_rss,
+                'results': summary,
+            }, file, indent=2)
+
+
+if __name__ == '__main__':
+    load()
@@ -0,0 +1,156 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCache:
+    """In-process LRU cache with a per-entry TTL.
+
+    Every worker process has its own copy, so an invalidation only reaches the
+    process that handled the write; the other workers serve the old value until
+    it expires. Use SharedCache when that window matters.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedCache:
+    """Cache kept in a Redis-compatible server and shared by all workers.
+
+    `client` only needs get, set(ex=...), delete and scan_iter, so tests can pass
+    any in-memory stand-in with that interface.
+    """
+
+    def __init__(self, client, ttl=300.0, prefix='tastyspace:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        data = self.client.get(self.prefix + key)
+        return None if data is None else pickle.loads(data)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=max(1, int(self.ttl if ttl is None else ttl)))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class ResponseCache:
+    """Read-through cache in front of a LocalCache or SharedCache backend.
+
+    Keys look like `<namespace>:<id>` or just `<namespace>`; hits and misses are
+    counted per namespace. Data that other workers can change is keyed by its
+    version as well (`recipe:12:<version>`, `new_recipes:<versions>`), so an
+    invalidation that only reaches one worker's LocalCache is never needed.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else LocalCache()
+        self._lock = threading.Lock()
+        self._hits = {}
+        self._misses = {}
+
+    def _count(self, counter, key):
+        namespace = key.split(':', 1)[0]
+        with self._lock:
+            counter[namespace] = counter.get(namespace, 0) + 1
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Return the cached value for `key`, or call `loader()` and cache its result.
+
+        None is never cached, so a missing recipe is looked up again next time.
+        """
+        value = self.backend.get(key)
+        if value is not None:
+            self._count(self._hits, key)
+            return value
+        self._count(self._misses, key)
+        value = loader()
+        if value is not None:
+            self.backend.set(key, value, ttl)
+        return value
+
+    async def get_or_load_async(self, key, loader, ttl=None):
+        """get_or_load for a coroutine function `loader` (the asyncio entry point)"""
+        value = self.backend.get(key)
+        if value is not None:
+            self._count(self._hits, key)
+            return value
+        self._count(self._misses, key)
+        value = await loader()
+        if value is not None:
+            self.backend.set(key, value, ttl)
+        return value
+
+    def invalidate(self, *keys):
+        self.backend.delete(*keys)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            hits = dict(self._hits)
+            misses = dict(self._misses)
+        namespaces = sorted(set(hits) | set(misses))
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': sum(hits.values()),
+            'misses': sum(misses.values()),
+            'namespaces': {name: {'hits': hits.get(name, 0), 'misses': misses.get(name, 0)} for name in namespaces},
+        }
+
+
+def create_cache(config):
+    """Build the app's cache from CACHE_URL (shared, needs the redis package), CACHE_SIZE and CACHE_TTL"""
+    ttl = float(config.get('CACHE_TTL', 300))
+    url = config.get('CACHE_URL')
+    if url:
+        import redis
+        return ResponseCache(SharedCache(redis.Redis.from_url(url), ttl=ttl))
+    return ResponseCache(LocalCache(maxsize=int(config.get('CACHE_SIZE', 1024)), ttl=ttl))
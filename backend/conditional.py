@@ -0,0 +1,47 @@
+import hashlib
+import json
+from functools import wraps
+from flask import current_app, make_response, request
+from db import get_db
+
+def make_etag(*parts):
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+
+def table_versions(db, *tables):
+    """Current change counters of `tables` (see migrations/010_table_version_sequences.sql)"""
+    cursor = db.cursor()
+    cursor.execute('''
+        SELECT substr(sequencename, length('table_version_') + 1) AS name, COALESCE(last_value, 0) AS version
+        FROM pg_sequences
+        WHERE schemaname = current_schema() AND sequencename = ANY(%s)
+        ORDER BY name
+    ''', (['table_version_' + table for table in tables],))
+    return cursor.fetchall()
+
+def etag_from(version):
+    """Answer GET requests with a weak ETag computed by `version(db, **view_args)`.
+
+    `version` must be cheap (row timestamps, table_versions counters): when the
+    client's If-None-Match matches, the view is not called at all and a bodiless
+    304 is returned. The request path and query string are always part of the tag.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+
+            etag = make_etag(request.full_path, version(get_db(), **kwargs))
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            # Responses depend on the Authorization header, so only the browser may keep them
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
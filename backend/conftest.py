@@ -0,0 +1,107 @@
+"""pytest fixtures for tests/ (run from backend/: python -m pytest -q).
+
+Tests that only exercise request validation run anywhere. The others talk to
+a real PostgreSQL database, named by FLASK_TEST_DB_NAME and reached with the
+other FLASK_DB_* settings. Load db_filled.sql into it first; pending
+migrations are applied once per run. Without FLASK_TEST_DB_NAME, or when the
+server cannot be reached, those tests are skipped.
+"""
+import os
+import uuid
+import psycopg2
+import pytest
+from flask_jwt_extended import create_access_token
+
+TEST_DB_NAME = os.getenv('FLASK_TEST_DB_NAME')
+if TEST_DB_NAME:
+    # Before any app is built, so wsgi.py (and with it asgi.py) uses it too
+    os.environ['FLASK_DB_NAME'] = TEST_DB_NAME
+
+from db import connect_kwargs, get_pool, migrate
+from main import create_app
+
+
+@pytest.fixture(scope='session')
+def app():
+    return create_app({'TESTING': True, 'SECRET_KEY': 'test', 'JWT_SECRET_KEY': 'test'})
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture(scope='session')
+def database(app):
+    if not TEST_DB_NAME:
+        pytest.skip('FLASK_TEST_DB_NAME is not set')
+    with app.app_context():
+        try:
+            psycopg2.connect(**connect_kwargs()).close()
+        except psycopg2.OperationalError as e:
+            pytest.skip(f'test database unavailable: {e}')
+        migrate()
+    yield
+    with app.app_context():
+        get_pool().closeall()
+
+@pytest.fixture
+def db(app, database):
+    with app.app_context():
+        conn = psycopg2.connect(**connect_kwargs())
+    conn.autocommit = True
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def user(app, db):
+    """A throwaway user with the `user` role; yields (id, Authorization headers)"""
+    cursor = db.cursor()
+    cursor.execute("INSERT INTO users (username, password, role) VALUES (%s, 'test', 'user') RETURNING id",
+                   (f'test_{uuid.uuid4().hex[:12]}',))
+    user_id = cursor.fetchone()[0]
+    with app.app_context():
+        token = create_access_token(identity=str(user_id))
+    yield user_id, {'Authorization': f'Bearer {token}'}
+    cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+
+@pytest.fixture
+def dishes(db, user):
+    """Five unmoderated dishes of `user`, each with two steps and one ingredient (is_main left NULL)"""
+    user_id, _ = user
+    cursor = db.cursor()
+    ids = []
+    for n in range(5):
+        cursor.execute('''
+            INSERT INTO dishes (title, description, author_id, type) VALUES (%s, 'Test dish', %s, 'main')
+            RETURNING id
+        ''', (f'Test dish {n} {uuid.uuid4().hex[:12]}', user_id))
+        dish_id = cursor.fetchone()[0]
+        cursor.execute("INSERT INTO steps (dish_id, index, description) VALUES (%s, 1, 'Cook'), (%s, 2, 'Serve')",
+                       (dish_id, dish_id))
+        cursor.execute("INSERT INTO ingredients (dish_id, index, name, amount, measurement) VALUES (%s, 1, 'salt', 1, 'g')",
+                       (dish_id,))
+        ids.append(dish_id)
+    yield ids
+    cursor.execute("DELETE FROM ingredients WHERE dish_id = ANY(%s)", (ids,))
+    cursor.execute("DELETE FROM steps WHERE dish_id = ANY(%s)", (ids,))
+    cursor.execute("DELETE FROM dishes WHERE id = ANY(%s)", (ids,))
+
+@pytest.fixture
+def menus(db, user, dishes):
+    """Three menus of `user` with three of `dishes` each"""
+    user_id, _ = user
+    cursor = db.cursor()
+    ids = []
+    for n in range(3):
+        menu_dishes = dishes[n:n + 3]
+        cursor.execute('''
+            INSERT INTO menus (user_id, title, dishes, dinner_category, dinner_time, cooking_time)
+            VALUES (%s, %s, %s, 'family', 'today', '2') RETURNING id
+        ''', (user_id, f'Test menu {n}', ', '.join(map(str, menu_dishes))))
+        menu_id = cursor.fetchone()[0]
+        for position, dish_id in enumerate(menu_dishes, start=1):
+            cursor.execute("INSERT INTO menu_dishes (menu_id, dish_id, position) VALUES (%s, %s, %s)",
+                           (menu_id, dish_id, position))
+        ids.append(menu_id)
+    yield ids
+    cursor.execute("DELETE FROM menu_dishes WHERE menu_id = ANY(%s)", (ids,))
+    cursor.execute("DELETE FROM menus WHERE id = ANY(%s)", (ids,))
@@ -1,50 +1,126 @@
+from contextlib import contextmanager
 from pathlib import Path
+import os
+import threading
+import time
 import psycopg2
-from flask import g
-from flask import Flask 
+from flask import g, current_app, has_app_context
+from db_pool import ConnectionPool
+from metrics import InstrumentedConnection
 
-app = Flask(__name__) 
+_pool = None
+_pool_lock = threading.Lock()
 
-# Connect to the database
+def db_setting(name, default):
+    if has_app_context() and name in current_app.config:
+        return current_app.config[name]
+    return os.getenv(f"FLASK_{name}", default)
+
+def connect_kwargs() -> dict:
+    return {
+        "dbname": db_setting("DB_NAME", "postgres"),
+        "user": db_setting("DB_USER", "postgres"),
+        "password": db_setting("DB_PASSWORD", "postgres"),
+        "host": db_setting("DB_HOST", "localhost"),
+        "port": db_setting("DB_PORT", "5432"),
+        "connection_factory": InstrumentedConnection,
+    }
+
+# One pool per process: a pool inherited through fork() shares sockets with
+# the parent, so a worker that sees a foreign pid builds its own.
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = ConnectionPool(
+                    connect_kwargs(),
+                    minconn=int(db_setting("DB_POOL_MIN", 1)),
+                    maxconn=int(db_setting("DB_POOL_MAX", 10)),
+                    timeout=float(db_setting("DB_POOL_TIMEOUT", 30)),
+                    max_idle=float(db_setting("DB_POOL_MAX_IDLE", 60)),
+                    max_lifetime=float(db_setting("DB_POOL_MAX_LIFETIME", 1800)),
+                )
+    return _pool
+
+# Check a connection out of the pool for the current request
 def get_db() -> psycopg2.extensions.connection:
     if "db" not in g:
-        g.db = psycopg2.connect(
-            dbname="postgres",
-            user="postgres",
-            password="postgres",
-            host="localhost",
-            port="5432"
-        )
-        g.db.autocommit = True
+        g.db_pool = get_pool()
+        start = time.perf_counter()
+        g.db = g.db_pool.getconn()
+        g.db_wait = time.perf_counter() - start
     return g.db
 
-# Close the connection to the database
-def close_db():
-    """Close the connection to the SQLite database"""
+# Return the connection to the pool, registered as an app teardown handler
+def close_db(e=None):
+    """Return the request's connection to the pool, rolling back any open transaction"""
     db = g.pop("db", None)
-    if db is not None:
-        db.close()
+    pool = g.pop("db_pool", None)
+    if db is not None and pool is not None:
+        pool.putconn(db)
+
+# Pooled connections run in autocommit mode; statements that must succeed or fail
+# together go through this block
+@contextmanager
+def transaction(db):
+    db.autocommit = False
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.autocommit = True
 
 def init_db() -> None:
     SCHEMA_PATH = Path("schema.sql")
-    
-    db = psycopg2.connect(
-            dbname="postgres",
-            user="postgres",
-            password="postgres",
-            host="localhost",
-            port="5432"
-        )
+
+    db = psycopg2.connect(**connect_kwargs())
     db.autocommit = True
     cursor = db.cursor()
-    
+
     schema = SCHEMA_PATH.read_text()
     cursor.execute(schema)
-    
+
     db.commit()
     cursor.close()
     db.close()
 
-if __name__ == "__main__": 
-    with app.app_context():
-        init_db()
\ No newline at end of file
+MIGRATIONS_DIR = Path(__file__).with_name("migrations")
+
+def migrate() -> list:
+    """Apply the SQL files in migrations/ that have not been applied yet, each in its own transaction"""
+    db = psycopg2.connect(**connect_kwargs())
+    cursor = db.cursor()
+    applied = []
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name TEXT PRIMARY KEY,
+                applied TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        db.commit()
+        cursor.execute("SELECT name FROM schema_migrations")
+        done = {row[0] for row in cursor.fetchall()}
+
+        for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+            if path.name in done:
+                continue
+            cursor.execute(path.read_text())
+            cursor.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (path.name,))
+            db.commit()
+            applied.append(path.name)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+        db.close()
+    return applied
+
+if __name__ == "__main__":
+    # Outside an app context the FLASK_DB_* environment variables apply
+    init_db()
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections.
+
+    Callers block (up to `timeout` seconds) when all `maxconn` connections are
+    checked out. Idle connections are pinged before reuse and recycled once they
+    exceed `max_lifetime`, so a restarted Postgres or a dropped socket does not
+    surface as an error in a request handler.
+    """
+
+    def __init__(self, connect_kwargs, minconn=1, maxconn=10, timeout=30.0, max_idle=60.0, max_lifetime=1800.0):
+        self.connect_kwargs = connect_kwargs
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._born = {}
+        self._size = 0
+
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._recycled = 0
+
+        for _ in range(minconn):
+            with self._cond:
+                self._size += 1
+            conn = self._connect()
+            self._idle.append((conn, time.monotonic()))
+
+    def _connect(self):
+        try:
+            conn = psycopg2.connect(**self.connect_kwargs)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        conn.autocommit = True
+        self._born[conn] = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        self._born.pop(conn, None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, conn, last_used):
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if now - self._born.get(conn, now) > self.max_lifetime:
+            return False
+        if now - last_used > self.max_idle:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            except Exception:
+                return False
+        return True
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                    waited = True
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    conn, last_used = None, None
+                    self._size += 1
+
+            if conn is None:
+                conn = self._connect()
+            elif not self._is_usable(conn, last_used):
+                self._discard(conn)
+                with self._cond:
+                    self._recycled += 1
+                    self._size -= 1
+                continue
+
+            with self._cond:
+                self._checkouts += 1
+                if waited:
+                    self._waits += 1
+                    self._wait_time += time.monotonic() - start
+            return conn
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                conn.autocommit = True
+            except Exception:
+                discard = True
+
+        if discard or conn.closed:
+            self._discard(conn)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+                self._size -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                "max": self.maxconn,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time": round(self._wait_time, 6),
+                "timeouts": self._timeouts,
+                "recycled": self._recycled,
+            }
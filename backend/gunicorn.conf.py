@@ -0,0 +1,31 @@
+"""gunicorn settings: gunicorn -c gunicorn.conf.py
+
+Overridable per deployment with WEB_CONCURRENCY (worker processes) and
+GUNICORN_THREADS (threads per worker, each holding at most one pooled
+connection, so keep it at or below FLASK_DB_POOL_MAX).
+"""
+import multiprocessing
+import os
+import time
+
+wsgi_app = 'wsgi:app'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+# The app is imported once in the master and shared copy-on-write; everything
+# holding sockets or threads (pool, image executor) is created per worker
+preload_app = True
+timeout = 30
+graceful_timeout = 30
+max_requests = 10000
+max_requests_jitter = 1000
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.monotonic()
+
+def post_worker_init(worker):
+    # Runs in the worker before it starts accepting connections
+    from warmup import warm_up
+    warm_up(worker.app.wsgi(), connections=threads, started=worker.forked_at)
@@ -0,0 +1,127 @@
+import functools
+import logging
+import mimetypes
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Response, abort, current_app, send_from_directory
+from werkzeug.security import safe_join
+from PIL import Image, ImageOps
+
+# Size buckets (max width in px) of the WebP derivatives generated for every upload
+VARIANT_WIDTHS = {
+    'card': 400,
+    'detail': 900,
+    'full': 1600,
+}
+VARIANTS_DIR = 'variants'
+WEBP_QUALITY = 80
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+
+# Uploads (and their derivatives) are named by a fresh UUID, so their bytes never change
+UUID_NAME = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.', re.IGNORECASE)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+DEFAULT_MAX_AGE = 3600
+# Originals served in place of a derivative that is still being generated
+FALLBACK_MAX_AGE = 60
+
+logger = logging.getLogger('tastyspace.images')
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def variant_name(filename, bucket):
+    stem = filename.rsplit('.', 1)[0]
+    return f"{stem}.{bucket}.webp"
+
+def generate_derivatives(upload_folder, filename, overwrite=False):
+    """Write the WebP derivatives of one uploaded image; returns the names of the files written"""
+    out_dir = os.path.join(upload_folder, VARIANTS_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    with Image.open(os.path.join(upload_folder, filename)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        for bucket, width in VARIANT_WIDTHS.items():
+            name = variant_name(filename, bucket)
+            path = os.path.join(out_dir, name)
+            if not overwrite and os.path.exists(path):
+                continue
+            variant = image.copy()
+            variant.thumbnail((width, width * 10), Image.LANCZOS)
+            # Write under a temporary name so a request never sees a half-written file
+            tmp_path = f"{path}.tmp"
+            variant.save(tmp_path, 'WEBP', quality=WEBP_QUALITY, method=4)
+            os.replace(tmp_path, path)
+            written.append(name)
+    return written
+
+def get_executor(workers=2):
+    # Executor threads do not survive fork(), so every worker process starts its own
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-derivatives')
+                _executor_pid = os.getpid()
+    return _executor
+
+def log_failure(filename, future):
+    error = future.exception()
+    if error is not None:
+        logger.error("generating derivatives of %s failed", filename, exc_info=error)
+
+def schedule_derivatives(upload_folder, filename, workers=2):
+    future = get_executor(workers).submit(generate_derivatives, upload_folder, filename)
+    future.add_done_callback(functools.partial(log_failure, filename))
+    return future
+
+def find_variant(upload_folder, filename, width):
+    """Smallest existing derivative at least `width` px wide (or the largest one), if any"""
+    buckets = sorted(VARIANT_WIDTHS.items(), key=lambda item: item[1])
+    candidates = [bucket for bucket, bucket_width in buckets if bucket_width >= width] or [buckets[-1][0]]
+    for bucket in candidates:
+        name = variant_name(filename, bucket)
+        if os.path.exists(os.path.join(upload_folder, VARIANTS_DIR, name)):
+            return name
+    return None
+
+def original_images(upload_folder):
+    for filename in sorted(os.listdir(upload_folder)):
+        if filename.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(upload_folder, filename)):
+            yield filename
+
+def send_image(directory, filename, subdirectory='', max_age=None):
+    """Send an image with long-lived caching for UUID names.
+
+    ETag, If-None-Match/If-Modified-Since (304) and Range requests are handled by
+    Werkzeug's conditional send_file. With IMAGES_ACCEL_REDIRECT set to an nginx
+    internal location the bytes are handed off via X-Accel-Redirect; USE_X_SENDFILE
+    does the same for X-Sendfile servers. An explicit `max_age` replaces the
+    default policy and is never marked immutable.
+    """
+    path = safe_join(directory, subdirectory, filename) if subdirectory else safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    immutable = max_age is None and UUID_NAME.match(filename) is not None
+    if max_age is None:
+        max_age = IMMUTABLE_MAX_AGE if immutable else current_app.config.get('IMAGE_CACHE_MAX_AGE', DEFAULT_MAX_AGE)
+
+    accel_prefix = current_app.config.get('IMAGES_ACCEL_REDIRECT')
+    if accel_prefix:
+        location = '/'.join(part for part in (accel_prefix.rstrip('/'), subdirectory, filename) if part)
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = location
+    else:
+        response = send_from_directory(os.path.join(directory, subdirectory), filename, max_age=max_age)
+
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.no_cache = None
+    if immutable:
+        response.cache_control.immutable = True
+    return response
@@ -1,39 +1,172 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Blueprint, Flask, Response, current_app, request, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, get_jwt, jwt_required, get_jwt_identity
-from datetime import timedelta
-from db import close_db, get_db, init_db
-from psycopg2.extras import RealDictCursor
+from datetime import date, timedelta
+from functools import wraps
+from db import close_db, get_db, get_pool, init_db, migrate, transaction
+from streaming import EXPORT_FORMATS, stream_export
+from cache import create_cache
+from conditional import etag_from, make_etag, table_versions
+from metrics import abort_request, finish_request, metrics, start_request
+from query_trace import check_repeats
+from warmup import warm_up
+from images import FALLBACK_MAX_AGE, VARIANTS_DIR, find_variant, generate_derivatives, original_images, schedule_derivatives, send_image
+from psycopg2.errors import UniqueViolation
+from psycopg2.extras import RealDictCursor, execute_values
+from werkzeug.local import LocalProxy
 from werkzeug.utils import secure_filename
 import os
 import uuid
-from models.matching_dishes import find_matching_dishes
+import re
+import click
+import random
+from models.matching_dishes import find_matching_dishes, find_menu_variants
 from models.aggregate_ingredients import aggregate_ingredients
+from models.availability import LOGIN_QUERY, titles, usernames
+from models.dish_catalog import DISH_COLUMNS, catalog as dish_catalog, split_list
+from models.moderation_queue import LeaseConflict, NotPending, check_lease, claim_recipes, pending_page, release_leases, renew_leases, take_from_queue
+from models.pantry import pantry_menu, suggest_dishes
+from models.recipe_details import DETAIL_FIELDS, fetch_recipe_details
+from models.recipe_search import InvalidCursor, decode_cursor, search_recipes
+from models.ingredient_dictionary import backfill_ingredients, resolve_ingredients, to_canonical_unit
+from models.recipe_update import InvalidRecipeUpdate, VersionConflict, recipe_version, update_recipe as apply_recipe_update
+from models.user_counters import reconcile_counters
+from models.recipe_transfer import RecipeImportError, export_csv_dir, export_jsonl, import_recipes, read_csv_dir, read_jsonl
 
 
-app = Flask(__name__)
-app.config.from_prefixed_env()
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=1)
-FRONTEND_URL = app.config.get("FRONTEND_URL", "http://localhost:5173")
-cors = CORS(app, origins=FRONTEND_URL, methods=["GET", "POST", "DELETE", "PUT"], allow_headers=["Authorization", "Content-Type"])
-jwt = JWTManager(app)
 BASE_DIR = os.path.abspath(os.path.dirname(__file__)) 
-relative_path = os.getenv('FLASK_UPLOAD_FOLDER', 'default/path') 
-app.config['UPLOAD_FOLDER'] = os.path.join(BASE_DIR, relative_path) 
+api = Blueprint('api', __name__, cli_group=None)
+# The app's ResponseCache, see create_app()
+cache = LocalProxy(lambda: current_app.extensions['response_cache'])
 
-@app.route('/images/<filename>')
+def create_app(config=None):
+    """Build the Flask app from FLASK_* environment variables, with `config` applied on top.
+
+    Nothing here touches the database; see warmup.py for what a worker loads before
+    taking traffic.
+    """
+    app = Flask(__name__)
+    app.config.from_prefixed_env()
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=1)
+    app.config.update(config or {})
+    app.config['UPLOAD_FOLDER'] = os.path.join(BASE_DIR, app.config.get('UPLOAD_FOLDER', 'default/path'))
+    CORS(app, origins=app.config.get("FRONTEND_URL", "http://localhost:5173"), methods=["GET", "POST", "DELETE", "PUT"], allow_headers=["Authorization", "Content-Type"])
+    JWTManager(app)
+    app.teardown_appcontext(close_db)
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.after_request(check_repeats)
+    app.teardown_request(abort_request)
+    dish_catalog.ttl = app.config.get('CATALOG_TTL', 60)
+    usernames.ttl = titles.ttl = app.config.get('AVAILABILITY_TTL', 60)
+    app.extensions['response_cache'] = create_cache(app.config)
+    app.register_blueprint(api)
+    return app
+
+MAX_MENU_VARIANTS = 10
+MAX_MENU_COMBINATIONS = 20
+MAX_HISTORY_PAGE = 500
+MAX_BATCH_RECIPES = 100
+MAX_SEARCH_PAGE = 100
+MAX_PANTRY_SUGGESTIONS = 100
+MAX_AVAILABILITY_CHECKS = 50
+MAX_CLAIM = 50
+MAX_LEASE_SECONDS = 3600
+INDEXED_FIELD = re.compile(r'^(\w+)\[(\d+)\]\[(\w+)\]$')
+
+@api.cli.command('migrate')
+def migrate_command():
+    """Apply pending SQL migrations from backend/migrations"""
+    for name in migrate():
+        print(f"Applied {name}")
+
+@api.cli.command('backfill-ingredients')
+def backfill_ingredients_command():
+    """Resolve existing ingredient rows to canonical ingredients and units"""
+    db = get_db()
+    print(f"Backfilled {backfill_ingredients(db)} ingredient rows")
+
+@api.cli.command('backfill-images')
+@click.option('--overwrite', is_flag=True, help='Regenerate derivatives that already exist')
+def backfill_images_command(overwrite):
+    """Generate WebP derivatives for images uploaded before the derivative pipeline"""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    for filename in original_images(upload_folder):
+        try:
+            written = generate_derivatives(upload_folder, filename, overwrite)
+        except Exception as e:
+            print(f"{filename}: {e}")
+            continue
+        if written:
+            print(f"{filename}: {', '.join(written)}")
+
+@api.cli.command('import-recipes')
+@click.argument('path')
+@click.option('--batch-size', default=1000, help='Recipes loaded per transaction')
+def import_recipes_command(path, batch_size):
+    """Load recipes from a JSONL file or a directory with dishes.csv, ingredients.csv and steps.csv"""
+    records = read_csv_dir(path) if os.path.isdir(path) else list(read_jsonl(path))
+    try:
+        count = import_recipes(get_db(), records, batch_size)
+    except RecipeImportError as e:
+        for error in e.errors:
+            print(error)
+        raise click.ClickException(str(e))
+    print(f"Imported {count} recipes")
+
+@api.cli.command('export-recipes')
+@click.argument('path')
+def export_recipes_command(path):
+    """Write all recipes to a .jsonl file, or as CSV files into a directory"""
+    if path.endswith('.jsonl'):
+        print(f"Exported {export_jsonl(get_db(), path)} recipes")
+    else:
+        export_csv_dir(get_db(), path)
+        print(f"Exported recipes to {path}")
+
+@api.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Recount the per-user profile counters and fix any that drifted"""
+    for row in reconcile_counters(get_db()):
+        print(f"user {row['user_id']}: saved_menus={row['saved_menus']} authored_recipes={row['authored_recipes']} "
+              f"moderated_recipes={row['moderated_recipes']}")
+
+@api.cli.command('warm-up')
+@click.option('--connections', default=None, type=int, help='Pooled connections to open (default DB_POOL_MIN)')
+def warm_up_command(connections):
+    """Run a worker's warm-up and report how long each phase takes against COLD_START_TARGET_MS"""
+    timings = warm_up(current_app._get_current_object(), connections)
+    for phase, seconds in timings.items():
+        print(f"{phase}: {seconds * 1000:.0f} ms")
+    target_ms = float(current_app.config.get('COLD_START_TARGET_MS', 2000))
+    if timings['total'] * 1000 > target_ms:
+        raise click.ClickException(f"warm-up took longer than the {target_ms:.0f} ms target")
+
+@api.route('/images/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename) 
+    # ?w= picks the closest WebP derivative for clients that accept it, falling back to the original
+    width = request.args.get('w', type=int)
+    if width:
+        max_age = None
+        if request.accept_mimetypes['image/webp']:
+            variant = find_variant(current_app.config['UPLOAD_FOLDER'], filename, width)
+            if variant is not None:
+                response = send_image(current_app.config['UPLOAD_FOLDER'], variant, VARIANTS_DIR)
+                response.vary.add('Accept')
+                return response
+            # The derivative is not written yet; keep caches from pinning the original to this URL
+            max_age = current_app.config.get('IMAGE_FALLBACK_MAX_AGE', FALLBACK_MAX_AGE)
+        response = send_image(current_app.config['UPLOAD_FOLDER'], filename, max_age=max_age)
+        response.vary.add('Accept')
+        return response
+    return send_image(current_app.config['UPLOAD_FOLDER'], filename)
 
-@app.route("/login", methods=["POST"])
+@api.route("/login", methods=["POST"])
 def login() -> dict:
     data = request.get_json()
     db = get_db()
     cursor = db.cursor(cursor_factory=RealDictCursor)
-    cursor.execute(
-        "SELECT id FROM users WHERE username = %s AND password = %s",
-        (data["username"], data["password"]),
-    )
+    cursor.execute(LOGIN_QUERY, (data["username"], data["password"]))
     user = cursor.fetchone()
     if user is None:
         return {"error": "Invalid username or password"}
@@ -41,19 +174,14 @@ def login() -> dict:
         access_token = create_access_token(identity=user["id"])
         return {"access_token": access_token}
     
-@app.route("/check_username", methods=["POST"])
+@api.route("/check_username", methods=["POST"])
 def check_username():
     data = request.get_json()
-    db = get_db()
-    cursor = db.cursor(cursor_factory=RealDictCursor)
-    
-    cursor.execute("SELECT id FROM users WHERE username = %s", (data["username"],))
-    user = cursor.fetchone()
-    if user is None:
-        return jsonify({"valid": False})
-    return jsonify({"valid": True})
-    
-@app.route("/register", methods=["POST"])
+    # "valid" means the username exists (LoginForm) and is therefore taken (RegistrationForm)
+    taken = usernames.taken(get_db(), [data["username"]])
+    return jsonify({"valid": bool(taken)})
+
+@api.route("/register", methods=["POST"])
 def register():
     data = request.get_json()
     username = data.get('username')
@@ -71,14 +199,29 @@ def register():
         )
         user = cursor.fetchone()
         db.commit()
+        usernames.add(username)
         access_token = create_access_token(identity=user["id"])
         return jsonify(access_token=access_token, message="User registered successfully"), 201
+    except UniqueViolation:
+        db.rollback()
+        return jsonify({"error": "Username is already taken"}), 409
     except Exception as e:
         db.rollback()
         return jsonify({"error": str(e)}), 400
     
-@app.route("/users/me", methods=["GET", "PUT"])
+def user_etag(db):
+    user_id = get_jwt_identity()
+    cursor = db.cursor()
+    cursor.execute('''
+        SELECT u.edited, c.saved_menus, c.authored_recipes, c.moderated_recipes
+        FROM users u LEFT JOIN user_counters c ON c.user_id = u.id
+        WHERE u.id = %s
+    ''', (user_id,))
+    return user_id, cursor.fetchone()
+
+@api.route("/users/me", methods=["GET", "PUT"])
 @jwt_required()
+@etag_from(user_etag)
 def get_me() -> dict:
     token_data = get_jwt()
     user_id = token_data["sub"]
@@ -86,30 +229,23 @@ def get_me() -> dict:
     cursor = db.cursor(cursor_factory=RealDictCursor)
     
     if request.method == "GET":
-        # Получаем основную информацию о пользователе
-        cursor.execute("SELECT id, username, role, email, created, password FROM users WHERE id = %s", (user_id,))
+        # Counters are kept up to date by triggers (migrations/007_user_counters.sql)
+        cursor.execute('''
+            SELECT u.id, u.username, u.role, u.email, u.created, u.password,
+                   COALESCE(c.saved_menus, 0) AS saved_menus_count,
+                   CASE u.role
+                       WHEN 'author' THEN COALESCE(c.authored_recipes, 0)
+                       WHEN 'moderator' THEN COALESCE(c.moderated_recipes, 0)
+                       ELSE 0
+                   END AS recipes_count
+            FROM users u LEFT JOIN user_counters c ON c.user_id = u.id
+            WHERE u.id = %s
+        ''', (user_id,))
         user = cursor.fetchone()
         
         if user is None:
             return {"error": "User not found"}
         
-        # Считаем количество сохраненных меню
-        cursor.execute("SELECT COUNT(*) FROM menus WHERE user_id = %s AND removed IS NULL", (user_id,))
-        saved_menus_count = cursor.fetchone()['count']
-        
-        # Считаем количество добавленных рецептов для авторов
-        if user['role'] == 'author':
-            cursor.execute("SELECT COUNT(*) FROM dishes WHERE author_id = %s", (user_id,))
-            recipes_count = cursor.fetchone()['count']
-        
-        # Считаем количество отмодерированных рецептов для модераторов
-        elif user['role'] == 'moderator':
-            cursor.execute("SELECT COUNT(*) FROM moderation WHERE moderator_id = %s", (user_id,))
-            recipes_count = cursor.fetchone()['count']
-        
-        else:
-            recipes_count = 0
-        
         return {
             "id": user["id"],
             "username": user["username"],
@@ -117,8 +253,8 @@ def get_me() -> dict:
             "email": user["email"],
             "created": user["created"],
             "password": user["password"],
-            "saved_menus_count": saved_menus_count,
-            "recipes_count": recipes_count
+            "saved_menus_count": user["saved_menus_count"],
+            "recipes_count": user["recipes_count"]
         }
     
     if request.method == "PUT":
@@ -150,12 +286,19 @@ def get_me() -> dict:
                 WHERE id = %s
             ''', tuple(update_values))
             db.commit()
+            if "username" in data:
+                usernames.add(data["username"])
+            if "email" in data:
+                cache.invalidate('admin_email')
             return jsonify({"message": "User information updated successfully"}), 200
+        except UniqueViolation:
+            db.rollback()
+            return jsonify({"error": "Username is already taken"}), 409
         except Exception as e:
             db.rollback()
             return jsonify({"error": str(e)}), 500
     
-@app.route('/addRecipe', methods=['POST'])
+@api.route('/addRecipe', methods=['POST'])
 @jwt_required()
 def add_recipe():
     token_data = get_jwt()
@@ -169,68 +312,152 @@ def add_recipe():
     if image_file:
         ext = image_file.filename.rsplit('.', 1)[1].lower() if '.' in image_file.filename else ''
         unique_filename = secure_filename(f"{uuid.uuid4()}.{ext}")
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
+        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
         image_file.save(file_path)
         image_url = unique_filename  
+        schedule_derivatives(current_app.config['UPLOAD_FOLDER'], unique_filename, current_app.config.get('IMAGE_WORKERS', 2))
     
+    ingredients = parse_indexed_fields(request.form, 'ingredients')
+    steps = parse_indexed_fields(request.form, 'instructions')
+
     db = get_db()
     cursor = db.cursor()
 
     try:
-        cursor.execute('''
-            INSERT INTO dishes (title, description, author_id, image_url) 
-            VALUES (%s, %s, %s, %s) RETURNING id;
-        ''', (title, description, user_id, image_url))
-        dish_id = cursor.fetchone()[0]
-
-        num_ingredients = len([key for key in request.form.keys() if key.startswith('ingredients[') and key.endswith('][name]')])
-        for i in range(num_ingredients):
-            name = request.form.get(f'ingredients[{i}][name]')
-            amount = request.form.get(f'ingredients[{i}][amount]')
-            measurement = request.form.get(f'ingredients[{i}][measurement]', '')
-            if measurement == '-':
-                measurement = ''
-            index = request.form.get(f'ingredients[{i}][index]', type=int) + 1
-            cursor.execute('''
-                INSERT INTO ingredients (index, name, amount, measurement, dish_id) 
-                VALUES (%s, %s, %s, %s, %s);
-            ''', (index, name, amount, measurement, dish_id))
-
-        steps_count = len([key for key in request.form.keys() if key.startswith('instructions[') and key.endswith('][description]')])
-        for i in range(steps_count):
-            description = request.form.get(f'instructions[{i}][description]')
-            index = i + 1
+        with transaction(db):
             cursor.execute('''
-                INSERT INTO steps (dish_id, index, description) 
-                VALUES (%s, %s, %s);
-            ''', (dish_id, index, description))
+                INSERT INTO dishes (title, description, author_id, image_url) 
+                VALUES (%s, %s, %s, %s) RETURNING id;
+            ''', (title, description, user_id, image_url))
+            dish_id = cursor.fetchone()[0]
 
-        db.commit()
+            ingredient_ids = resolve_ingredients(cursor, [ingredient.get('name') for ingredient in ingredients])
+            ingredient_rows = []
+            for ingredient in ingredients:
+                measurement = ingredient.get('measurement', '')
+                if measurement == '-':
+                    measurement = ''
+                unit, unit_amount = to_canonical_unit(ingredient.get('amount'), measurement)
+                ingredient_rows.append((
+                    int(ingredient['index']) + 1, ingredient.get('name'), ingredient.get('amount'), measurement, dish_id,
+                    ingredient_ids.get(ingredient.get('name')), unit, unit_amount
+                ))
+            if ingredient_rows:
+                execute_values(cursor, '''
+                    INSERT INTO ingredients (index, name, amount, measurement, dish_id, ingredient_id, unit, unit_amount)
+                    VALUES %s
+                ''', ingredient_rows, template='(%s, %s, %s::real, %s, %s, %s, %s, %s)')
+
+            step_rows = [(dish_id, i + 1, step.get('description')) for i, step in enumerate(steps)]
+            if step_rows:
+                execute_values(cursor, '''
+                    INSERT INTO steps (dish_id, index, description)
+                    VALUES %s
+                ''', step_rows)
+
+        titles.add(title)
         return jsonify({'message': 'Recipe added successfully', 'dish_id': dish_id}), 201
+    except UniqueViolation:
+        return jsonify({'error': 'A recipe with this title already exists'}), 409
     except Exception as e:
-        db.rollback()
         return jsonify({'error': str(e)}), 400
 
+def parse_indexed_fields(form, prefix):
+    """Collect form keys like ingredients[0][name] into a list of dicts ordered by their index"""
+    items = {}
+    for key, value in form.items():
+        match = INDEXED_FIELD.match(key)
+        if match and match.group(1) == prefix:
+            items.setdefault(int(match.group(2)), {})[match.group(3)] = value
+    return [items[i] for i in sorted(items)]
 
-@app.route("/check_recipe_title", methods=["POST"])
+
+@api.route("/check_recipe_title", methods=["POST"])
 def check_recipe_title():
     data = request.get_json()
+    taken = titles.taken(get_db(), [data["title"]])
+    return jsonify({"exists": bool(taken)})
+
+@api.route("/checkAvailability", methods=["POST"])
+def check_availability():
+    data = request.get_json()
+    candidates = {'usernames': (usernames, data.get('usernames', [])), 'titles': (titles, data.get('titles', []))}
+
+    if not any(names for _, names in candidates.values()):
+        return jsonify({'error': 'No usernames or titles provided'}), 400
+    if sum(len(names) for _, names in candidates.values()) > MAX_AVAILABILITY_CHECKS:
+        return jsonify({'error': f'At most {MAX_AVAILABILITY_CHECKS} names can be checked at once'}), 400
+    if not all(isinstance(name, str) for _, names in candidates.values() for name in names):
+        return jsonify({'error': 'Names must be strings'}), 400
+
     db = get_db()
-    cursor = db.cursor(cursor_factory=RealDictCursor)
-    
-    cursor.execute("SELECT id FROM dishes WHERE title = %s", (data["title"],))
-    recipe = cursor.fetchone()
-    if recipe is None:
-        return jsonify({"exists": False})
-    return jsonify({"exists": True})
+    try:
+        result = {}
+        for field, (index, names) in candidates.items():
+            taken = index.taken(db, names) if names else set()
+            result[field] = {name: name not in taken for name in names}
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/search', methods=['GET'])
+@etag_from(lambda db: table_versions(db, 'dishes'))
+def search():
+    text = request.args.get('q', '').strip()
+    limit = request.args.get('limit', 20, type=int)
+    cooking_time = request.args.get('cooking_time', type=int)
 
+    if not text:
+        return jsonify({'error': 'No search query provided'}), 400
+    if not 1 <= limit <= MAX_SEARCH_PAGE:
+        return jsonify({'error': f'limit must be between 1 and {MAX_SEARCH_PAGE}'}), 400
 
-@app.route('/newRecipes', methods=['GET'])
+    db = get_db()
+    try:
+        after = decode_cursor(request.args['after']) if request.args.get('after') else None
+        recipes, next_cursor = search_recipes(
+            db, text,
+            dish_type=request.args.get('type'),
+            cuisine=request.args.get('cuisine'),
+            season=request.args.get('season'),
+            cooking_time=cooking_time,
+            limit=limit,
+            after=after,
+        )
+        return jsonify({'recipes': recipes, 'next': next_cursor}), 200
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def new_recipes_versions(db):
+    return table_versions(db, 'dishes', 'users', 'moderation_queue')
+
+@api.route('/newRecipes', methods=['GET'])
 @jwt_required()
+@etag_from(new_recipes_versions)
 def get_new_recipes():
     db = get_db()
     cursor = db.cursor(cursor_factory=RealDictCursor)
-    try:
+
+    # Without ?limit= the full list is returned as before; with it the response is a
+    # keyset page of the moderation queue, including who holds each lease
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        if not 1 <= limit <= MAX_HISTORY_PAGE:
+            return jsonify({'error': f'limit must be between 1 and {MAX_HISTORY_PAGE}'}), 400
+        try:
+            recipes = pending_page(db, limit, request.args.get('after_id', type=int))
+            return jsonify({
+                'recipes': recipes,
+                'next_after_id': recipes[-1]['id'] if len(recipes) == limit else None
+            })
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    def load():
         cursor.execute('''
             SELECT d.id, d.title, d.image_url, 
                     to_char(d.created, 'DD.MM.YYYY') as created, 
@@ -240,25 +467,132 @@ def get_new_recipes():
             JOIN users u ON d.author_id = u.id
             WHERE d.is_moderated = FALSE
         ''')
-        recipes = cursor.fetchall()
+        return cursor.fetchall()
+
+    try:
+        # Keyed by the versions behind the ETag, so no worker can serve a list
+        # that predates a write handled by another one
+        recipes = cache.get_or_load(f'new_recipes:{make_etag(new_recipes_versions(db))}', load)
         return jsonify(recipes)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+def moderator_required(view):
+    """Only users with the moderator role may hold leases; goes below @jwt_required()"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cursor = get_db().cursor()
+        cursor.execute("SELECT role FROM users WHERE id = %s", (get_jwt_identity(),))
+        user = cursor.fetchone()
+        if user is None or user[0] != 'moderator':
+            return jsonify({'error': 'Only moderators can use the moderation queue'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+def is_count(value):
+    # bool is a subclass of int
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def lease_seconds(data):
+    seconds = data.get('leaseSeconds', current_app.config.get('MODERATION_LEASE_SECONDS', 900))
+    if not is_count(seconds) or not 1 <= seconds <= MAX_LEASE_SECONDS:
+        raise ValueError(f'leaseSeconds must be between 1 and {MAX_LEASE_SECONDS}')
+    return seconds
+
+def lease_recipe_ids(data):
+    dish_ids = data.get('recipeIds')
+    if not dish_ids:
+        raise ValueError('No recipe IDs provided')
+    if not isinstance(dish_ids, list) or not all(is_count(dish_id) for dish_id in dish_ids):
+        raise ValueError('recipeIds must be a list of recipe IDs')
+    return dish_ids
+
+def lease_conflict(e):
+    return jsonify({'error': f'Recipe is being moderated by {e.moderator}', 'lease_expires': e.expires}), 409
+
+@api.route('/moderationQueue/claim', methods=['POST'])
+@jwt_required()
+@moderator_required
+def claim_moderation():
+    data = request.get_json() or {}
+    count = data.get('count', 1)
+    if not is_count(count) or not 1 <= count <= MAX_CLAIM:
+        return jsonify({'error': f'count must be between 1 and {MAX_CLAIM}'}), 400
+    try:
+        seconds = lease_seconds(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    db = get_db()
+    try:
+        recipes = claim_recipes(db, get_jwt_identity(), count, seconds)
+        return jsonify({'lease_seconds': seconds, 'recipes': recipes}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/moderationQueue/renew', methods=['POST'])
+@jwt_required()
+@moderator_required
+def renew_moderation():
+    data = request.get_json() or {}
+    try:
+        dish_ids = lease_recipe_ids(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        seconds = lease_seconds(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    db = get_db()
+    try:
+        renewed = renew_leases(db, get_jwt_identity(), dish_ids, seconds)
+        return jsonify({
+            'renewed': [{'id': dish_id, 'lease_expires': expires} for dish_id, expires in sorted(renewed.items())],
+            'lost': sorted(set(dish_ids) - set(renewed))
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/moderationQueue/release', methods=['POST'])
+@jwt_required()
+@moderator_required
+def release_moderation():
+    data = request.get_json() or {}
+    try:
+        dish_ids = lease_recipe_ids(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    db = get_db()
+    try:
+        return jsonify({'released': release_leases(db, get_jwt_identity(), dish_ids)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
     
-@app.route('/recipes/<int:dish_id>', methods=['GET'])
+def recipe_etag(db, dish_id):
+    # Edits bump `edited`; publishing adds a moderation row
+    cursor = db.cursor()
+    cursor.execute('''
+        SELECT d.edited, d.is_moderated, (SELECT max(published) FROM moderation WHERE dish_id = d.id)
+        FROM dishes d WHERE d.id = %s
+    ''', (dish_id,))
+    return cursor.fetchone()
+
+@api.route('/recipes/<int:dish_id>', methods=['GET'])
 @jwt_required()
+@etag_from(recipe_etag)
 def get_recipe(dish_id):
     db = get_db()
     cursor = db.cursor(cursor_factory=RealDictCursor)
 
-    try:
-        cursor.execute('''
-            SELECT * FROM dishes WHERE id = %s;
+    def load():
+        cursor.execute(f'''
+            SELECT {', '.join(DISH_COLUMNS)} FROM dishes WHERE id = %s;
         ''', (dish_id,))
         dish = cursor.fetchone()
-        
         if dish is None:
-            return jsonify({"error": "Recipe not found"}), 404
+            return None
 
         cursor.execute('''
             SELECT * FROM ingredients WHERE dish_id = %s ORDER BY index;
@@ -270,46 +604,53 @@ def get_recipe(dish_id):
         ''', (dish_id,))
         steps = cursor.fetchall()
 
-        full_recipe_info = {
+        return {
             **dish,
             "ingredients": ingredients,
             "steps": steps
         }
-        print("Response data:", full_recipe_info) 
 
-        return jsonify(full_recipe_info)
+    try:
+        # Keyed by the row version, so a worker whose cache missed another
+        # worker's invalidation can never serve the old recipe (or its version)
+        row = recipe_etag(db, dish_id)
+        if row is None:
+            return jsonify({"error": "Recipe not found"}), 404
+        full_recipe_info = cache.get_or_load(f'recipe:{dish_id}:{make_etag(*row)}', load)
+        if full_recipe_info is None:
+            return jsonify({"error": "Recipe not found"}), 404
+
+        return jsonify({**full_recipe_info, "version": recipe_version(row[0])})
     except Exception as e:
         db.rollback()
         return jsonify({"error": str(e)}), 500
     
-@app.route('/recipes/<int:dish_id>', methods=['PUT'])
+@api.route('/recipes/<int:dish_id>', methods=['PUT'])
 @jwt_required()
 def update_recipe(dish_id):
     data = request.get_json()
     db = get_db()
-    cursor = db.cursor()
     try:
-        cursor.execute('''
-            UPDATE dishes SET title=%s, description=%s, edited=CURRENT_TIMESTAMP WHERE id=%s;
-        ''', (data['title'], data['description'], dish_id))
-
-        for ingredient in data['ingredients']:
-            cursor.execute('''
-                UPDATE ingredients SET name=%s, amount=%s, measurement=%s, category=%s, is_main=%s WHERE id=%s AND dish_id=%s;
-            ''', (ingredient['name'], ingredient['amount'], ingredient['measurement'], ingredient['category'], ingredient.get('isMain', False), ingredient['id'], dish_id))
-
-        for step in data['steps']:
-            cursor.execute('''
-                UPDATE steps SET description=%s WHERE id=%s AND dish_id=%s;
-            ''', (step['description'], step['id'], dish_id))
-
-        db.commit()
-        return jsonify({"message": "Recipe updated successfully"}), 200
+        with transaction(db):
+            result = apply_recipe_update(db, dish_id, data)
+        if result is None:
+            return jsonify({"error": "Recipe not found"}), 404
+        changed, version = result
+        if changed:
+            if 'title' in data:
+                titles.add(data['title'])
+            dish_catalog.refresh_dish(db, dish_id)
+        return jsonify({"message": "Recipe updated successfully", "changed": changed, "version": version}), 200
+    except VersionConflict as e:
+        return jsonify({"error": "Recipe was changed by someone else, reload it and try again", "version": str(e)}), 409
+    except InvalidRecipeUpdate as e:
+        return jsonify({"error": str(e)}), 400
+    except UniqueViolation:
+        return jsonify({"error": "A recipe with this title already exists"}), 409
     except Exception as e:
-        db.rollback()
         return jsonify({"error": str(e)}), 500
     
-@app.route('/recipes/publish/<int:dish_id>', methods=['PUT'])
+@api.route('/recipes/publish/<int:dish_id>', methods=['PUT'])
 @jwt_required()
 def publish_recipe(dish_id):
     data = request.get_json()
@@ -318,59 +659,84 @@ def publish_recipe(dish_id):
 
     token_data = get_jwt()
     moderator_id = token_data['sub']
+    cuisines = split_list(data['cuisine'])
+    categories = split_list(data['dinnerCategories'])
+    dinner_times = split_list(data['dinnerTimes'])
+    seasons = split_list(data['seasons'])
     try:
-        cursor.execute('''
-            UPDATE dishes SET type=%s, side_dish=%s, cuisine=%s, cooking_time=%s, category=%s, dinner_time=%s, season=%s, is_moderated=TRUE
-            WHERE id=%s;
-        ''', (data['dishType'], data['needSideDish'], data['cuisine'], data['cookingTime'], data['dinnerCategories'], data['dinnerTimes'], data['seasons'], dish_id))
+        with transaction(db):
+            # Dequeuing first makes a second publish of the same dish fail instead of
+            # adding another moderation row
+            take_from_queue(db, dish_id, moderator_id)
+            cursor.execute('''
+                UPDATE dishes SET type=%s, side_dish=%s, cuisine=%s, cooking_time=%s, category=%s, dinner_time=%s, season=%s,
+                    cuisines=%s, categories=%s, dinner_times=%s, seasons=%s, is_moderated=TRUE
+                WHERE id=%s;
+            ''', (data['dishType'], data['needSideDish'], ', '.join(cuisines), data['cookingTime'], ', '.join(categories), ', '.join(dinner_times), ', '.join(seasons),
+                  list(cuisines), list(categories), list(dinner_times), list(seasons), dish_id))
 
-        cursor.execute('''
-            INSERT INTO moderation (dish_id, moderator_id)
-            VALUES (%s, %s);
-        ''', (dish_id, moderator_id))
+            cursor.execute('''
+                INSERT INTO moderation (dish_id, moderator_id)
+                VALUES (%s, %s);
+            ''', (dish_id, moderator_id))
 
-        db.commit()
+        dish_catalog.refresh_dish(db, dish_id)
         return jsonify({"message": "Recipe published successfully"}), 200
+    except LeaseConflict as e:
+        return lease_conflict(e)
+    except NotPending:
+        return jsonify({"error": "Recipe is not awaiting moderation"}), 409
     except Exception as e:
-        db.rollback()
         return jsonify({"error": str(e)}), 500
     
-@app.route('/recipes/<int:dish_id>', methods=['DELETE'])
+@api.route('/recipes/<int:dish_id>', methods=['DELETE'])
 @jwt_required()
 def delete_recipe(dish_id):
     db = get_db()
     cursor = db.cursor()
     try:
-        cursor.execute('''
-            DELETE FROM steps WHERE dish_id = %s;
-        ''', (dish_id,))
+        with transaction(db):
+            # The queue row (and any lease) goes with the dish; refuse while someone else holds it
+            check_lease(db, dish_id, get_jwt_identity())
 
-        cursor.execute('''
-            DELETE FROM ingredients WHERE dish_id = %s;
-        ''', (dish_id,))
+            cursor.execute('''
+                DELETE FROM steps WHERE dish_id = %s;
+            ''', (dish_id,))
 
-        cursor.execute('''
-            DELETE FROM moderation WHERE dish_id = %s;
-        ''', (dish_id,))
+            cursor.execute('''
+                DELETE FROM ingredients WHERE dish_id = %s;
+            ''', (dish_id,))
 
-        cursor.execute('''
-            DELETE FROM dishes WHERE id = %s;
-        ''', (dish_id,))
+            cursor.execute('''
+                DELETE FROM moderation WHERE dish_id = %s;
+            ''', (dish_id,))
 
-        db.commit()
+            cursor.execute('''
+                DELETE FROM dishes WHERE id = %s;
+            ''', (dish_id,))
+
+        dish_catalog.remove_dish(dish_id)
         return jsonify({"message": "Recipe and all related data have been deleted"}), 200
+    except LeaseConflict as e:
+        return lease_conflict(e)
     except Exception as e:
-        db.rollback()
         return jsonify({"error": str(e)}), 500
 
-@app.route('/createMenu', methods=['POST'])
+@api.route('/createMenu', methods=['POST'])
 def create_menu():
     data = request.get_json()
-    db = get_db()
     dinner_category = data.get('dinnerCategory')
     dinner_time = data.get('dinnerTime')
-    cooking_time = data.get('cookingTime')
 
+    if 'variants' in data or 'combinations' in data:
+        return create_menu_variants(data)
+
+    try:
+        cooking_time = menu_cooking_time(data.get('cookingTime'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    db = get_db()
     try:
         dishes = find_matching_dishes(db, dinner_category, dinner_time, cooking_time)
         if not dishes:
@@ -379,7 +745,89 @@ def create_menu():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
-@app.route('/aggregateIngredients', methods=['POST'])
+def menu_cooking_time(value):
+    """cookingTime of a /createMenu request as an int (numeric strings are accepted, as the SQL version did)"""
+    # bool is a subclass of int
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        raise ValueError('cookingTime must be a positive whole number')
+    return value
+
+def create_menu_variants(data):
+    combinations = data.get('combinations') or [data]
+    variants = data.get('variants', 1)
+    seed = data.get('seed')
+    if seed is None:
+        seed = random.randrange(2 ** 31)
+
+    # bool is a subclass of int
+    if not isinstance(variants, int) or isinstance(variants, bool) or not 1 <= variants <= MAX_MENU_VARIANTS:
+        return jsonify({'error': f'variants must be between 1 and {MAX_MENU_VARIANTS}'}), 400
+    if not isinstance(combinations, list) or not all(isinstance(c, dict) for c in combinations):
+        return jsonify({'error': 'combinations must be a list of objects'}), 400
+    if len(combinations) > MAX_MENU_COMBINATIONS:
+        return jsonify({'error': f'At most {MAX_MENU_COMBINATIONS} combinations are allowed'}), 400
+
+    try:
+        keys = [(c.get('dinnerCategory'), c.get('dinnerTime'), menu_cooking_time(c.get('cookingTime'))) for c in combinations]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    db = get_db()
+    try:
+        results = find_menu_variants(db, keys, variants, seed)
+        menus = [
+            {'dinnerCategory': dinner_category, 'dinnerTime': dinner_time, 'cookingTime': cooking_time, 'variants': variant_menus}
+            for (dinner_category, dinner_time, cooking_time), variant_menus in zip(keys, results)
+        ]
+        if not any(menu['variants'] for menu in menus):
+            return jsonify({'error': 'No dishes found matching the criteria'}), 404
+        return jsonify({'seed': seed, 'menus': menus}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/pantryDishes', methods=['POST'])
+def get_pantry_dishes():
+    data = request.get_json()
+    ingredients = data.get('ingredients', [])
+    limit = data.get('limit', 20)
+
+    if not ingredients:
+        return jsonify({'error': 'No ingredients provided'}), 400
+    if not isinstance(limit, int) or isinstance(limit, bool) or not 1 <= limit <= MAX_PANTRY_SUGGESTIONS:
+        return jsonify({'error': f'limit must be between 1 and {MAX_PANTRY_SUGGESTIONS}'}), 400
+
+    db = get_db()
+    try:
+        dishes = suggest_dishes(db, ingredients, limit, data.get('ignoreStaples', True))
+        return jsonify(dishes), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/pantryMenu', methods=['POST'])
+def create_pantry_menu():
+    data = request.get_json()
+    ingredients = data.get('ingredients', [])
+
+    if not ingredients:
+        return jsonify({'error': 'No ingredients provided'}), 400
+    try:
+        cooking_time = menu_cooking_time(data.get('cookingTime'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    db = get_db()
+    try:
+        dishes = pantry_menu(db, ingredients, data.get('dinnerCategory'), data.get('dinnerTime'), cooking_time,
+                             data.get('ignoreStaples', True), data.get('seed'))
+        if not dishes:
+            return jsonify({'error': 'No dishes found matching the criteria'}), 404
+        return jsonify(dishes), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/aggregateIngredients', methods=['POST'])
 def get_aggregated_ingredients():
     data = request.get_json()
     dish_ids = data.get('recipes', [])
@@ -394,7 +842,7 @@ def get_aggregated_ingredients():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
-@app.route('/recipeDetails', methods=['POST'])
+@api.route('/recipeDetails', methods=['POST'])
 def get_recipe_details():
     data = request.get_json()
     dish_id = data.get('recipeId')
@@ -403,34 +851,49 @@ def get_recipe_details():
         return jsonify({'error': 'No recipe ID provided'}), 400
 
     db = get_db()
-    try:
-        cursor = db.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("SELECT title, description, image_url FROM dishes WHERE id = %s", (dish_id,))
-        dish = cursor.fetchone()
 
-        if dish is None:
-            return jsonify({"error": "Recipe not found"}), 404
+    def load():
+        recipes = fetch_recipe_details(db, [dish_id])
+        return recipes[0] if recipes else None
 
-        cursor.execute("SELECT index, description FROM steps WHERE dish_id = %s ORDER BY index", (dish_id,))
-        steps = cursor.fetchall()
+    try:
+        # Versioned like `recipe:<id>:<version>` in get_recipe
+        row = recipe_etag(db, int(dish_id))
+        if row is None:
+            return jsonify({"error": "Recipe not found"}), 404
+        recipe = cache.get_or_load(f'recipe_details:{int(dish_id)}:{make_etag(*row)}', load)
+        if recipe is None:
+            return jsonify({"error": "Recipe not found"}), 404
+        return jsonify(recipe), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        cursor.execute("SELECT name, amount, measurement FROM ingredients WHERE dish_id = %s ORDER BY index", (dish_id,))
-        ingredients = cursor.fetchall()
+@api.route('/recipeDetails/batch', methods=['POST'])
+def get_recipe_details_batch():
+    data = request.get_json()
+    dish_ids = data.get('recipeIds', [])
+    fields = data.get('fields', DETAIL_FIELDS)
 
-        recipe = {
-            'id': dish_id,
-            'title': dish['title'],
-            'description': dish['description'],
-            'steps': steps,
-            'ingredients': ingredients,
-            'image_url': f'/images/{dish["image_url"]}'
-        }
+    if not dish_ids:
+        return jsonify({'error': 'No recipe IDs provided'}), 400
+    if not isinstance(dish_ids, list) or not all(is_count(dish_id) for dish_id in dish_ids):
+        return jsonify({'error': 'recipeIds must be a list of recipe IDs'}), 400
+    if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+        return jsonify({'error': 'fields must be a list of field names'}), 400
+    if len(dish_ids) > MAX_BATCH_RECIPES:
+        return jsonify({'error': f'At most {MAX_BATCH_RECIPES} recipes can be requested at once'}), 400
+    unknown_fields = set(fields) - set(DETAIL_FIELDS)
+    if unknown_fields:
+        return jsonify({'error': 'Unknown fields: ' + ', '.join(sorted(unknown_fields))}), 400
 
-        return jsonify(recipe), 200
+    db = get_db()
+    try:
+        recipes = fetch_recipe_details(db, dish_ids, fields)
+        return jsonify(recipes), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
-@app.route('/saveMenu', methods=['POST'])
+@api.route('/saveMenu', methods=['POST'])
 @jwt_required()
 def save_menu():
     data = request.get_json()
@@ -444,14 +907,27 @@ def save_menu():
     if not all([title, dishes, dinner_category, dinner_time, cooking_time]):
         return jsonify({'error': 'Missing data'}), 400
 
+    try:
+        dish_ids = [int(dish_id) for dish_id in (dishes.split(',') if isinstance(dishes, str) else dishes)]
+    except ValueError:
+        return jsonify({'error': 'Invalid dish IDs'}), 400
+
     db = get_db()
     cursor = db.cursor()
     try:
+        # menus.dishes is still written for clients that read it; menu_dishes is what queries use
         cursor.execute('''
-            INSERT INTO menus (user_id, title, dishes, dinner_category, dinner_time, cooking_time)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            RETURNING id;
-        ''', (user_id, title, dishes, dinner_category, dinner_time, cooking_time))
+            WITH menu AS (
+                INSERT INTO menus (user_id, title, dishes, dinner_category, dinner_time, cooking_time)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id
+            ), items AS (
+                INSERT INTO menu_dishes (menu_id, dish_id, position)
+                SELECT menu.id, item.dish_id, item.position
+                FROM menu, unnest(%s::int[]) WITH ORDINALITY AS item(dish_id, position)
+            )
+            SELECT id FROM menu;
+        ''', (user_id, title, ', '.join(map(str, dish_ids)), dinner_category, dinner_time, cooking_time, dish_ids))
         menu_id = cursor.fetchone()[0]
         db.commit()
         return jsonify({'message': 'Menu saved successfully', 'menu_id': menu_id}), 201
@@ -459,47 +935,35 @@ def save_menu():
         db.rollback()
         return jsonify({'error': str(e)}), 500
     
-@app.route('/savedMenus', methods=['GET'])
+@api.route('/savedMenus', methods=['GET'])
 @jwt_required()
+@etag_from(lambda db: (get_jwt_identity(), table_versions(db, 'menus', 'menu_dishes', 'dishes')))
 def get_saved_menus():
     user_id = get_jwt_identity()
     db = get_db()
     cursor = db.cursor(cursor_factory=RealDictCursor)
     try:
         cursor.execute('''
-            SELECT id, title, dinner_category, dinner_time, cooking_time, saved, dishes 
-            FROM menus 
-            WHERE user_id = %s AND removed IS NULL
+            SELECT m.id, m.title, m.dinner_category, m.dinner_time, m.cooking_time, m.saved, m.dishes,
+                   COALESCE(
+                       json_agg(json_build_object(
+                           'id', d.id, 'title', d.title, 'image_url', d.image_url, 'description', d.description, 'type', d.type
+                       ) ORDER BY course_order(d.type), md.position) FILTER (WHERE d.id IS NOT NULL),
+                       '[]'
+                   ) AS recipes
+            FROM menus m
+            LEFT JOIN menu_dishes md ON md.menu_id = m.id
+            LEFT JOIN dishes d ON d.id = md.dish_id
+            WHERE m.user_id = %s AND m.removed IS NULL
+            GROUP BY m.id
+            ORDER BY m.id
         ''', (user_id,))
         menus = cursor.fetchall()
-        
-        for menu in menus:
-            cursor.execute('''
-                SELECT id, title, image_url, description, type
-                FROM dishes
-                WHERE id = ANY(string_to_array(%s, ',')::int[])
-            ''', (menu['dishes'],))
-            dishes = cursor.fetchall()
-            
-            type_order = {
-                'appetizer': 1,
-                'salad': 2,
-                'starter': 3,
-                'hot starter': 4,
-                'soup': 5,
-                'main dish': 6,
-                'side dish': 7,
-                'desert': 8
-            }
-            sorted_dishes = sorted(dishes, key=lambda d: type_order.get(d['type'], float('inf')))
-            
-            menu['recipes'] = sorted_dishes
-        
         return jsonify(menus)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
-@app.route('/removeMenu', methods=['POST'])
+@api.route('/removeMenu', methods=['POST'])
 @jwt_required()
 def remove_menu():
     user_id = get_jwt_identity()
@@ -523,79 +987,175 @@ def remove_menu():
         db.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/recipesHistory', methods=['GET'])
+@api.route('/recipesHistory', methods=['GET'])
 @jwt_required()
+@etag_from(lambda db: table_versions(db, 'dishes', 'moderation', 'users'))
 def get_recipes_history():
     user_id = get_jwt_identity()
+
+    # Without ?limit= the full list is returned as before; with it the response is a keyset page
+    limit = request.args.get('limit', type=int)
+    after_id = request.args.get('after_id', type=int)
+    if limit is not None and not 1 <= limit <= MAX_HISTORY_PAGE:
+        return jsonify({'error': f'limit must be between 1 and {MAX_HISTORY_PAGE}'}), 400
+
+    filters = []
+    values = []
+
+    if request.args.get('author'):
+        filters.append("u.username = %s")
+        values.append(request.args['author'])
+
+    if request.args.get('moderator'):
+        filters.append("mu.username = %s")
+        values.append(request.args['moderator'])
+
+    try:
+        created_from, created_to = (date.fromisoformat(request.args[name]) if request.args.get(name) else None
+                                    for name in ('created_from', 'created_to'))
+    except ValueError:
+        return jsonify({'error': 'created_from and created_to must be dates (YYYY-MM-DD)'}), 400
+
+    if created_from is not None:
+        filters.append("d.created >= %s")
+        values.append(created_from)
+
+    if created_to is not None:
+        filters.append("d.created < %s::date + 1")
+        values.append(created_to)
+
+    if request.args.get('moderated') in ('true', 'false'):
+        filters.append("d.is_moderated = %s")
+        values.append(request.args['moderated'] == 'true')
+
+    base_query = '''
+        FROM dishes d
+        JOIN users u ON d.author_id = u.id
+        LEFT JOIN LATERAL (
+            SELECT moderator_id, published FROM moderation
+            WHERE dish_id = d.id
+            ORDER BY published DESC
+            LIMIT 1
+        ) m ON TRUE
+        LEFT JOIN users mu ON mu.id = m.moderator_id
+    '''
+    where = f"WHERE {' AND '.join(filters)}" if filters else ''
+
+    page_filters = list(filters)
+    page_values = list(values)
+    if after_id is not None:
+        page_filters.append("d.id > %s")
+        page_values.append(after_id)
+    page_where = f"WHERE {' AND '.join(page_filters)}" if page_filters else ''
+    page_limit = ''
+    if limit is not None:
+        page_limit = 'LIMIT %s'
+        page_values.append(limit)
+
+    query = f'''
+        SELECT d.id, d.title, u.username AS author,
+               COALESCE(to_char(d.created, 'DD.MM.YYYY'), '-') AS created_date,
+               m.moderator_id,
+               COALESCE(to_char(m.published, 'DD.MM.YYYY'), '-') AS published_date,
+               COALESCE(mu.username, '-') AS moderator
+        {base_query}
+        {page_where}
+        ORDER BY d.id ASC
+        {page_limit}
+    '''
+
+    # ?format=ndjson|csv streams the same rows instead of building one JSON document
+    export_format = request.args.get('format')
+    if export_format is not None:
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': 'format must be one of: ' + ', '.join(EXPORT_FORMATS)}), 400
+        return stream_export(query, tuple(page_values), export_format, 'recipes_history')
+
     db = get_db()
     cursor = db.cursor(cursor_factory=RealDictCursor)
-
-    try: 
-        cursor.execute('''
-            SELECT d.id, d.title, u.username AS author, d.created AS created_date,
-                   m.moderator_id, m.published AS published_date
-            FROM dishes d
-            JOIN users u ON d.author_id = u.id
-            LEFT JOIN moderation m ON d.id = m.dish_id
-            ORDER BY d.id ASC
-        ''')
+    try:
+        cursor.execute(query, tuple(page_values))
         recipes = cursor.fetchall()
 
-        for recipe in recipes:
-            if recipe['moderator_id']:
-                cursor.execute('SELECT username FROM users WHERE id = %s', (recipe['moderator_id'],))
-                moderator = cursor.fetchone()
-                recipe['moderator'] = moderator['username'] if moderator else '-'
-            else:
-                recipe['moderator'] = '-'
-
-            recipe['published_date'] = recipe['published_date'].strftime("%d.%m.%Y") if recipe['published_date'] else '-'
-            recipe['created_date'] = recipe['created_date'].strftime("%d.%m.%Y") if recipe['created_date'] else '-'
+        if limit is None:
+            return jsonify(recipes)
 
-        return jsonify(recipes)
+        page = {
+            'recipes': recipes,
+            'next_after_id': recipes[-1]['id'] if len(recipes) == limit else None
+        }
+        if request.args.get('count') == 'true':
+            cursor.execute(f"SELECT COUNT(*) {base_query} {where}", tuple(values))
+            page['total'] = cursor.fetchone()['count']
+        return jsonify(page)
     except Exception as e:
-        print("Error in get_recipes_history:", e)  # Debugging log
+        current_app.logger.exception("Loading the recipes history failed")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/menusHistory', methods=['GET'])
+@api.route('/menusHistory', methods=['GET'])
 @jwt_required()
+@etag_from(lambda db: table_versions(db, 'menus', 'menu_dishes', 'dishes', 'users'))
 def get_menus_history():
     user_id = get_jwt_identity()
+    query = '''
+        SELECT m.id, m.title, u.username, m.dinner_category, m.cooking_time,
+               COALESCE(to_char(m.saved, 'DD.MM.YYYY'), '-') AS saved_date,
+               COALESCE(to_char(m.removed, 'DD.MM.YYYY'), '-') AS removed_date,
+               m.dishes,
+               COALESCE(
+                   json_agg(json_build_object('id', d.id, 'title', d.title)
+                            ORDER BY course_order(d.type), md.position) FILTER (WHERE d.id IS NOT NULL),
+                   '[]'
+               ) AS recipes
+        FROM menus m
+        JOIN users u ON m.user_id = u.id
+        LEFT JOIN menu_dishes md ON md.menu_id = m.id
+        LEFT JOIN dishes d ON d.id = md.dish_id
+        GROUP BY m.id, u.username
+        ORDER BY m.id ASC
+    '''
+
+    export_format = request.args.get('format')
+    if export_format is not None:
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': 'format must be one of: ' + ', '.join(EXPORT_FORMATS)}), 400
+        return stream_export(query, (), export_format, 'menus_history')
+
     db = get_db()
     cursor = db.cursor(cursor_factory=RealDictCursor)
     try:
-        cursor.execute('''
-            SELECT m.id, m.title, u.username, m.dinner_category, m.cooking_time, m.saved AS saved_date, m.removed AS removed_date, m.dishes
-            FROM menus m
-            JOIN users u ON m.user_id = u.id
-            ORDER BY m.id ASC
-        ''')
+        cursor.execute(query)
         menus = cursor.fetchall()
-
-        for menu in menus:
-            menu['saved_date'] = menu['saved_date'].strftime("%d.%m.%Y") if menu['saved_date'] else '-'
-            menu['removed_date'] = menu['removed_date'].strftime("%d.%m.%Y") if menu['removed_date'] else '-'
-            
-            cursor.execute('''
-                SELECT id, title FROM dishes WHERE id = ANY(string_to_array(%s, ',')::int[])
-            ''', (menu['dishes'],))
-            recipes = cursor.fetchall()
-            menu['recipes'] = recipes
-
         return jsonify(menus)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
     
-@app.route('/admin_email', methods=['GET'])
+@api.route('/admin_email', methods=['GET'])
 def get_admin_email():
     db = get_db()
     cursor = db.cursor(cursor_factory=RealDictCursor)
-    try:
+
+    def load():
         cursor.execute("SELECT email FROM users WHERE role = 'admin' LIMIT 1")
-        admin = cursor.fetchone()
+        return cursor.fetchone()
+
+    try:
+        admin = cache.get_or_load('admin_email', load)
         if admin is None:
             return jsonify({"error": "Admin email not found"}), 404
         return jsonify({"email": admin['email']}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+@api.route('/poolStats', methods=['GET'])
+def get_pool_stats():
+    return jsonify(get_pool().stats()), 200
+
+@api.route('/cacheStats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(cache.stats()), 200
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(pool=get_pool().stats(), cache=cache.stats()), mimetype='text/plain; version=0.0.4')
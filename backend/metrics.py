@@ -0,0 +1,171 @@
+import threading
+import time
+from bisect import bisect_left
+import psycopg2.extensions
+from flask import g, has_request_context, request
+from query_trace import trace_statement
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def record_statement(elapsed, query=None, params=None):
+    """Add one SQL statement to the current request's totals and hand it to the tracer"""
+    trace_statement(query, params, elapsed)
+    if has_request_context():
+        g.sql_count = g.get('sql_count', 0) + 1
+        g.sql_time = g.get('sql_time', 0.0) + elapsed
+
+
+class TimedCursorMixin:
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_statement(time.perf_counter() - start, query, vars)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_statement(time.perf_counter() - start, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record_statement(time.perf_counter() - start, sql)
+
+
+_cursor_classes = {}
+
+def timed_cursor_class(base):
+    cls = _cursor_classes.get(base)
+    if cls is None:
+        cls = _cursor_classes[base] = type(f"Timed{base.__name__}", (TimedCursorMixin, base), {})
+    return cls
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """Connection whose cursors (whatever cursor_factory the caller asks for) time their statements"""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = timed_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class Metrics:
+    """Per-endpoint request metrics of this process, rendered in the Prometheus text format.
+
+    Every worker process keeps its own numbers; a scrape sees the worker that answered it.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._latency = {}
+        self._sql_count = {}
+        self._sql_time = {}
+        self._db_wait = {}
+
+    def observe(self, endpoint, method, status, duration, sql_count=0, sql_time=0.0, db_wait=0.0):
+        slot = bisect_left(self.buckets, duration)
+        with self._lock:
+            key = (endpoint, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            latency = self._latency.get(endpoint)
+            if latency is None:
+                latency = self._latency[endpoint] = [0] * (len(self.buckets) + 1) + [0.0]
+            latency[slot] += 1
+            latency[-1] += duration
+            self._sql_count[endpoint] = self._sql_count.get(endpoint, 0) + sql_count
+            self._sql_time[endpoint] = self._sql_time.get(endpoint, 0.0) + sql_time
+            self._db_wait[endpoint] = self._db_wait.get(endpoint, 0.0) + db_wait
+
+    def render(self, pool=None, cache=None):
+        """Text exposition of the request metrics plus optional pool and cache stats"""
+        with self._lock:
+            requests = dict(self._requests)
+            latency = {endpoint: list(values) for endpoint, values in self._latency.items()}
+            sql_count = dict(self._sql_count)
+            sql_time = dict(self._sql_time)
+            db_wait = dict(self._db_wait)
+
+        lines = [
+            '# HELP http_requests_total Requests handled, by endpoint, method and status code.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (endpoint, method, status), count in sorted(requests.items()):
+            lines.append(f'http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+        lines += [
+            '# HELP http_request_duration_seconds Time spent in the view, by endpoint.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for endpoint, values in sorted(latency.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{_labels(endpoint=endpoint, le=bound)} {cumulative}')
+            lines.append(f'http_request_duration_seconds_sum{_labels(endpoint=endpoint)} {values[-1]:.6f}')
+            lines.append(f'http_request_duration_seconds_count{_labels(endpoint=endpoint)} {cumulative}')
+
+        for name, kind, help_text, values in (
+            ('db_statements_total', 'counter', 'SQL statements executed, by endpoint.', sql_count),
+            ('db_statement_seconds_total', 'counter', 'Time spent executing SQL, by endpoint.', sql_time),
+            ('db_connection_wait_seconds_total', 'counter', 'Time spent waiting for a pooled connection, by endpoint.', db_wait),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            for endpoint, value in sorted(values.items()):
+                lines.append(f'{name}{_labels(endpoint=endpoint)} {value:.6f}' if isinstance(value, float)
+                             else f'{name}{_labels(endpoint=endpoint)} {value}')
+
+        if pool is not None:
+            for key in ('size', 'idle', 'in_use', 'max'):
+                lines += [f'# TYPE db_pool_{key} gauge', f'db_pool_{key} {pool[key]}']
+            for key in ('checkouts', 'waits', 'timeouts', 'recycled'):
+                lines += [f'# TYPE db_pool_{key}_total counter', f'db_pool_{key}_total {pool[key]}']
+            lines += ['# TYPE db_pool_wait_seconds_total counter', f"db_pool_wait_seconds_total {pool['wait_time']:.6f}"]
+
+        if cache is not None:
+            for key in ('hits', 'misses'):
+                lines.append(f'# TYPE cache_{key}_total counter')
+                for namespace, counts in sorted(cache['namespaces'].items()):
+                    lines.append(f'cache_{key}_total{_labels(namespace=namespace)} {counts[key]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+def start_request():
+    g.request_start = time.perf_counter()
+
+def finish_request(response):
+    metrics.observe(
+        request.endpoint or 'unmatched', request.method, response.status_code,
+        time.perf_counter() - g.get('request_start', time.perf_counter()),
+        g.get('sql_count', 0), g.get('sql_time', 0.0), g.get('db_wait', 0.0),
+    )
+    g.request_observed = True
+    return response
+
+def abort_request(exc=None):
+    # after_request handlers are skipped for unhandled exceptions; count those as 500s
+    if exc is not None and not g.get('request_observed'):
+        metrics.observe(
+            request.endpoint or 'unmatched', request.method, 500,
+            time.perf_counter() - g.get('request_start', time.perf_counter()),
+            g.get('sql_count', 0), g.get('sql_time', 0.0), g.get('db_wait', 0.0),
+        )
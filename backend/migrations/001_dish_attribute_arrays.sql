@@ -0,0 +1,27 @@
+-- Dish attributes as typed arrays instead of comma-separated text, so that
+-- filters can use GIN indexes (@>, &&) instead of LIKE '%...%' scans.
+-- The text columns are kept as the display form returned by the API.
+
+ALTER TABLE dishes ADD COLUMN IF NOT EXISTS categories TEXT[] NOT NULL DEFAULT '{}';
+ALTER TABLE dishes ADD COLUMN IF NOT EXISTS dinner_times TEXT[] NOT NULL DEFAULT '{}';
+ALTER TABLE dishes ADD COLUMN IF NOT EXISTS seasons TEXT[] NOT NULL DEFAULT '{}';
+ALTER TABLE dishes ADD COLUMN IF NOT EXISTS cuisines TEXT[] NOT NULL DEFAULT '{}';
+
+CREATE OR REPLACE FUNCTION split_attribute_list(value TEXT) RETURNS TEXT[] AS $$
+    SELECT COALESCE(array_agg(lower(btrim(item))), '{}')
+    FROM unnest(string_to_array(value, ',')) AS item
+    WHERE btrim(item) <> ''
+$$ LANGUAGE SQL IMMUTABLE;
+
+-- One-shot backfill of existing rows
+UPDATE dishes SET
+    categories = split_attribute_list(category),
+    dinner_times = split_attribute_list(dinner_time),
+    seasons = split_attribute_list(season),
+    cuisines = split_attribute_list(cuisine);
+
+CREATE INDEX IF NOT EXISTS dishes_categories_idx ON dishes USING GIN (categories);
+CREATE INDEX IF NOT EXISTS dishes_dinner_times_idx ON dishes USING GIN (dinner_times);
+CREATE INDEX IF NOT EXISTS dishes_seasons_idx ON dishes USING GIN (seasons);
+CREATE INDEX IF NOT EXISTS dishes_cuisines_idx ON dishes USING GIN (cuisines);
+CREATE INDEX IF NOT EXISTS dishes_type_idx ON dishes (type) WHERE is_moderated;
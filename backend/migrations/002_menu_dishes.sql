@@ -0,0 +1,33 @@
+-- Saved menus reference their dishes through menu_dishes instead of the
+-- comma-joined menus.dishes string, so a user's menus and their dishes can be
+-- fetched in one query.
+
+CREATE TABLE IF NOT EXISTS menu_dishes (
+    menu_id INTEGER NOT NULL REFERENCES menus(id) ON DELETE CASCADE,
+    dish_id INTEGER NOT NULL REFERENCES dishes(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (menu_id, position)
+);
+
+CREATE INDEX IF NOT EXISTS menu_dishes_dish_id_idx ON menu_dishes (dish_id);
+CREATE INDEX IF NOT EXISTS menus_user_id_idx ON menus (user_id) WHERE removed IS NULL;
+
+-- Order of courses within a menu (dishes of unknown type go last)
+CREATE OR REPLACE FUNCTION course_order(dish_type TEXT) RETURNS INTEGER AS $$
+    SELECT COALESCE(
+        array_position(
+            ARRAY['appetizer', 'salad', 'starter', 'hot starter', 'soup', 'main dish', 'side dish', 'desert'],
+            dish_type
+        ),
+        1000
+    )
+$$ LANGUAGE SQL IMMUTABLE;
+
+-- Backfill from the existing string column, skipping ids of dishes that no longer exist
+INSERT INTO menu_dishes (menu_id, dish_id, position)
+SELECT m.id, item.dish_id::INTEGER, item.position
+FROM menus m
+CROSS JOIN LATERAL unnest(string_to_array(m.dishes, ',')) WITH ORDINALITY AS item(dish_id, position)
+WHERE btrim(item.dish_id) <> ''
+AND EXISTS (SELECT 1 FROM dishes d WHERE d.id = btrim(item.dish_id)::INTEGER)
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,6 @@
+-- Lookups used by the recipes history page (moderation per dish, filters by author/moderator)
+
+CREATE INDEX IF NOT EXISTS moderation_dish_id_idx ON moderation (dish_id, published DESC);
+CREATE INDEX IF NOT EXISTS moderation_moderator_id_idx ON moderation (moderator_id);
+CREATE INDEX IF NOT EXISTS dishes_author_id_idx ON dishes (author_id);
+CREATE INDEX IF NOT EXISTS dishes_created_idx ON dishes (created);
@@ -0,0 +1,15 @@
+-- Ingredients are resolved at write time to a canonical name and a canonical
+-- unit (g, ml or tsp), so the shopping list is a plain GROUP BY.
+-- Existing rows are filled in by `flask backfill-ingredients`.
+
+CREATE TABLE IF NOT EXISTS canonical_ingredients (
+    id INTEGER PRIMARY KEY GENERATED ALWAYS AS IDENTITY,
+    name TEXT NOT NULL UNIQUE
+);
+
+ALTER TABLE ingredients ADD COLUMN IF NOT EXISTS ingredient_id INTEGER REFERENCES canonical_ingredients(id);
+ALTER TABLE ingredients ADD COLUMN IF NOT EXISTS unit TEXT;
+ALTER TABLE ingredients ADD COLUMN IF NOT EXISTS unit_amount REAL;
+
+CREATE INDEX IF NOT EXISTS ingredients_dish_id_idx ON ingredients (dish_id);
+CREATE INDEX IF NOT EXISTS ingredients_ingredient_id_idx ON ingredients (ingredient_id);
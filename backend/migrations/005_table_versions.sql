@@ -0,0 +1,32 @@
+-- Per-table change counters, bumped once per writing statement. The JSON GET
+-- endpoints build their ETags from these instead of re-running the full query.
+
+CREATE TABLE IF NOT EXISTS table_versions (
+    name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO table_versions (name, version) VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (name) DO UPDATE SET version = table_versions.version + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level triggers: a multi-row insert bumps the counter once
+DO $$
+DECLARE
+    table_name TEXT;
+BEGIN
+    FOREACH table_name IN ARRAY ARRAY['users', 'dishes', 'ingredients', 'steps', 'moderation', 'menus', 'menu_dishes'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', table_name || '_version', table_name);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I
+             FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()',
+            table_name || '_version', table_name
+        );
+        INSERT INTO table_versions (name) VALUES (table_name) ON CONFLICT DO NOTHING;
+    END LOOP;
+END;
+$$;
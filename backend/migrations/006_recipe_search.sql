@@ -0,0 +1,79 @@
+-- Full-text search over title, description, ingredient names and steps.
+-- dishes.search_vector is kept current by triggers on dishes, ingredients and
+-- steps; pg_trgm adds typo-tolerant matching on titles.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE dishes ADD COLUMN IF NOT EXISTS search_vector TSVECTOR NOT NULL DEFAULT '';
+
+-- Title weighs most, then description and ingredients, then the steps
+CREATE OR REPLACE FUNCTION dish_search_vector(dish INTEGER, dish_title TEXT, dish_description TEXT) RETURNS TSVECTOR AS $$
+    SELECT setweight(to_tsvector('english', COALESCE(dish_title, '')), 'A')
+        || setweight(to_tsvector('english', COALESCE(dish_description, '')), 'B')
+        || setweight(to_tsvector('english', COALESCE(
+               (SELECT string_agg(i.name, ' ') FROM ingredients i WHERE i.dish_id = dish), '')), 'B')
+        || setweight(to_tsvector('english', COALESCE(
+               (SELECT string_agg(s.description, ' ') FROM steps s WHERE s.dish_id = dish), '')), 'D')
+$$ LANGUAGE SQL STABLE;
+
+CREATE OR REPLACE FUNCTION dishes_search_vector_trigger() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.search_vector := dish_search_vector(NEW.id, NEW.title, NEW.description);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS dishes_search_vector ON dishes;
+CREATE TRIGGER dishes_search_vector BEFORE INSERT OR UPDATE OF title, description ON dishes
+FOR EACH ROW EXECUTE FUNCTION dishes_search_vector_trigger();
+
+-- Statement-level with transition tables: a bulk insert of ingredients
+-- recomputes each affected dish once instead of once per row
+CREATE OR REPLACE FUNCTION refresh_dish_search_vectors() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE dishes d SET search_vector = dish_search_vector(d.id, d.title, d.description)
+        WHERE d.id IN (SELECT dish_id FROM new_rows);
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE dishes d SET search_vector = dish_search_vector(d.id, d.title, d.description)
+        WHERE d.id IN (SELECT dish_id FROM old_rows);
+    ELSE
+        UPDATE dishes d SET search_vector = dish_search_vector(d.id, d.title, d.description)
+        WHERE d.id IN (SELECT dish_id FROM new_rows UNION SELECT dish_id FROM old_rows);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    table_name TEXT;
+BEGIN
+    FOREACH table_name IN ARRAY ARRAY['ingredients', 'steps'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', table_name || '_search_insert', table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', table_name || '_search_update', table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', table_name || '_search_delete', table_name);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS new_rows
+             FOR EACH STATEMENT EXECUTE FUNCTION refresh_dish_search_vectors()',
+            table_name || '_search_insert', table_name
+        );
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+             FOR EACH STATEMENT EXECUTE FUNCTION refresh_dish_search_vectors()',
+            table_name || '_search_update', table_name
+        );
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS old_rows
+             FOR EACH STATEMENT EXECUTE FUNCTION refresh_dish_search_vectors()',
+            table_name || '_search_delete', table_name
+        );
+    END LOOP;
+END;
+$$;
+
+-- One-shot backfill of existing rows
+UPDATE dishes SET search_vector = dish_search_vector(id, title, description);
+
+CREATE INDEX IF NOT EXISTS dishes_search_vector_idx ON dishes USING GIN (search_vector) WHERE is_moderated;
+CREATE INDEX IF NOT EXISTS dishes_title_trgm_idx ON dishes USING GIN (title gin_trgm_ops) WHERE is_moderated;
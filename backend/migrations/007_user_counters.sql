@@ -0,0 +1,100 @@
+-- Per-user counters shown on the profile page (/users/me), kept in step with
+-- menus, dishes and moderation by triggers so the profile is one primary-key
+-- lookup instead of three COUNT(*) queries. `flask reconcile-counters`
+-- recomputes them if they ever drift (e.g. after a TRUNCATE).
+
+CREATE TABLE IF NOT EXISTS user_counters (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    saved_menus INTEGER NOT NULL DEFAULT 0,
+    authored_recipes INTEGER NOT NULL DEFAULT 0,
+    moderated_recipes INTEGER NOT NULL DEFAULT 0
+);
+
+-- Statement-level with transition tables, like the search vector triggers.
+-- TG_ARGV: the table's user id column, the user_counters column it feeds and
+-- the condition a row must meet to be counted.
+CREATE OR REPLACE FUNCTION maintain_user_counter() RETURNS TRIGGER AS $$
+DECLARE
+    added TEXT := format('SELECT %I AS user_id, 1 AS delta FROM new_rows WHERE %s', TG_ARGV[0], TG_ARGV[2]);
+    removed TEXT := format('SELECT %I AS user_id, -1 AS delta FROM old_rows WHERE %s', TG_ARGV[0], TG_ARGV[2]);
+    changes TEXT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        changes := added;
+    ELSIF TG_OP = 'DELETE' THEN
+        changes := removed;
+    ELSE
+        changes := added || ' UNION ALL ' || removed;
+    END IF;
+    -- Rows are locked in user id order so concurrent statements cannot deadlock
+    EXECUTE format(
+        'INSERT INTO user_counters (user_id, %1$I)
+         SELECT c.user_id, sum(c.delta) FROM (%2$s) AS c
+         WHERE EXISTS (SELECT 1 FROM users u WHERE u.id = c.user_id)
+         GROUP BY c.user_id HAVING sum(c.delta) <> 0
+         ORDER BY c.user_id
+         ON CONFLICT (user_id) DO UPDATE SET %1$I = user_counters.%1$I + EXCLUDED.%1$I',
+        TG_ARGV[1], changes
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    counter RECORD;
+BEGIN
+    FOR counter IN
+        SELECT * FROM (VALUES
+            ('menus', 'user_id', 'saved_menus', 'removed IS NULL'),
+            ('dishes', 'author_id', 'authored_recipes', 'TRUE'),
+            ('moderation', 'moderator_id', 'moderated_recipes', 'TRUE')
+        ) AS c(table_name, user_column, counter_column, condition)
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', counter.table_name || '_counters_insert', counter.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', counter.table_name || '_counters_update', counter.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', counter.table_name || '_counters_delete', counter.table_name);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS new_rows
+             FOR EACH STATEMENT EXECUTE FUNCTION maintain_user_counter(%L, %L, %L)',
+            counter.table_name || '_counters_insert', counter.table_name,
+            counter.user_column, counter.counter_column, counter.condition
+        );
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+             FOR EACH STATEMENT EXECUTE FUNCTION maintain_user_counter(%L, %L, %L)',
+            counter.table_name || '_counters_update', counter.table_name,
+            counter.user_column, counter.counter_column, counter.condition
+        );
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS old_rows
+             FOR EACH STATEMENT EXECUTE FUNCTION maintain_user_counter(%L, %L, %L)',
+            counter.table_name || '_counters_delete', counter.table_name,
+            counter.user_column, counter.counter_column, counter.condition
+        );
+    END LOOP;
+END;
+$$;
+
+-- Recount every user and overwrite the counters that differ; returns the rows
+-- it changed. Callers lock user_counters first (see models/user_counters.py).
+CREATE OR REPLACE FUNCTION reconcile_user_counters()
+RETURNS TABLE (user_id INTEGER, saved_menus INTEGER, authored_recipes INTEGER, moderated_recipes INTEGER) AS $$
+    INSERT INTO user_counters AS uc (user_id, saved_menus, authored_recipes, moderated_recipes)
+    SELECT u.id, COALESCE(m.count, 0), COALESCE(d.count, 0), COALESCE(r.count, 0)
+    FROM users u
+    LEFT JOIN (SELECT user_id, count(*) FROM menus WHERE removed IS NULL GROUP BY user_id) m ON m.user_id = u.id
+    LEFT JOIN (SELECT author_id, count(*) FROM dishes GROUP BY author_id) d ON d.author_id = u.id
+    LEFT JOIN (SELECT moderator_id, count(*) FROM moderation GROUP BY moderator_id) r ON r.moderator_id = u.id
+    ORDER BY u.id
+    ON CONFLICT (user_id) DO UPDATE
+    SET saved_menus = EXCLUDED.saved_menus,
+        authored_recipes = EXCLUDED.authored_recipes,
+        moderated_recipes = EXCLUDED.moderated_recipes
+    WHERE (uc.saved_menus, uc.authored_recipes, uc.moderated_recipes)
+          IS DISTINCT FROM (EXCLUDED.saved_menus, EXCLUDED.authored_recipes, EXCLUDED.moderated_recipes)
+    RETURNING uc.user_id, uc.saved_menus, uc.authored_recipes, uc.moderated_recipes
+$$ LANGUAGE SQL;
+
+-- One-shot backfill of existing users
+SELECT count(*) FROM reconcile_user_counters();
@@ -0,0 +1,23 @@
+-- Usernames and recipe titles are unique regardless of case. The expression
+-- indexes also serve the availability lookups in models/availability.py.
+
+DO $$
+DECLARE
+    duplicates TEXT;
+BEGIN
+    SELECT string_agg(name, ', ') INTO duplicates
+    FROM (SELECT lower(username) AS name FROM users GROUP BY 1 HAVING count(*) > 1) AS d;
+    IF duplicates IS NOT NULL THEN
+        RAISE EXCEPTION 'usernames differing only in case must be renamed first: %', duplicates;
+    END IF;
+
+    SELECT string_agg(name, ', ') INTO duplicates
+    FROM (SELECT lower(title) AS name FROM dishes GROUP BY 1 HAVING count(*) > 1) AS d;
+    IF duplicates IS NOT NULL THEN
+        RAISE EXCEPTION 'recipe titles differing only in case must be renamed first: %', duplicates;
+    END IF;
+END;
+$$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS users_username_lower_key ON users (lower(username));
+CREATE UNIQUE INDEX IF NOT EXISTS dishes_title_lower_key ON dishes (lower(title));
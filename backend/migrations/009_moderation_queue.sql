@@ -0,0 +1,49 @@
+-- Work queue of recipes awaiting moderation. A row exists exactly while its
+-- dish is unmoderated; moderators lease rows (models/moderation_queue.py) so
+-- two of them never work on, or publish, the same recipe.
+
+CREATE TABLE IF NOT EXISTS moderation_queue (
+    dish_id INTEGER PRIMARY KEY REFERENCES dishes(id) ON DELETE CASCADE,
+    lease_owner INTEGER REFERENCES users(id) ON DELETE SET NULL,
+    lease_expires TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION enqueue_new_dishes() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO moderation_queue (dish_id)
+    SELECT id FROM new_rows WHERE NOT is_moderated
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS dishes_queue_insert ON dishes;
+CREATE TRIGGER dishes_queue_insert AFTER INSERT ON dishes REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION enqueue_new_dishes();
+
+CREATE OR REPLACE FUNCTION requeue_dish() RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.is_moderated THEN
+        DELETE FROM moderation_queue WHERE dish_id = NEW.id;
+    ELSE
+        INSERT INTO moderation_queue (dish_id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS dishes_queue_update ON dishes;
+CREATE TRIGGER dishes_queue_update AFTER UPDATE OF is_moderated ON dishes
+FOR EACH ROW WHEN (OLD.is_moderated IS DISTINCT FROM NEW.is_moderated)
+EXECUTE FUNCTION requeue_dish();
+
+-- Leases change the moderation pages, so they take part in the ETags too
+DROP TRIGGER IF EXISTS moderation_queue_version ON moderation_queue;
+CREATE TRIGGER moderation_queue_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON moderation_queue
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+INSERT INTO table_versions (name) VALUES ('moderation_queue') ON CONFLICT DO NOTHING;
+
+-- One-shot backfill of the current submissions
+INSERT INTO moderation_queue (dish_id)
+SELECT id FROM dishes WHERE NOT is_moderated
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,56 @@
+-- Table versions from sequences instead of the table_versions rows: an
+-- UPSERT on the row locked it until commit, so every writer to a table queued
+-- behind the others. nextval() takes no row lock and is never rolled back.
+--
+-- The bump is a deferred constraint trigger, so it happens just before commit
+-- rather than at the first write of a long transaction, which keeps the window
+-- where a reader pairs the new version with the old data down to the commit
+-- itself. It runs once per table per transaction, however many rows the
+-- transaction wrote.
+
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS TRIGGER AS $$
+BEGIN
+    IF current_setting('tastyspace.version_bumped_' || TG_TABLE_NAME, TRUE) IS DISTINCT FROM 'on' THEN
+        -- Transaction-local: reset on commit or rollback
+        PERFORM set_config('tastyspace.version_bumped_' || TG_TABLE_NAME, 'on', TRUE);
+        PERFORM nextval(('table_version_' || TG_TABLE_NAME)::regclass);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bump_table_version_now() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM nextval(('table_version_' || TG_TABLE_NAME)::regclass);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    counter RECORD;
+BEGIN
+    FOR counter IN SELECT name, version FROM table_versions LOOP
+        -- Continue from the old counter so ETags handed out before stay distinct
+        EXECUTE format('CREATE SEQUENCE IF NOT EXISTS %I', 'table_version_' || counter.name);
+        PERFORM setval(('table_version_' || counter.name)::regclass, counter.version + 1);
+
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', counter.name || '_version', counter.name);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', counter.name || '_version_truncate', counter.name);
+        EXECUTE format(
+            'CREATE CONSTRAINT TRIGGER %I AFTER INSERT OR UPDATE OR DELETE ON %I
+             DEFERRABLE INITIALLY DEFERRED
+             FOR EACH ROW EXECUTE FUNCTION bump_table_version()',
+            counter.name || '_version', counter.name
+        );
+        -- Constraint triggers cannot fire on TRUNCATE
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER TRUNCATE ON %I
+             FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version_now()',
+            counter.name || '_version_truncate', counter.name
+        );
+    END LOOP;
+END;
+$$;
+
+DROP TABLE table_versions;
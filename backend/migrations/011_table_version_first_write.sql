@@ -0,0 +1,51 @@
+-- Queue the commit-time version bump once per table per transaction instead of
+-- once per row. The constraint triggers from 010 queued a deferred event for
+-- every written row and dropped all but the first at commit, so a bulk import
+-- of a million ingredient rows kept a million events in memory and ran the
+-- trigger function a million times at commit.
+--
+-- A constraint trigger's WHEN condition is evaluated right after each row is
+-- written, and a row that fails it queues nothing. The condition below is
+-- true only for the first row of the table in the transaction, so what a row
+-- costs is one function call, without any queued event. The flag is
+-- transaction-local (and undone with a rolled back savepoint, together with
+-- the event it queued).
+
+CREATE OR REPLACE FUNCTION table_version_first_write(table_name TEXT) RETURNS BOOLEAN AS $$
+BEGIN
+    IF current_setting('tastyspace.version_bumped_' || table_name, TRUE) = 'on' THEN
+        RETURN FALSE;
+    END IF;
+    PERFORM set_config('tastyspace.version_bumped_' || table_name, 'on', TRUE);
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql VOLATILE;
+
+-- The WHEN condition already deduplicates
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM nextval(('table_version_' || TG_TABLE_NAME)::regclass);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    counter RECORD;
+BEGIN
+    FOR counter IN
+        SELECT substr(sequencename, length('table_version_') + 1) AS name
+        FROM pg_sequences
+        WHERE schemaname = current_schema() AND sequencename LIKE 'table\_version\_%'
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', counter.name || '_version', counter.name);
+        EXECUTE format(
+            'CREATE CONSTRAINT TRIGGER %I AFTER INSERT OR UPDATE OR DELETE ON %I
+             DEFERRABLE INITIALLY DEFERRED
+             FOR EACH ROW WHEN (table_version_first_write(%L))
+             EXECUTE FUNCTION bump_table_version()',
+            counter.name || '_version', counter.name, counter.name
+        );
+    END LOOP;
+END;
+$$;
@@ -1,5 +1,5 @@
 from psycopg2.extras import RealDictCursor
-import inflect
+from models.ingredient_dictionary import to_display_unit
 
 category_headings = {
     'meat': "Meat & Chicken",
@@ -34,55 +34,39 @@ category_headings = {
     'other': "Other"
 }
 
-p = inflect.engine()
-
-def normalize_name(name):
-    words = name.lower().split()
-    normalized_words = [p.singular_noun(word) or word for word in words]
-    return ' '.join(normalized_words)
-
 def format_amount(amount):
     return '{:.2f}'.format(amount).rstrip('0').rstrip('.')
 
+# Names and units are canonical since write time (see models/ingredient_dictionary.py);
+# rows not backfilled yet fall back to their raw name and measurement
+AGGREGATE_QUERY = """
+    SELECT COALESCE(c.name, LOWER(i.name)) AS name,
+           SUM(COALESCE(i.unit_amount, i.amount)) AS amount,
+           COALESCE(i.unit, i.measurement) AS unit,
+           MAX(i.category) AS category
+    FROM ingredients i
+    LEFT JOIN canonical_ingredients c ON c.id = i.ingredient_id
+    WHERE i.dish_id = ANY(%s)
+    GROUP BY i.ingredient_id, COALESCE(c.name, LOWER(i.name)), COALESCE(i.unit, i.measurement)
+    ORDER BY name, unit
+"""
+
 def aggregate_ingredients(db, dish_ids):
     cursor = db.cursor(cursor_factory=RealDictCursor)
-    
-    query = """
-        SELECT LOWER(name) as name, SUM(amount) as amount, measurement, category
-        FROM ingredients
-        WHERE dish_id = ANY(%s)
-        GROUP BY LOWER(name), measurement, category
-    """
-    cursor.execute(query, (dish_ids,))
-    ingredients = cursor.fetchall()
+    cursor.execute(AGGREGATE_QUERY, (dish_ids,))
+    return group_ingredients(cursor.fetchall())
 
+def group_ingredients(ingredients):
+    """Shopping list sections from the rows of AGGREGATE_QUERY"""
     grouped_ingredients = {}
     for ingredient in ingredients:
-        ingredient_name = normalize_name(ingredient['name'])
         category_heading = category_headings.get(ingredient['category'], "Other")
-        if category_heading not in grouped_ingredients:
-            grouped_ingredients[category_heading] = []
-        
-        existing = next((item for item in grouped_ingredients[category_heading] if item['name'] == ingredient_name and item['measurement'] == ingredient['measurement']), None)
-        
-        if existing:
-            existing_amount_before = existing['amount']
-            existing['amount'] += ingredient['amount']
-            print(f"Updated ingredient: {ingredient['name']}, measurement: {ingredient['measurement']}, from {existing_amount_before} to {existing['amount']}")
-        else:
-            grouped_ingredients[category_heading].append({
-                'name': ingredient_name,
-                'amount': ingredient['amount'],
-                'measurement': ingredient['measurement'],
-                'category': ingredient['category']
-            })
-            print(f"Added new ingredient: {ingredient['name']}, measurement: {ingredient['measurement']}, amount: {ingredient['amount']}")
-
-    for category in grouped_ingredients:
-        for ingredient in grouped_ingredients[category]:
-            ingredient['amount'] = format_amount(ingredient['amount'])
+        amount, measurement = to_display_unit(ingredient['amount'] or 0, ingredient['unit'])
+        grouped_ingredients.setdefault(category_heading, []).append({
+            'name': ingredient['name'],
+            'amount': format_amount(amount),
+            'measurement': measurement,
+            'category': ingredient['category']
+        })
 
-    for category in grouped_ingredients:
-        grouped_ingredients[category].sort(key=lambda x: (x['name'], x['measurement']))
-            
     return grouped_ingredients
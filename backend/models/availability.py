@@ -0,0 +1,124 @@
+import hashlib
+import math
+import threading
+import time
+from psycopg2.extras import RealDictCursor
+from conditional import table_versions
+
+
+class BloomFilter:
+    """Set membership with false positives but no false negatives"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def name_key(name):
+    return name.lower()
+
+# Usernames are unique case-insensitively, so logging in ignores case as well;
+# also planned by warmup.py
+LOGIN_QUERY = "SELECT id FROM users WHERE lower(username) = lower(%s) AND password = %s"
+
+
+class NameIndex:
+    """Answers "is this name taken?" for one case-insensitively unique column.
+
+    A Bloom filter over the existing names answers most checks of free names
+    without a query; names it may contain are looked up through the lower()
+    index from migrations/008_case_insensitive_names.sql. Names inserted in
+    this process are added right away. Every check first reads the table's
+    version (migrations/010_table_version_sequences.sql) and rebuilds the
+    filter when it moved, which is how names committed by other workers reach
+    it; the filter is also rebuilt once it is older than `ttl`. The unique
+    index stays the final word on insert.
+    """
+
+    def __init__(self, table, column, ttl=60.0, error_rate=0.01):
+        self.table = table
+        self.column = column
+        self.ttl = ttl
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._bloom = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._added = []
+
+    def version(self, db):
+        return table_versions(db, self.table)
+
+    def load(self, db):
+        started = time.monotonic()
+        # Read before the names: a write committed in between moves the version
+        # again, so the next check rebuilds instead of trusting this filter
+        version = self.version(db)
+        cursor = db.cursor()
+        cursor.execute(f"SELECT {self.column} FROM {self.table}")
+        names = [row[0] for row in cursor.fetchall()]
+        # Room to grow until the next reload
+        bloom = BloomFilter(2 * len(names) + 1024, self.error_rate)
+        for name in names:
+            bloom.add(name_key(name))
+
+        with self._lock:
+            # Replay names added while the query ran; the result may predate them
+            for key, added_at in self._added:
+                if added_at >= started:
+                    bloom.add(key)
+            self._added = []
+            self._bloom = bloom
+            self._version = version
+            self._loaded_at = time.monotonic()
+        return bloom
+
+    def bloom(self, db):
+        version = self.version(db)
+        loaded_at = self._loaded_at
+        if self._bloom is None or version != self._version or time.monotonic() - loaded_at > self.ttl:
+            # One rebuild at a time; requests that waited for it use its result
+            with self._reload_lock:
+                if self._loaded_at == loaded_at:
+                    self.load(db)
+        return self._bloom
+
+    def add(self, name):
+        """Record a name this process just inserted"""
+        key = name_key(name)
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(key)
+            self._added.append((key, time.monotonic()))
+
+    def taken(self, db, names):
+        """The subset of `names` (compared case-insensitively) already in use"""
+        bloom = self.bloom(db)
+        maybe = {name_key(name) for name in names if name_key(name) in bloom}
+        if not maybe:
+            return set()
+        cursor = db.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(f"SELECT lower({self.column}) AS name FROM {self.table} WHERE lower({self.column}) = ANY(%s)",
+                       (list(maybe),))
+        used = {row['name'] for row in cursor.fetchall()}
+        return {name for name in names if name_key(name) in used}
+
+
+usernames = NameIndex('users', 'username')
+titles = NameIndex('dishes', 'title')
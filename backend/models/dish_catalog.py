@@ -0,0 +1,292 @@
+import logging
+import threading
+import time
+from functools import lru_cache
+from psycopg2.extras import RealDictCursor
+from db import get_pool
+from models.ingredient_dictionary import normalize_name
+
+logger = logging.getLogger('tastyspace.catalog')
+
+# Index key -> array column holding the dish's values for it
+LIST_FIELDS = {
+    'category': 'categories',
+    'dinner_time': 'dinner_times',
+    'season': 'seasons',
+    'cuisine': 'cuisines',
+}
+
+# Columns of a catalog dish; search_vector and other internal columns stay out of API responses
+DISH_COLUMNS = ('id', 'title', 'description', 'image_url', 'author_id', 'type', 'side_dish', 'category', 'cuisine',
+                'season', 'cooking_time', 'dinner_time', 'created', 'edited', 'is_moderated',
+                'categories', 'dinner_times', 'seasons', 'cuisines')
+
+# Distinct course lookups remembered per snapshot; the keys come from request
+# parameters, so the memo is bounded
+CANDIDATE_CACHE_SIZE = 1024
+
+# Ingredient categories a pantry is assumed to have (salt, pepper, spices)
+STAPLE_CATEGORIES = ('seasoning',)
+
+INGREDIENTS_QUERY = '''
+    SELECT i.dish_id, i.name, i.category, i.is_main, c.name AS canonical_name
+    FROM ingredients i
+    LEFT JOIN canonical_ingredients c ON c.id = i.ingredient_id
+'''
+
+CATALOG_DISHES_QUERY = f"SELECT {', '.join(DISH_COLUMNS)} FROM dishes WHERE is_moderated = TRUE ORDER BY id"
+CATALOG_INGREDIENTS_QUERY = INGREDIENTS_QUERY + '''
+    JOIN dishes d ON d.id = i.dish_id
+    WHERE d.is_moderated = TRUE
+'''
+
+# Positions of the set bits in every possible byte, used to turn a bitset back into slots
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+def split_list(value):
+    """Normalize a comma-separated attribute string (or a list of values) the way split_attribute_list() does in SQL"""
+    if not value:
+        return ()
+    items = value.split(',') if isinstance(value, str) else value
+    return tuple(item.strip().lower() for item in items if item.strip())
+
+def index_keys(dish):
+    keys = [('type', dish['type']), ('cooking_time', dish['cooking_time'])]
+    for field, column in LIST_FIELDS.items():
+        keys.extend((field, item) for item in dish[column] or ())
+    return keys
+
+def bitset_slots(mask):
+    slots = []
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+    for offset, byte in enumerate(data):
+        if byte:
+            base = offset * 8
+            slots.extend(base + bit for bit in _BYTE_BITS[byte])
+    return slots
+
+
+def ingredient_name(row):
+    return row['canonical_name'] or normalize_name(row['name'] or '')
+
+
+class CatalogSnapshot:
+    """Immutable view of the moderated dishes.
+
+    Every dish occupies a slot; each attribute value maps to a bitset (a Python
+    int) of the slots that carry it, so a course lookup is a handful of AND/OR
+    operations instead of a LIKE scan over the dishes table. Main ingredients
+    are indexed the same way (canonical name -> bitset) for pantry matching.
+    """
+
+    def __init__(self):
+        self.dishes = []
+        self.main_categories = []
+        self.main_ingredients = []
+        self.ingredients = []
+        self.staples = []
+        self.slots = {}
+        self.masks = {}
+        self.ingredient_masks = {}
+        self._candidates = lru_cache(maxsize=CANDIDATE_CACHE_SIZE)(self._lookup_slots)
+
+    def copy(self):
+        snapshot = CatalogSnapshot()
+        snapshot.dishes = list(self.dishes)
+        snapshot.main_categories = list(self.main_categories)
+        snapshot.main_ingredients = list(self.main_ingredients)
+        snapshot.ingredients = list(self.ingredients)
+        snapshot.staples = list(self.staples)
+        snapshot.slots = dict(self.slots)
+        snapshot.masks = dict(self.masks)
+        snapshot.ingredient_masks = dict(self.ingredient_masks)
+        return snapshot
+
+    def add(self, dish, ingredients):
+        slot = len(self.dishes)
+        bit = 1 << slot
+        names = frozenset(ingredient_name(row) for row in ingredients)
+        # A dish without flagged main ingredients is matched on all of them
+        main = frozenset(ingredient_name(row) for row in ingredients if row['is_main']) or names
+        self.dishes.append(dish)
+        self.main_categories.append(tuple(row['category'] for row in ingredients if row['is_main']))
+        self.main_ingredients.append(main)
+        self.ingredients.append(names)
+        self.staples.append(frozenset(ingredient_name(row) for row in ingredients if row['category'] in STAPLE_CATEGORIES))
+        self.slots[dish['id']] = slot
+        for key in index_keys(dish):
+            self.masks[key] = self.masks.get(key, 0) | bit
+        for name in main:
+            self.ingredient_masks[name] = self.ingredient_masks.get(name, 0) | bit
+
+    def remove(self, dish_id):
+        slot = self.slots.pop(dish_id, None)
+        if slot is None:
+            return
+        bit = 1 << slot
+        for key in index_keys(self.dishes[slot]):
+            self.masks[key] &= ~bit
+        for name in self.main_ingredients[slot]:
+            self.ingredient_masks[name] &= ~bit
+        self.dishes[slot] = None
+        self.main_categories[slot] = ()
+        self.main_ingredients[slot] = frozenset()
+        self.ingredients[slot] = frozenset()
+        self.staples[slot] = frozenset()
+
+    def pantry_matches(self, pantry, ignore_staples=True):
+        """slot -> (share of main ingredients in `pantry`, missing ingredient names) for every dish
+        with at least one of its main ingredients in the pantry"""
+        mask = 0
+        for name in pantry:
+            mask |= self.ingredient_masks.get(name, 0)
+        matches = {}
+        for slot in bitset_slots(mask):
+            main = self.main_ingredients[slot]
+            missing = self.ingredients[slot] - pantry
+            if ignore_staples:
+                missing -= self.staples[slot]
+            matches[slot] = (len(main & pantry) / len(main), missing)
+        return matches
+
+    def mask(self, field, values):
+        mask = 0
+        for value in values:
+            mask |= self.masks.get((field, value), 0)
+        return mask
+
+    def candidates(self, types, dinner_category, dinner_time, cooking_time, season, cuisines):
+        # A published snapshot never changes, so lookups are memoized and shared
+        # by every menu (and menu variant) built from it
+        return self._candidates(tuple(types), dinner_category, dinner_time, cooking_time, season, frozenset(cuisines))
+
+    def _lookup_slots(self, *key):
+        return tuple(self._lookup(*key))
+
+    def _lookup(self, types, dinner_category, dinner_time, cooking_time, season, cuisines):
+        mask = self.mask('type', types)
+        mask &= self.mask('category', (dinner_category,))
+        mask &= self.mask('dinner_time', (dinner_time,))
+        mask &= self.mask('cooking_time', [t for (field, t) in self.masks if field == 'cooking_time' and t is not None and t <= cooking_time])
+        mask &= self.mask('season', (season, 'all seasons'))
+        mask &= self.mask('cuisine', ('universal', *cuisines))
+        return bitset_slots(mask) if mask else []
+
+
+class DishCatalog:
+    """Process-local catalog of moderated dishes used to assemble menus without SQL.
+
+    Writes in this process refresh single dishes in place; changes made by other
+    workers are picked up by a full reload once the snapshot is older than `ttl`.
+    That reload runs in a background thread, one at a time, while requests keep
+    using the expired snapshot; only a process without any snapshot loads it in
+    the request (and then also just one request does).
+    """
+
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._snapshot = None
+        self._loaded_at = 0.0
+        self._reloading = False
+
+    def load(self, db):
+        cursor = db.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(CATALOG_DISHES_QUERY)
+        dishes = cursor.fetchall()
+        cursor.execute(CATALOG_INGREDIENTS_QUERY)
+        return self.load_rows(dishes, cursor.fetchall())
+
+    def load_rows(self, dishes, ingredient_rows):
+        """Build and publish a snapshot from the rows of the two catalog queries"""
+        ingredients = {}
+        for row in ingredient_rows:
+            ingredients.setdefault(row['dish_id'], []).append(row)
+
+        snapshot = CatalogSnapshot()
+        for dish in dishes:
+            snapshot.add(dish, ingredients.get(dish['id'], ()))
+
+        with self._lock:
+            self._snapshot = snapshot
+            self._loaded_at = time.monotonic()
+        return snapshot
+
+    def fresh_snapshot(self):
+        """The current snapshot, or None when there is none or it is older than `ttl`"""
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - self._loaded_at > self.ttl:
+            return None
+        return snapshot
+
+    def snapshot(self, db):
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._load_lock:
+                snapshot = self._snapshot
+                if snapshot is None:
+                    snapshot = self.load(db)
+        elif time.monotonic() - self._loaded_at > self.ttl:
+            self.reload_in_background()
+        return snapshot
+
+    def reload_in_background(self):
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, name='dish-catalog-reload', daemon=True).start()
+
+    def _reload(self):
+        try:
+            pool = get_pool()
+            conn = pool.getconn()
+            try:
+                with self._load_lock:
+                    self.load(conn)
+            finally:
+                pool.putconn(conn)
+        except Exception:
+            # The expired snapshot stays in use; the next request tries again
+            logger.exception('Reloading the dish catalog failed')
+        finally:
+            with self._lock:
+                self._reloading = False
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def refresh_dish(self, db, dish_id):
+        if self._snapshot is None:
+            return
+        try:
+            cursor = db.cursor(cursor_factory=RealDictCursor)
+            cursor.execute(f"SELECT {', '.join(DISH_COLUMNS)} FROM dishes WHERE id = %s AND is_moderated = TRUE", (dish_id,))
+            dish = cursor.fetchone()
+            cursor.execute(INGREDIENTS_QUERY + "WHERE i.dish_id = %s", (dish_id,))
+            ingredients = cursor.fetchall()
+        except Exception:
+            self.invalidate()
+            return
+
+        with self._lock:
+            if self._snapshot is None:
+                return
+            snapshot = self._snapshot.copy()
+            snapshot.remove(dish_id)
+            if dish is not None:
+                snapshot.add(dish, ingredients)
+            self._snapshot = snapshot
+
+    def remove_dish(self, dish_id):
+        with self._lock:
+            if self._snapshot is None or dish_id not in self._snapshot.slots:
+                return
+            snapshot = self._snapshot.copy()
+            snapshot.remove(dish_id)
+            self._snapshot = snapshot
+
+
+catalog = DishCatalog()
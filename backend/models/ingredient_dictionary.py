@@ -0,0 +1,109 @@
+import re
+from functools import lru_cache
+from psycopg2.extras import execute_values
+
+# measurement -> (canonical unit, factor to convert into it)
+UNIT_CONVERSIONS = {
+    'g': ('g', 1),
+    'kg': ('g', 1000),
+    'ml': ('ml', 1),
+    'l': ('ml', 1000),
+    'tsp': ('tsp', 1),
+    'tbsp': ('tsp', 3),
+    'cup': ('tsp', 48),
+}
+
+# Units a canonical amount may be shown in, largest first
+DISPLAY_UNITS = {
+    'g': (('kg', 1000), ('g', 1)),
+    'ml': (('l', 1000), ('ml', 1)),
+    'tsp': (('cup', 48), ('tbsp', 3), ('tsp', 1)),
+}
+
+# Importing inflect costs more than the rest of the app's models together, so it
+# is deferred to the first lookup (warmup.py does that before a worker takes traffic)
+@lru_cache(maxsize=None)
+def inflect_engine():
+    import inflect
+    return inflect.engine()
+
+@lru_cache(maxsize=8192)
+def normalize_name(name):
+    name = re.sub(r'\(.*?\)', ' ', name.lower())
+    words = name.split()
+    engine = inflect_engine()
+    normalized_words = [engine.singular_noun(word) or word for word in words]
+    return ' '.join(normalized_words)
+
+def to_canonical_unit(amount, measurement):
+    measurement = (measurement or '').strip().lower()
+    unit, factor = UNIT_CONVERSIONS.get(measurement, (measurement, 1))
+    try:
+        return unit, float(amount) * factor
+    except (TypeError, ValueError):
+        return unit, None
+
+def to_display_unit(amount, unit):
+    """Largest unit in which the amount is a whole number of quarters, e.g. 1500 g -> 1.5 kg, 6 tsp -> 2 tbsp"""
+    for display_unit, factor in DISPLAY_UNITS.get(unit, ()):
+        value = amount / factor
+        if value >= 1 and abs(value * 4 - round(value * 4)) < 1e-6:
+            return value, display_unit
+    return amount, unit
+
+def resolve_ingredients(cursor, names):
+    """Map raw ingredient names to canonical ingredient ids, creating missing entries"""
+    canonical = {name: normalize_name(name) for name in names if name}
+    values = sorted(set(canonical.values()))
+    if not values:
+        return {}
+    # A plain cursor on the same connection (and transaction): callers may pass a RealDictCursor
+    cursor = cursor.connection.cursor()
+    cursor.execute('''
+        WITH created AS (
+            INSERT INTO canonical_ingredients (name)
+            SELECT unnest(%s::text[])
+            ON CONFLICT (name) DO NOTHING
+            RETURNING id, name
+        )
+        SELECT id, name FROM created
+        UNION ALL
+        SELECT id, name FROM canonical_ingredients WHERE name = ANY(%s)
+    ''', (values, values))
+    ids = {name: ingredient_id for ingredient_id, name in cursor.fetchall()}
+    missing = [value for value in values if value not in ids]
+    if missing:
+        # Inserted by a concurrent transaction that committed while this statement
+        # waited on the conflict: invisible to its snapshot, visible to a new one
+        cursor.execute("SELECT id, name FROM canonical_ingredients WHERE name = ANY(%s)", (missing,))
+        ids.update((name, ingredient_id) for ingredient_id, name in cursor.fetchall())
+    return {name: ids[value] for name, value in canonical.items()}
+
+def backfill_ingredients(db, batch_size=1000):
+    """Resolve ingredient rows written before the dictionary existed; returns the number of rows updated"""
+    cursor = db.cursor()
+    updated = 0
+    while True:
+        cursor.execute('''
+            SELECT id, name, amount, measurement FROM ingredients
+            WHERE ingredient_id IS NULL AND name IS NOT NULL AND btrim(name) <> ''
+            ORDER BY id
+            LIMIT %s
+        ''', (batch_size,))
+        rows = cursor.fetchall()
+        if not rows:
+            return updated
+
+        ingredient_ids = resolve_ingredients(cursor, [name for _, name, _, _ in rows])
+        values = []
+        for row_id, name, amount, measurement in rows:
+            unit, unit_amount = to_canonical_unit(amount, measurement)
+            values.append((row_id, ingredient_ids[name], unit, unit_amount))
+        execute_values(cursor, '''
+            UPDATE ingredients AS i
+            SET ingredient_id = v.ingredient_id, unit = v.unit, unit_amount = v.unit_amount
+            FROM (VALUES %s) AS v(id, ingredient_id, unit, unit_amount)
+            WHERE i.id = v.id
+        ''', values, template='(%s, %s, %s, %s::real)')
+        db.commit()
+        updated += len(rows)
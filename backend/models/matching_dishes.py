@@ -1,5 +1,9 @@
 from datetime import datetime
-from psycopg2.extras import RealDictCursor
+import random
+from models.dish_catalog import catalog as dish_catalog
+
+# How many draws per requested variant before giving up on finding more distinct menus
+MENU_VARIANT_ATTEMPTS = 5
 
 def get_current_season():
     month = datetime.now().month
@@ -12,78 +16,43 @@ def get_current_season():
     else:
         return 'winter'
     
-def get_main_ingredient_categories(dish_id, db):
-    cursor = db.cursor(cursor_factory=RealDictCursor)
-    query = """
-        SELECT category FROM ingredients
-        WHERE dish_id = %s AND is_main = true
-    """
-    cursor.execute(query, (dish_id,))
-    ingredients = cursor.fetchall()
-    return [ingredient['category'] for ingredient in ingredients]
-
-def select_dish(types, db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, allow_repeats=False):
-    cursor = db.cursor(cursor_factory=RealDictCursor)
+def select_dish(types, catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng=random):
     current_season = get_current_season()
     if dinner_time == 'later':
         dinner_time = 'tomorrow'
-    query = """
-        SELECT * FROM dishes
-        WHERE type IN %s 
-        AND category LIKE %s 
-        AND dinner_time LIKE %s 
-        AND cooking_time <= %s 
-        AND (season LIKE %s OR season = 'all seasons')
-        AND (
-            cuisine = 'universal'  
-            OR EXISTS (            
-                SELECT 1 
-                FROM unnest(string_to_array(cuisine, ', ')) AS c
-                WHERE c = ANY(%s)
-            )
-        )
-        ORDER BY RANDOM() LIMIT 1
-    """
+    slots = catalog.candidates(types, dinner_category, dinner_time, cooking_time, current_season, current_cuisines)
+    slots = rng.sample(slots, len(slots))
+
     selected_dish_ids = {dish['id'] for dish in menu}
-    cursor.execute(query, (types, '%' + dinner_category + '%', '%' + dinner_time + '%', cooking_time, '%' + current_season + '%', list(current_cuisines)))
-    dishes = cursor.fetchall()
-    
-    for dish in dishes:
+    repeat = None
+    for slot in slots:
+        dish = catalog.dishes[slot]
         if dish['id'] in selected_dish_ids:
             continue
-        
-        dish_main_categories = get_main_ingredient_categories(dish['id'], db)
-        
-        if allow_repeats:
-            main_ingredient_categories.extend(dish_main_categories)
-            return dish
-        
-        category_counts = {category: main_ingredient_categories.count(category) for category in dish_main_categories}
 
-        is_allowed = True
-        for count in category_counts.values():
-            if count != 0:
-                is_allowed = False
-                break
+        dish_main_categories = catalog.main_categories[slot]
+        if any(category in main_ingredient_categories for category in dish_main_categories):
+            # Keep the first dish that repeats a main ingredient in case nothing better turns up
+            if repeat is None:
+                repeat = (dish, dish_main_categories)
+            continue
 
-        if is_allowed:
-            main_ingredient_categories.extend(dish_main_categories)
-            return dish
+        main_ingredient_categories.extend(dish_main_categories)
+        return dish
+
+    if repeat is not None:
+        dish, dish_main_categories = repeat
+        main_ingredient_categories.extend(dish_main_categories)
+        return dish
 
-    if not allow_repeats:
-        return select_dish(types, db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, allow_repeats=True)
-    
     return None
 
 def update_current_cuisines(dish, current_cuisines):
-    if dish['cuisine'] != 'universal':
-        dish_cuisines = set(dish['cuisine'].split(', '))
-        current_cuisines.intersection_update(dish_cuisines)
-
-def add_dish(types, db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories):
-    dish = select_dish(types, db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, allow_repeats=False)
-    if dish is None:
-        dish = select_dish(types, db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, allow_repeats=True)
+    if 'universal' not in dish['cuisines']:
+        current_cuisines.intersection_update(dish['cuisines'])
+
+def add_dish(types, catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng=random):
+    dish = select_dish(types, catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
     if dish is not None:
         menu.append(dish)
         update_current_cuisines(dish, current_cuisines)
@@ -101,99 +70,126 @@ def sort_menu_by_type(menu):
     }
     return sorted(menu, key=lambda dish: type_order.get(dish['type'], float('inf')))
 
-def find_matching_dishes(db, dinner_category, dinner_time, cooking_time):
+def find_matching_dishes(db, dinner_category, dinner_time, cooking_time, rng=random, catalog=None):
+    if catalog is None:
+        catalog = dish_catalog.snapshot(db)
     menu = []
     current_cuisines = {'european', 'asian', 'mediterranean', 'russian', 'italian', 'mexican'}
     main_ingredient_categories = []
 
     if dinner_category == 'weeknight':
-        add_dish(('main dish',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+        add_dish(('main dish',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
         if menu and menu[-1]['side_dish']:
-            add_dish(('side dish',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('side dish',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
         if cooking_time == 1:
-            add_dish(('salad', 'soup'), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('salad', 'soup'), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
         if cooking_time == 2:
-            add_dish(('salad',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
-            add_dish(('soup',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('salad',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
+            add_dish(('soup',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
     elif dinner_category == 'family':
-        add_dish(('main dish',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+        add_dish(('main dish',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
         if menu and menu[-1]['side_dish']:
-            add_dish(('side dish',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('side dish',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
-        add_dish(('salad',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
-        add_dish(('soup',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+        add_dish(('salad',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
+        add_dish(('soup',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
         if cooking_time == 3:
-            add_dish(('starter', 'desert'), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('starter', 'desert'), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
             
         if cooking_time == 4:
-            add_dish(('starter',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
-            add_dish(('desert',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('starter',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
+            add_dish(('desert',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
     elif dinner_category == 'guest':
-        add_dish(('soup', 'main dish'), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+        add_dish(('soup', 'main dish'), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
         if menu and menu[-1]['side_dish']:
-            add_dish(('side dish',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('side dish',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
                 
-        add_dish(('salad',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
-        add_dish(('salad',), db, dinner_category, dinner_time, 1, current_cuisines, menu, main_ingredient_categories)
-        add_dish(('starter',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+        add_dish(('salad',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
+        add_dish(('salad',), catalog, dinner_category, dinner_time, 1, current_cuisines, menu, main_ingredient_categories, rng)
+        add_dish(('starter',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
         if cooking_time >= 3:
-            add_dish(('desert',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('desert',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
             if dinner_time != 'today':
-                add_dish(('salad', 'starter'), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+                add_dish(('salad', 'starter'), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
                 if dinner_time == 'later':
-                    add_dish(('hot starter', 'starter'), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+                    add_dish(('hot starter', 'starter'), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
     elif dinner_category == 'festive':
-        add_dish(('main dish',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+        add_dish(('main dish',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
         if menu and menu[-1]['side_dish']:
-            add_dish(('side dish',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('side dish',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
         for i in range(2):
-            add_dish(('appetizer',), db, dinner_category, dinner_time, 1, current_cuisines, menu, main_ingredient_categories)
-            add_dish(('salad',), db, dinner_category, dinner_time, 1, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('appetizer',), catalog, dinner_category, dinner_time, 1, current_cuisines, menu, main_ingredient_categories, rng)
+            add_dish(('salad',), catalog, dinner_category, dinner_time, 1, current_cuisines, menu, main_ingredient_categories, rng)
         
-        add_dish(('appetizer',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
-        add_dish(('salad',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
-        add_dish(('desert',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+        add_dish(('appetizer',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
+        add_dish(('salad',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
+        add_dish(('desert',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
         if cooking_time == 4:
-            add_dish(('appetizer', 'starter'), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
-            add_dish(('starter', 'hot starter'), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('appetizer', 'starter'), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
+            add_dish(('starter', 'hot starter'), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
         if dinner_time == 'later':
-            add_dish(('salad', 'starter'), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('salad', 'starter'), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
     elif dinner_category == 'romantic':
         for i in range(3):
-            add_dish(('appetizer',), db, dinner_category, dinner_time, 1, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('appetizer',), catalog, dinner_category, dinner_time, 1, current_cuisines, menu, main_ingredient_categories, rng)
 
-        add_dish(('salad',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
-        add_dish(('desert',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+        add_dish(('salad',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
+        add_dish(('desert',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
         if cooking_time == 2:
-            add_dish(('appetizer',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('appetizer',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
         elif cooking_time == 3:
-            add_dish(('main dish', 'soup', 'hot starter'), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('main dish', 'soup', 'hot starter'), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
             if menu and menu[-1]['side_dish']:
-                add_dish(('side dish',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+                add_dish(('side dish',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
         else:
-            add_dish(('main dish', 'soup'), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('main dish', 'soup'), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
             if menu and menu[-1]['side_dish']:
-                add_dish(('side dish',), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+                add_dish(('side dish',), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
-            add_dish(('starter', 'hot starter'), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+            add_dish(('starter', 'hot starter'), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
             if dinner_time == 'later':
-                add_dish(('appetizer', 'starter'), db, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories)
+                add_dish(('appetizer', 'starter'), catalog, dinner_category, dinner_time, cooking_time, current_cuisines, menu, main_ingredient_categories, rng)
 
-    return sort_menu_by_type(menu)        
+    return sort_menu_by_type(menu)
+
+def find_menu_variants(db, combinations, variants=1, seed=None, catalog=None):
+    """Build up to `variants` distinct menus for every (dinner_category, dinner_time, cooking_time) combination.
+
+    All menus come from one catalog snapshot and one seeded generator, so the same
+    seed over the same catalog reproduces the same menus.
+    """
+    if catalog is None:
+        catalog = dish_catalog.snapshot(db)
+    rng = random.Random(seed)
+    results = []
+    for dinner_category, dinner_time, cooking_time in combinations:
+        menus = []
+        seen = set()
+        for _ in range(variants * MENU_VARIANT_ATTEMPTS):
+            if len(menus) == variants:
+                break
+            menu = find_matching_dishes(db, dinner_category, dinner_time, cooking_time, rng, catalog)
+            key = frozenset(dish['id'] for dish in menu)
+            if not menu or key in seen:
+                continue
+            seen.add(key)
+            menus.append(menu)
+        results.append(menus)
+    return results
@@ -0,0 +1,131 @@
+from psycopg2.extras import RealDictCursor
+
+QUEUE_FIELDS = '''
+    d.id, d.title, d.image_url,
+    to_char(d.created, 'DD.MM.YYYY') AS created,
+    to_char(d.edited, 'DD.MM.YYYY') AS edited,
+    u.username AS author
+'''
+
+
+class NotPending(Exception):
+    pass
+
+
+class LeaseConflict(Exception):
+    def __init__(self, moderator, expires):
+        super().__init__(f"leased by {moderator} until {expires.isoformat()}")
+        self.moderator = moderator
+        self.expires = expires
+
+
+def claim_recipes(db, moderator_id, count, lease_seconds):
+    """Lease up to `count` of the oldest submissions nobody else holds.
+
+    Rows locked by a concurrent claim are skipped rather than waited for, so
+    moderators claiming at the same time get disjoint batches. Leases that
+    have expired are up for grabs again.
+    """
+    cursor = db.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(f'''
+        WITH claimed AS (
+            UPDATE moderation_queue q
+            SET lease_owner = %(moderator)s, lease_expires = now() + %(lease)s * INTERVAL '1 second'
+            FROM (
+                SELECT dish_id FROM moderation_queue
+                WHERE lease_owner IS NULL OR lease_expires <= now()
+                ORDER BY dish_id
+                LIMIT %(count)s
+                FOR UPDATE SKIP LOCKED
+            ) AS free
+            WHERE q.dish_id = free.dish_id
+            RETURNING q.dish_id, q.lease_expires
+        )
+        SELECT {QUEUE_FIELDS}, c.lease_expires
+        FROM claimed c
+        JOIN dishes d ON d.id = c.dish_id
+        JOIN users u ON u.id = d.author_id
+        ORDER BY d.id
+    ''', {'moderator': moderator_id, 'lease': lease_seconds, 'count': count})
+    return cursor.fetchall()
+
+def renew_leases(db, moderator_id, dish_ids, lease_seconds):
+    """Extend the caller's leases on `dish_ids`; returns {dish_id: new expiry} for those still held"""
+    cursor = db.cursor(cursor_factory=RealDictCursor)
+    cursor.execute('''
+        UPDATE moderation_queue
+        SET lease_expires = now() + %s * INTERVAL '1 second'
+        WHERE dish_id = ANY(%s) AND lease_owner = %s AND lease_expires > now()
+        RETURNING dish_id, lease_expires
+    ''', (lease_seconds, list(dish_ids), moderator_id))
+    return {row['dish_id']: row['lease_expires'] for row in cursor.fetchall()}
+
+def release_leases(db, moderator_id, dish_ids):
+    """Hand the caller's leases on `dish_ids` back to the queue; returns the released ids"""
+    cursor = db.cursor()
+    cursor.execute('''
+        UPDATE moderation_queue
+        SET lease_owner = NULL, lease_expires = NULL
+        WHERE dish_id = ANY(%s) AND lease_owner = %s
+        RETURNING dish_id
+    ''', (list(dish_ids), moderator_id))
+    return sorted(row[0] for row in cursor.fetchall())
+
+def lease_holder(cursor, dish_id):
+    cursor.execute('''
+        SELECT u.username, q.lease_expires
+        FROM moderation_queue q JOIN users u ON u.id = q.lease_owner
+        WHERE q.dish_id = %s AND q.lease_expires > now()
+    ''', (dish_id,))
+    return cursor.fetchone()
+
+def take_from_queue(db, dish_id, moderator_id):
+    """Remove a submission from the queue before publishing it, inside the publishing transaction.
+
+    Succeeds when the dish is unleased, leased by `moderator_id` or its lease
+    has expired. A concurrent publish of the same dish waits on the row lock
+    and then finds it gone, so a dish is published (and gets a moderation row)
+    only once. Raises LeaseConflict or NotPending otherwise.
+    """
+    cursor = db.cursor()
+    cursor.execute('''
+        DELETE FROM moderation_queue
+        WHERE dish_id = %s AND (lease_owner IS NULL OR lease_owner = %s OR lease_expires <= now())
+        RETURNING dish_id
+    ''', (dish_id, moderator_id))
+    if cursor.fetchone() is not None:
+        return
+    holder = lease_holder(cursor, dish_id)
+    if holder is not None:
+        raise LeaseConflict(*holder)
+    raise NotPending(dish_id)
+
+def check_lease(db, dish_id, moderator_id):
+    """Raise LeaseConflict while another moderator holds an unexpired lease on the dish"""
+    cursor = db.cursor()
+    cursor.execute('''
+        SELECT u.username, q.lease_expires
+        FROM moderation_queue q JOIN users u ON u.id = q.lease_owner
+        WHERE q.dish_id = %s AND q.lease_owner <> %s AND q.lease_expires > now()
+        FOR UPDATE OF q
+    ''', (dish_id, moderator_id))
+    holder = cursor.fetchone()
+    if holder is not None:
+        raise LeaseConflict(*holder)
+
+def pending_page(db, limit, after_id=None):
+    """Keyset page of the queue in submission order, with who holds each lease"""
+    cursor = db.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(f'''
+        SELECT {QUEUE_FIELDS},
+               CASE WHEN q.lease_expires > now() THEN lu.username END AS leased_by,
+               CASE WHEN q.lease_expires > now() THEN q.lease_expires END AS lease_expires
+        FROM moderation_queue q
+        JOIN dishes d ON d.id = q.dish_id
+        JOIN users u ON u.id = d.author_id
+        LEFT JOIN users lu ON lu.id = q.lease_owner
+        WHERE q.dish_id > %s
+        ORDER BY q.dish_id
+        LIMIT %s
+    ''', (after_id or 0, limit))
+    return cursor.fetchall()
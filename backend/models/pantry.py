@@ -0,0 +1,63 @@
+import heapq
+import random
+from models.dish_catalog import catalog as dish_catalog
+from models.ingredient_dictionary import normalize_name
+from models.matching_dishes import find_matching_dishes
+
+PANTRY_FIELDS = ('id', 'title', 'image_url', 'type', 'cooking_time')
+
+
+def pantry_names(ingredients):
+    return frozenset(normalize_name(name) for name in ingredients if name and name.strip())
+
+def scored_dish(dish, score):
+    coverage, missing = score
+    return {
+        **{field: dish[field] for field in PANTRY_FIELDS},
+        'coverage': round(coverage, 3),
+        'missing': sorted(missing),
+    }
+
+def rank_key(snapshot, slot, score):
+    # Best main-ingredient coverage first, then fewest missing items, then oldest dish
+    coverage, missing = score
+    return (-coverage, len(missing), snapshot.dishes[slot]['id'])
+
+
+class PantryRanking:
+    """Stands in for the `rng` of find_matching_dishes so that every course takes
+    the best pantry match instead of a random candidate.
+
+    select_dish() only calls rng.sample(slots, len(slots)) to order the
+    candidates; here that drops dishes without a covered main ingredient and
+    orders the rest by rank_key, breaking exact ties at random.
+    """
+
+    def __init__(self, snapshot, matches, rng=random):
+        self.snapshot = snapshot
+        self.matches = matches
+        self.rng = rng
+
+    def sample(self, population, k):
+        slots = [slot for slot in population if slot in self.matches]
+        return sorted(slots, key=lambda slot: (rank_key(self.snapshot, slot, self.matches[slot])[:2], self.rng.random()))
+
+
+def suggest_dishes(db, ingredients, limit=20, ignore_staples=True):
+    """Top `limit` moderated dishes for what is in the pantry.
+
+    Candidates come from the catalog's main-ingredient index, so only dishes
+    sharing at least one main ingredient with the pantry are scored.
+    """
+    snapshot = dish_catalog.snapshot(db)
+    matches = snapshot.pantry_matches(pantry_names(ingredients), ignore_staples)
+    best = heapq.nsmallest(limit, matches.items(), key=lambda item: rank_key(snapshot, *item))
+    return [scored_dish(snapshot.dishes[slot], score) for slot, score in best]
+
+def pantry_menu(db, ingredients, dinner_category, dinner_time, cooking_time, ignore_staples=True, seed=None):
+    """A menu following the find_matching_dishes course rules, built from the best pantry matches"""
+    snapshot = dish_catalog.snapshot(db)
+    matches = snapshot.pantry_matches(pantry_names(ingredients), ignore_staples)
+    ranking = PantryRanking(snapshot, matches, random.Random(seed))
+    menu = find_matching_dishes(db, dinner_category, dinner_time, cooking_time, ranking, snapshot)
+    return [{**dish, **scored_dish(dish, matches[snapshot.slots[dish['id']]])} for dish in menu]
@@ -0,0 +1,62 @@
+from psycopg2.extras import RealDictCursor
+
+DISH_FIELDS = ('title', 'description', 'image_url')
+DETAIL_FIELDS = DISH_FIELDS + ('steps', 'ingredients')
+
+DISHES_QUERY = "SELECT id, title, description, image_url FROM dishes WHERE id = ANY(%s)"
+STEPS_QUERY = "SELECT dish_id, index, description FROM steps WHERE dish_id = ANY(%s) ORDER BY dish_id, index"
+INGREDIENTS_QUERY = "SELECT dish_id, name, amount, measurement FROM ingredients WHERE dish_id = ANY(%s) ORDER BY dish_id, index"
+
+def fetch_recipe_details(db, dish_ids, fields=DETAIL_FIELDS):
+    """Details of several recipes in at most three queries, in the order of `dish_ids`.
+
+    Ids that do not exist are left out of the result.
+    """
+    dish_ids = [int(dish_id) for dish_id in dish_ids]
+    cursor = db.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(DISHES_QUERY, (list(dish_ids),))
+    dishes = cursor.fetchall()
+    found_ids = [dish['id'] for dish in dishes]
+
+    steps = []
+    if 'steps' in fields and found_ids:
+        cursor.execute(STEPS_QUERY, (found_ids,))
+        steps = cursor.fetchall()
+
+    ingredients = []
+    if 'ingredients' in fields and found_ids:
+        cursor.execute(INGREDIENTS_QUERY, (found_ids,))
+        ingredients = cursor.fetchall()
+
+    return assemble_recipes(dish_ids, dishes, steps, ingredients, fields)
+
+def assemble_recipes(dish_ids, dishes, steps, ingredients, fields=DETAIL_FIELDS):
+    """Recipes in the order of `dish_ids` from the rows of the three detail queries"""
+    dishes = {dish['id']: dish for dish in dishes}
+    found_ids = [dish_id for dish_id in dish_ids if dish_id in dishes]
+
+    steps_by_dish = {}
+    for step in steps:
+        step = dict(step)
+        steps_by_dish.setdefault(step.pop('dish_id'), []).append(step)
+
+    ingredients_by_dish = {}
+    for ingredient in ingredients:
+        ingredient = dict(ingredient)
+        ingredients_by_dish.setdefault(ingredient.pop('dish_id'), []).append(ingredient)
+
+    recipes = []
+    for dish_id in found_ids:
+        dish = dishes[dish_id]
+        recipe = {'id': dish_id}
+        for field in DISH_FIELDS:
+            if field in fields:
+                recipe[field] = dish[field]
+        if 'image_url' in fields:
+            recipe['image_url'] = f'/images/{dish["image_url"]}'
+        if 'steps' in fields:
+            recipe['steps'] = steps_by_dish.get(dish_id, [])
+        if 'ingredients' in fields:
+            recipe['ingredients'] = ingredients_by_dish.get(dish_id, [])
+        recipes.append(recipe)
+    return recipes
@@ -0,0 +1,69 @@
+from psycopg2.extras import RealDictCursor
+
+SEARCH_FIELDS = ('id', 'title', 'description', 'image_url', 'type', 'cuisine', 'season', 'cooking_time')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(row):
+    return f"{row['rank']!r}:{row['id']}"
+
+def decode_cursor(cursor):
+    """(rank, id) of the last row of the previous page"""
+    try:
+        rank, dish_id = cursor.rsplit(':', 1)
+        return float(rank), int(dish_id)
+    except ValueError:
+        raise InvalidCursor(f"invalid cursor: {cursor!r}")
+
+def search_recipes(db, text, dish_type=None, cuisine=None, season=None, cooking_time=None, limit=20, after=None):
+    """Moderated recipes matching `text`, best first.
+
+    Full-text matches (websearch syntax, see migrations/006_recipe_search.sql)
+    are ranked by ts_rank; titles that only resemble the query (typos) still
+    match through pg_trgm word similarity, which is added to the rank. Filters
+    follow the menu matcher: 'all seasons' dishes match any season, 'universal'
+    ones any cuisine, and cooking_time is an upper bound. Returns (rows, next
+    cursor or None).
+    """
+    filters = []
+    params = {'text': text, 'limit': limit}
+    if dish_type:
+        filters.append("d.type = %(type)s")
+        params['type'] = dish_type
+    if cuisine:
+        filters.append("d.cuisines && ARRAY[%(cuisine)s, 'universal']")
+        params['cuisine'] = cuisine.strip().lower()
+    if season:
+        filters.append("d.seasons && ARRAY[%(season)s, 'all seasons']")
+        params['season'] = season.strip().lower()
+    if cooking_time is not None:
+        filters.append("d.cooking_time <= %(cooking_time)s")
+        params['cooking_time'] = cooking_time
+
+    page = ''
+    if after is not None:
+        # Keyset over (rank DESC, id ASC); ranks are compared as float8 on both sides
+        page = "WHERE rank < %(after_rank)s OR (rank = %(after_rank)s AND id > %(after_id)s)"
+        params['after_rank'], params['after_id'] = after
+
+    cursor = db.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(f'''
+        WITH matches AS (
+            SELECT {', '.join(f'd.{field}' for field in SEARCH_FIELDS)},
+                   (ts_rank(d.search_vector, query) + word_similarity(%(text)s, d.title))::float8 AS rank
+            FROM dishes d, websearch_to_tsquery('english', %(text)s) AS query
+            WHERE d.is_moderated
+            AND (d.search_vector @@ query OR %(text)s <%% d.title)
+            {''.join(f' AND {condition}' for condition in filters)}
+        )
+        SELECT * FROM matches
+        {page}
+        ORDER BY rank DESC, id ASC
+        LIMIT %(limit)s
+    ''', params)
+    rows = cursor.fetchall()
+    next_cursor = encode_cursor(rows[-1]) if len(rows) == limit else None
+    return rows, next_cursor
@@ -0,0 +1,283 @@
+import csv
+import io
+import json
+import os
+from psycopg2.extras import RealDictCursor
+from models.availability import name_key
+from models.ingredient_dictionary import normalize_name, to_canonical_unit
+
+DISH_COLUMNS = ('title', 'description', 'image_url', 'author_id', 'type', 'side_dish', 'category',
+                'cuisine', 'season', 'cooking_time', 'dinner_time', 'is_moderated')
+INGREDIENT_COLUMNS = ('index', 'name', 'measurement', 'amount', 'category', 'is_main')
+STEP_COLUMNS = ('index', 'description')
+
+TRUE_VALUES = ('t', 'true', '1', 'yes')
+FALSE_VALUES = ('f', 'false', '0', 'no', '')
+
+
+class RecipeImportError(Exception):
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid record(s)")
+        self.errors = errors
+
+
+def read_jsonl(path):
+    """Recipes from a JSONL file: one dish per line with nested `ingredients` and `steps` lists"""
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+def read_csv_dir(path):
+    """Recipes from dishes.csv, ingredients.csv and steps.csv, the last two linked by a dish_title column"""
+    def rows(name):
+        with open(os.path.join(path, name), encoding='utf-8', newline='') as file:
+            return list(csv.DictReader(file))
+
+    recipes = {row['title']: {**row, 'ingredients': [], 'steps': []} for row in rows('dishes.csv')}
+    for kind in ('ingredients', 'steps'):
+        for row in rows(f'{kind}.csv'):
+            title = row.pop('dish_title')
+            # Unknown titles are kept so that validation can report them
+            recipes.setdefault(title, {'title': title, 'ingredients': [], 'steps': [], 'orphan': True})[kind].append(row)
+    return list(recipes.values())
+
+
+def _int(value):
+    return None if value in (None, '') else int(value)
+
+def _float(value):
+    return None if value in (None, '') else float(value)
+
+def _bool(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(f"not a boolean: {value!r}")
+
+def _text(value):
+    return None if value is None else str(value)
+
+def clean_recipe(recipe):
+    """Coerce one raw recipe into typed values; raises ValueError describing the first problem"""
+    if recipe.get('orphan'):
+        raise ValueError("ingredients or steps reference a dish that is not in dishes.csv")
+    title = (recipe.get('title') or '').strip()
+    if not title:
+        raise ValueError("title is required")
+
+    dish = {
+        'title': title,
+        'description': _text(recipe.get('description')),
+        'image_url': _text(recipe.get('image_url')) or 'default_img.jpg',
+        'author_id': _int(recipe.get('author_id')),
+        'type': _text(recipe.get('type')) or None,
+        'side_dish': _bool(recipe.get('side_dish')),
+        'category': _text(recipe.get('category')),
+        'cuisine': _text(recipe.get('cuisine')),
+        'season': _text(recipe.get('season')),
+        'cooking_time': _int(recipe.get('cooking_time')),
+        'dinner_time': _text(recipe.get('dinner_time')),
+        'is_moderated': bool(_bool(recipe.get('is_moderated'))),
+    }
+
+    ingredients = []
+    for position, ingredient in enumerate(recipe.get('ingredients') or [], start=1):
+        name = (ingredient.get('name') or '').strip()
+        if not name:
+            raise ValueError(f"ingredient {position} has no name")
+        ingredients.append({
+            'index': _int(ingredient.get('index')) or position,
+            'name': name,
+            'measurement': _text(ingredient.get('measurement')) or '',
+            'amount': _float(ingredient.get('amount')),
+            'category': _text(ingredient.get('category')) or None,
+            'is_main': bool(_bool(ingredient.get('is_main'))),
+        })
+
+    steps = []
+    for position, step in enumerate(recipe.get('steps') or [], start=1):
+        if isinstance(step, str):
+            step = {'description': step}
+        description = (step.get('description') or '').strip()
+        if not description:
+            raise ValueError(f"step {position} has no description")
+        steps.append({'index': _int(step.get('index')) or position, 'description': description})
+
+    return dish, ingredients, steps
+
+def validate(db, records):
+    """Clean all records, collecting every error instead of stopping at the first one"""
+    cleaned = []
+    errors = []
+    # Keyed like the lower(title) unique index (migrations/008_case_insensitive_names.sql)
+    titles = {}
+    for number, recipe in enumerate(records, start=1):
+        try:
+            dish, ingredients, steps = clean_recipe(recipe)
+        except (ValueError, TypeError) as e:
+            errors.append(f"record {number}: {e}")
+            continue
+        key = name_key(dish['title'])
+        if key in titles:
+            errors.append(f"record {number}: duplicate title {dish['title']!r} (also record {titles[key]})")
+            continue
+        titles[key] = number
+        cleaned.append((dish, ingredients, steps))
+
+    cursor = db.cursor()
+    cursor.execute("SELECT title, lower(title) FROM dishes WHERE lower(title) = ANY(%s)", (list(titles),))
+    for title, key in cursor.fetchall():
+        errors.append(f"record {titles[key]}: a dish titled {title!r} already exists")
+
+    author_ids = list({dish['author_id'] for dish, _, _ in cleaned if dish['author_id'] is not None})
+    cursor.execute("SELECT id FROM users WHERE id = ANY(%s)", (author_ids,))
+    known_authors = {row[0] for row in cursor.fetchall()}
+    for dish, _, _ in cleaned:
+        if dish['author_id'] is not None and dish['author_id'] not in known_authors:
+            errors.append(f"record {titles[name_key(dish['title'])]}: unknown author_id {dish['author_id']}")
+
+    if errors:
+        raise RecipeImportError(errors)
+    return cleaned
+
+
+def _copy(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['\\N' if value is None else value for value in row])
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+
+def load_batch(cursor, batch):
+    cursor.execute('''
+        CREATE TEMP TABLE import_dishes (
+            ref INTEGER, title TEXT, description TEXT, image_url TEXT, author_id INTEGER, type TEXT,
+            side_dish BOOLEAN, category TEXT, cuisine TEXT, season TEXT, cooking_time INTEGER,
+            dinner_time TEXT, is_moderated BOOLEAN
+        ) ON COMMIT DROP;
+        CREATE TEMP TABLE import_ingredients (
+            ref INTEGER, index INTEGER, name TEXT, measurement TEXT, amount REAL, category TEXT,
+            is_main BOOLEAN, canonical_name TEXT, unit TEXT, unit_amount REAL
+        ) ON COMMIT DROP;
+        CREATE TEMP TABLE import_steps (ref INTEGER, index INTEGER, description TEXT) ON COMMIT DROP;
+    ''')
+
+    _copy(cursor, 'import_dishes', ('ref',) + DISH_COLUMNS,
+          ((ref, *(dish[column] for column in DISH_COLUMNS)) for ref, (dish, _, _) in enumerate(batch)))
+    _copy(cursor, 'import_ingredients', ('ref',) + INGREDIENT_COLUMNS + ('canonical_name', 'unit', 'unit_amount'),
+          ((ref, *(ingredient[column] for column in INGREDIENT_COLUMNS), normalize_name(ingredient['name']),
+            *to_canonical_unit(ingredient['amount'], ingredient['measurement']))
+           for ref, (_, ingredients, _) in enumerate(batch) for ingredient in ingredients))
+    _copy(cursor, 'import_steps', ('ref',) + STEP_COLUMNS,
+          ((ref, step['index'], step['description']) for ref, (_, _, steps) in enumerate(batch) for step in steps))
+
+    cursor.execute('''
+        INSERT INTO dishes (title, description, image_url, author_id, type, side_dish, category, cuisine, season,
+                            cooking_time, dinner_time, is_moderated, categories, dinner_times, seasons, cuisines)
+        SELECT title, description, image_url, author_id, type, side_dish, category, cuisine, season,
+               cooking_time, dinner_time, is_moderated, split_attribute_list(category),
+               split_attribute_list(dinner_time), split_attribute_list(season), split_attribute_list(cuisine)
+        FROM import_dishes
+        ORDER BY ref;
+
+        INSERT INTO canonical_ingredients (name)
+        SELECT DISTINCT canonical_name FROM import_ingredients
+        ON CONFLICT (name) DO NOTHING;
+
+        INSERT INTO ingredients (dish_id, index, name, measurement, amount, category, is_main, ingredient_id, unit, unit_amount)
+        SELECT d.id, i.index, i.name, i.measurement, i.amount, i.category, i.is_main, c.id, i.unit, i.unit_amount
+        FROM import_ingredients i
+        JOIN import_dishes t ON t.ref = i.ref
+        JOIN dishes d ON d.title = t.title
+        JOIN canonical_ingredients c ON c.name = i.canonical_name;
+
+        INSERT INTO steps (dish_id, index, description)
+        SELECT d.id, s.index, s.description
+        FROM import_steps s
+        JOIN import_dishes t ON t.ref = s.ref
+        JOIN dishes d ON d.title = t.title;
+    ''')
+
+def import_recipes(db, records, batch_size=1000):
+    """Validate all records, then load them with COPY in transactions of `batch_size` recipes"""
+    cleaned = validate(db, records)
+    db.autocommit = False
+    cursor = db.cursor()
+    try:
+        for start in range(0, len(cleaned), batch_size):
+            load_batch(cursor, cleaned[start:start + batch_size])
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.autocommit = True
+    return len(cleaned)
+
+
+EXPORT_QUERIES = {
+    'dishes.csv': f'''
+        SELECT {', '.join(DISH_COLUMNS)} FROM dishes ORDER BY id
+    ''',
+    'ingredients.csv': '''
+        SELECT d.title AS dish_title, i.index, i.name, i.measurement, i.amount, i.category, i.is_main
+        FROM ingredients i JOIN dishes d ON d.id = i.dish_id
+        ORDER BY i.dish_id, i.index
+    ''',
+    'steps.csv': '''
+        SELECT d.title AS dish_title, s.index, s.description
+        FROM steps s JOIN dishes d ON d.id = s.dish_id
+        ORDER BY s.dish_id, s.index
+    ''',
+}
+
+def export_csv_dir(db, path):
+    os.makedirs(path, exist_ok=True)
+    cursor = db.cursor()
+    for name, query in EXPORT_QUERIES.items():
+        with open(os.path.join(path, name), 'w', encoding='utf-8', newline='') as file:
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", file)
+
+def export_jsonl(db, path, batch_size=1000):
+    # Named cursors need a transaction; rows are assembled per dish in SQL and streamed in batches
+    db.autocommit = False
+    try:
+        cursor = db.cursor(name='export_recipes', cursor_factory=RealDictCursor)
+        cursor.execute(f'''
+            SELECT json_build_object(
+                {', '.join(f"'{column}', d.{column}" for column in DISH_COLUMNS)},
+                'ingredients', COALESCE((
+                    SELECT json_agg(json_build_object(
+                        'index', i.index, 'name', i.name, 'measurement', i.measurement,
+                        'amount', i.amount, 'category', i.category, 'is_main', i.is_main
+                    ) ORDER BY i.index)
+                    FROM ingredients i WHERE i.dish_id = d.id
+                ), '[]'),
+                'steps', COALESCE((
+                    SELECT json_agg(json_build_object('index', s.index, 'description', s.description) ORDER BY s.index)
+                    FROM steps s WHERE s.dish_id = d.id
+                ), '[]')
+            ) AS recipe
+            FROM dishes d
+            ORDER BY d.id
+        ''')
+        count = 0
+        with open(path, 'w', encoding='utf-8') as file:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    file.write(json.dumps(row['recipe'], ensure_ascii=False) + '\n')
+                count += len(rows)
+        cursor.close()
+        db.commit()
+        return count
+    finally:
+        db.autocommit = True
@@ -0,0 +1,152 @@
+from psycopg2.extras import RealDictCursor, execute_values
+from models.ingredient_dictionary import resolve_ingredients, to_canonical_unit
+
+INGREDIENT_FIELDS = ('index', 'name', 'amount', 'measurement', 'category', 'is_main')
+STEP_FIELDS = ('index', 'description')
+
+
+class VersionConflict(Exception):
+    pass
+
+
+class InvalidRecipeUpdate(ValueError):
+    pass
+
+
+def recipe_version(edited):
+    """Version token handed out with a recipe and checked on update; `edited` changes on every write"""
+    return edited.isoformat() if edited is not None else ''
+
+def submitted_ingredient(ingredient, position):
+    return {
+        'id': ingredient.get('id'),
+        'index': ingredient.get('index') or position,
+        'name': ingredient['name'],
+        'amount': float(ingredient['amount']) if ingredient.get('amount') not in (None, '') else None,
+        'measurement': ingredient.get('measurement'),
+        'category': ingredient.get('category'),
+        'is_main': bool(ingredient.get('isMain', ingredient.get('is_main', False))),
+    }
+
+def submitted_step(step, position):
+    return {
+        'id': step.get('id'),
+        'index': step.get('index') or position,
+        'description': step['description'],
+    }
+
+def diff_rows(stored, submitted, fields):
+    """Split submitted rows into (inserted, changed, deleted ids) against the stored rows of the same dish"""
+    stored_by_id = {row['id']: row for row in stored}
+    inserted = []
+    changed = []
+    kept = set()
+    for row in submitted:
+        current = stored_by_id.get(row['id'])
+        if current is None:
+            inserted.append(row)
+            continue
+        kept.add(row['id'])
+        if any(row[field] != current[field] for field in fields):
+            changed.append(row)
+    deleted = [row_id for row_id in stored_by_id if row_id not in kept]
+    return inserted, changed, deleted
+
+def _ingredient_values(cursor, dish_id, rows, with_id):
+    ingredient_ids = resolve_ingredients(cursor, [row['name'] for row in rows])
+    values = []
+    for row in rows:
+        unit, unit_amount = to_canonical_unit(row['amount'], row['measurement'])
+        value = (dish_id, row['index'], row['name'], row['amount'], row['measurement'], row['category'], row['is_main'],
+                 ingredient_ids.get(row['name']), unit, unit_amount)
+        values.append((row['id'],) + value if with_id else value)
+    return values
+
+def update_recipe(db, dish_id, data):
+    """Apply only what differs from the stored recipe; must run inside a transaction.
+
+    Ingredients and steps are only diffed when their key is in `data`, so a body
+    with just a title leaves them alone. Returns (changed, new version) or None
+    if the dish does not exist. Raises VersionConflict when `data['version']` is
+    given and the recipe was saved by someone else since it was read, and
+    InvalidRecipeUpdate for malformed ingredient or step lists.
+    """
+    for key in ('ingredients', 'steps'):
+        if key in data and not isinstance(data[key], list):
+            raise InvalidRecipeUpdate(f"{key} must be a list")
+
+    cursor = db.cursor(cursor_factory=RealDictCursor)
+    # The row lock makes concurrent updates of the same dish queue up, so the
+    # second one sees the first one's version and fails instead of overwriting it
+    cursor.execute("SELECT title, description, edited FROM dishes WHERE id = %s FOR UPDATE", (dish_id,))
+    dish = cursor.fetchone()
+    if dish is None:
+        return None
+    version = recipe_version(dish['edited'])
+    if data.get('version') is not None and data['version'] != version:
+        raise VersionConflict(version)
+
+    new_ingredients, changed_ingredients, deleted_ingredients = [], [], []
+    if 'ingredients' in data:
+        try:
+            ingredients = [submitted_ingredient(ingredient, i) for i, ingredient in enumerate(data['ingredients'], start=1)]
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise InvalidRecipeUpdate(f"invalid ingredient: {e}")
+        cursor.execute(f"SELECT id, {', '.join(INGREDIENT_FIELDS)} FROM ingredients WHERE dish_id = %s", (dish_id,))
+        # Stored rows may have is_main NULL, which the submitted rows carry as False
+        stored = [{**row, 'is_main': bool(row['is_main'])} for row in cursor.fetchall()]
+        new_ingredients, changed_ingredients, deleted_ingredients = diff_rows(stored, ingredients, INGREDIENT_FIELDS)
+
+    new_steps, changed_steps, deleted_steps = [], [], []
+    if 'steps' in data:
+        try:
+            steps = [submitted_step(step, i) for i, step in enumerate(data['steps'], start=1)]
+        except (KeyError, TypeError, AttributeError) as e:
+            raise InvalidRecipeUpdate(f"invalid step: {e}")
+        cursor.execute(f"SELECT id, {', '.join(STEP_FIELDS)} FROM steps WHERE dish_id = %s", (dish_id,))
+        new_steps, changed_steps, deleted_steps = diff_rows(cursor.fetchall(), steps, STEP_FIELDS)
+
+    dish_changed = data.get('title', dish['title']) != dish['title'] or data.get('description', dish['description']) != dish['description']
+
+    if not any((dish_changed, new_ingredients, changed_ingredients, deleted_ingredients, new_steps, changed_steps, deleted_steps)):
+        return False, version
+
+    if deleted_ingredients:
+        cursor.execute("DELETE FROM ingredients WHERE dish_id = %s AND id = ANY(%s)", (dish_id, deleted_ingredients))
+    if deleted_steps:
+        cursor.execute("DELETE FROM steps WHERE dish_id = %s AND id = ANY(%s)", (dish_id, deleted_steps))
+
+    if changed_ingredients:
+        execute_values(cursor, '''
+            UPDATE ingredients AS i
+            SET index = v.index, name = v.name, amount = v.amount, measurement = v.measurement, category = v.category,
+                is_main = v.is_main, ingredient_id = v.ingredient_id, unit = v.unit, unit_amount = v.unit_amount
+            FROM (VALUES %s) AS v(id, dish_id, index, name, amount, measurement, category, is_main, ingredient_id, unit, unit_amount)
+            WHERE i.id = v.id AND i.dish_id = v.dish_id
+        ''', _ingredient_values(cursor, dish_id, changed_ingredients, True),
+            # Typed, since a column that is NULL in every row would otherwise be text
+            template='(%s::integer, %s::integer, %s::integer, %s, %s::real, %s, %s, %s::boolean, %s::integer, %s, %s::real)')
+    if new_ingredients:
+        execute_values(cursor, '''
+            INSERT INTO ingredients (dish_id, index, name, amount, measurement, category, is_main, ingredient_id, unit, unit_amount)
+            VALUES %s
+        ''', _ingredient_values(cursor, dish_id, new_ingredients, False))
+
+    if changed_steps:
+        execute_values(cursor, '''
+            UPDATE steps AS s
+            SET index = v.index, description = v.description
+            FROM (VALUES %s) AS v(id, dish_id, index, description)
+            WHERE s.id = v.id AND s.dish_id = v.dish_id
+        ''', [(step['id'], dish_id, step['index'], step['description']) for step in changed_steps])
+    if new_steps:
+        execute_values(cursor, '''
+            INSERT INTO steps (dish_id, index, description) VALUES %s
+        ''', [(dish_id, step['index'], step['description']) for step in new_steps])
+
+    cursor.execute('''
+        UPDATE dishes SET title = %s, description = %s, edited = clock_timestamp()
+        WHERE id = %s
+        RETURNING edited
+    ''', (data.get('title', dish['title']), data.get('description', dish['description']), dish_id))
+    return True, recipe_version(cursor.fetchone()['edited'])
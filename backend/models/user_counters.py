@@ -0,0 +1,15 @@
+from psycopg2.extras import RealDictCursor
+from db import transaction
+
+def reconcile_counters(db):
+    """Recount the profile counters of every user (see migrations/007_user_counters.sql).
+
+    Returns the rows that had drifted, with their corrected values. Writes to
+    menus, dishes and moderation wait while this runs, so no trigger update can
+    land between the recount and the overwrite.
+    """
+    with transaction(db):
+        cursor = db.cursor(cursor_factory=RealDictCursor)
+        cursor.execute("LOCK TABLE user_counters IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute("SELECT * FROM reconcile_user_counters() ORDER BY user_id")
+        return cursor.fetchall()
@@ -0,0 +1,138 @@
+import logging
+import os
+import re
+import threading
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context, has_request_context, request
+
+logger = logging.getLogger('tastyspace.sql')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Frames from these files are the tracing layer itself, not the caller
+SKIPPED_FILES = ('metrics.py', 'query_trace.py')
+# Repeats of one statement in a request tolerated in testing unless QUERY_REPEAT_LIMIT says otherwise
+DEFAULT_REPEAT_LIMIT = 10
+MAX_PARAMS_LENGTH = 500
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+WHITESPACE = re.compile(r'\s+')
+
+
+class NPlusOneDetected(AssertionError):
+    pass
+
+
+def query_text(query):
+    if isinstance(query, bytes):
+        return query.decode('utf-8', 'replace')
+    return str(query)
+
+def normalize(query):
+    """Statement shape used to spot repeats: literals replaced by ?, whitespace collapsed"""
+    text = STRING_LITERAL.sub('?', query_text(query))
+    text = NUMBER_LITERAL.sub('?', text)
+    return WHITESPACE.sub(' ', text).strip()
+
+def call_site():
+    """file:line of the innermost application frame that issued the statement"""
+    for frame in reversed(traceback.extract_stack()):
+        filename = frame.filename
+        if (filename.startswith(BASE_DIR) and os.path.basename(filename) not in SKIPPED_FILES
+                and os.sep + '.venv' + os.sep not in filename):
+            return f"{os.path.relpath(filename, BASE_DIR)}:{frame.lineno} in {frame.name}"
+    return 'unknown'
+
+def _params(params):
+    text = repr(params)
+    return text if len(text) <= MAX_PARAMS_LENGTH else text[:MAX_PARAMS_LENGTH] + '...'
+
+def repeat_limit():
+    limit = current_app.config.get('QUERY_REPEAT_LIMIT')
+    if limit is None and current_app.testing:
+        limit = DEFAULT_REPEAT_LIMIT
+    return None if limit is None else int(limit)
+
+
+# Per thread, so a budget only counts statements of the thread that opened it and
+# not those of the catalog reload or image derivative threads running meanwhile
+_local = threading.local()
+
+def _recorders():
+    recorders = getattr(_local, 'recorders', None)
+    if recorders is None:
+        recorders = _local.recorders = []
+    return recorders
+
+def trace_statement(query, params, elapsed):
+    """Slow-query log, per-request statement shapes and query_budget recording for one statement"""
+    for recorder in _recorders():
+        recorder.append((query_text(query), params))
+
+    if not has_app_context():
+        return
+
+    slow_ms = current_app.config.get('SLOW_QUERY_MS')
+    if slow_ms is not None and elapsed * 1000 >= float(slow_ms):
+        logger.warning("slow query (%.1f ms) at %s: %s -- params: %s",
+                       elapsed * 1000, call_site(), WHITESPACE.sub(' ', query_text(query)).strip(), _params(params))
+
+    if has_request_context() and repeat_limit() is not None:
+        shapes = g.get('sql_shapes')
+        if shapes is None:
+            shapes = g.sql_shapes = Counter()
+            g.sql_sites = {}
+        shape = normalize(query)
+        shapes[shape] += 1
+        if shapes[shape] == 2:
+            g.sql_sites[shape] = call_site()
+
+def check_repeats(response):
+    """after_request hook: flag requests that ran one statement shape more than QUERY_REPEAT_LIMIT times.
+
+    Logged as a warning; in testing the request fails with NPlusOneDetected.
+    """
+    limit = repeat_limit()
+    shapes = g.get('sql_shapes')
+    if limit is None or not shapes:
+        return response
+    repeated = [(shape, count) for shape, count in shapes.items() if count > limit]
+    if repeated:
+        details = '; '.join(f"{count}x at {g.sql_sites.get(shape, 'unknown')}: {shape}" for shape, count in repeated)
+        message = f"possible N+1 in {request.method} {request.path}: {details}"
+        logger.warning(message)
+        if current_app.testing:
+            raise NPlusOneDetected(message)
+    return response
+
+
+@contextmanager
+def query_budget(limit, repeat_limit=None):
+    """Fail a test when the code under the block runs more than `limit` statements.
+
+        with query_budget(3):
+            client.get('/savedMenus', headers=auth)
+
+    With `repeat_limit`, any single statement shape may also run at most that
+    many times. Only statements run by the calling thread count (the Flask test
+    client handles the request in it). Yields the list of (statement, params)
+    that were executed.
+    """
+    statements = []
+    recorders = _recorders()
+    recorders.append(statements)
+    try:
+        yield statements
+    finally:
+        recorders.remove(statements)
+
+    listing = '\n'.join(f"  {WHITESPACE.sub(' ', query).strip()}" for query, _ in statements)
+    if len(statements) > limit:
+        raise AssertionError(f"{len(statements)} SQL statements, budget is {limit}:\n{listing}")
+    if repeat_limit is not None:
+        shapes = Counter(normalize(query) for query, _ in statements)
+        repeated = {shape: count for shape, count in shapes.items() if count > repeat_limit}
+        if repeated:
+            raise AssertionError(f"statements repeated more than {repeat_limit} times: {repeated}\n{listing}")
@@ -0,0 +1,67 @@
+import csv
+import io
+import json
+import uuid
+from flask import Response
+from psycopg2.extras import RealDictCursor
+from db import close_db, get_pool
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+EXPORT_BATCH_SIZE = 1000
+
+def _cell(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=str)
+    return value
+
+def _ndjson_batch(rows):
+    return ''.join(json.dumps(row, default=str) + '\n' for row in rows)
+
+def _csv_batch(rows, header=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows([_cell(value) for value in row.values()] for row in rows)
+    return buffer.getvalue()
+
+def stream_export(query, params, fmt, filename):
+    """Stream the rows of `query` as NDJSON or CSV through a named (server-side) cursor.
+
+    The generator checks out its own pooled connection because it keeps running
+    after the view has returned. The request's connection (used for the ETag) is
+    handed back first, so an export never holds two.
+    """
+    def generate():
+        pool = get_pool()
+        db = pool.getconn()
+        try:
+            # Named cursors only live inside a transaction
+            db.autocommit = False
+            cursor = db.cursor(name=f"export_{uuid.uuid4().hex}", cursor_factory=RealDictCursor)
+            cursor.execute(query, params)
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if fmt == 'csv':
+                # From the cursor, so an export without rows still has its header line
+                yield _csv_batch(rows, [column.name for column in cursor.description])
+            else:
+                yield _ndjson_batch(rows)
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                yield _csv_batch(rows) if fmt == 'csv' else _ndjson_batch(rows)
+            cursor.close()
+            db.commit()
+        finally:
+            pool.putconn(db)
+
+    close_db()
+    return Response(
+        generate(),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}.{fmt}'}
+    )
@@ -0,0 +1,35 @@
+"""The asyncio entry point (needs the optional packages from requirements.txt)"""
+import asyncio
+import pytest
+from flask_jwt_extended import create_access_token
+
+pytest.importorskip('quart')
+pytest.importorskip('psycopg_pool')
+
+
+def test_recipe_revalidates_to_304(database, user, dishes):
+    import asgi
+    user_id, _ = user
+    with asgi.flask_app.app_context():
+        auth = {'Authorization': f'Bearer {create_access_token(identity=str(user_id))}'}
+
+    async def run():
+        async with asgi.app.test_app() as test_app:
+            client = test_app.test_client()
+            first = await client.get(f'/recipes/{dishes[0]}', headers=auth)
+            assert first.status_code == 200
+            etag = first.headers['ETag']
+            assert etag.startswith('W/')
+            second = await client.get(f'/recipes/{dishes[0]}', headers={**auth, 'If-None-Match': etag})
+            assert second.status_code == 304
+
+    asyncio.run(run())
+
+def test_create_menu_rejects_bad_cooking_time():
+    import asgi
+
+    async def run():
+        response = await asgi.app.test_client().post('/createMenu', json={'dinnerCategory': 'family', 'cookingTime': 'soon'})
+        assert response.status_code == 400
+
+    asyncio.run(run())
@@ -0,0 +1,25 @@
+"""ETag revalidation on the WSGI app (asgi.py has its own tests in test_asgi.py)"""
+
+
+def test_recipe_revalidates_to_304(client, user, dishes):
+    _, auth = user
+    first = client.get(f'/recipes/{dishes[0]}', headers=auth)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+
+    second = client.get(f'/recipes/{dishes[0]}', headers={**auth, 'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.get_data() == b''
+
+def test_saved_menus_etag_moves_with_a_write(client, db, user, menus):
+    _, auth = user
+    etag = client.get('/savedMenus', headers=auth).headers['ETag']
+    assert client.get('/savedMenus', headers={**auth, 'If-None-Match': etag}).status_code == 304
+
+    # The table version is bumped at commit (migrations/010, 011)
+    db.cursor().execute("UPDATE menus SET title = 'Renamed' WHERE id = %s", (menus[0],))
+    response = client.get('/savedMenus', headers={**auth, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()[0]['title'] == 'Renamed'
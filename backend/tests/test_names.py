@@ -0,0 +1,50 @@
+"""Usernames and dish titles are unique regardless of case (migrations/008_case_insensitive_names.sql)"""
+import uuid
+import pytest
+from models.recipe_transfer import RecipeImportError, import_recipes
+
+
+@pytest.fixture
+def username(db):
+    name = f'Test_{uuid.uuid4().hex[:12]}'
+    yield name
+    db.cursor().execute("DELETE FROM users WHERE lower(username) = lower(%s)", (name,))
+
+def test_login_ignores_case(client, username):
+    assert client.post('/register', json={'username': username, 'password': 'pw', 'role': 'user'}).status_code == 201
+    response = client.post('/login', json={'username': username.upper(), 'password': 'pw'})
+    assert 'access_token' in response.get_json()
+
+def test_case_variant_username_is_a_conflict(client, username):
+    assert client.post('/register', json={'username': username, 'password': 'pw', 'role': 'user'}).status_code == 201
+    assert client.post('/check_username', json={'username': username.lower()}).get_json() == {'valid': True}
+    response = client.post('/register', json={'username': username.lower(), 'password': 'pw', 'role': 'user'})
+    assert response.status_code == 409
+
+def test_import_rejects_case_variant_of_existing_title(db, user, dishes):
+    user_id, _ = user
+    cursor = db.cursor()
+    cursor.execute("SELECT title FROM dishes WHERE id = %s", (dishes[0],))
+    existing = cursor.fetchone()[0]
+    fresh = f'Imported {uuid.uuid4().hex}'
+    records = [
+        {'title': fresh, 'author_id': user_id, 'ingredients': [{'name': 'salt'}], 'steps': [{'description': 'Cook'}]},
+        {'title': existing.upper(), 'author_id': user_id, 'ingredients': [{'name': 'salt'}], 'steps': [{'description': 'Cook'}]},
+    ]
+    with pytest.raises(RecipeImportError) as error:
+        import_recipes(db, records)
+    assert any('already exists' in message for message in error.value.errors)
+    # Validation failed before any batch was loaded
+    cursor.execute("SELECT count(*) FROM dishes WHERE title = %s", (fresh,))
+    assert cursor.fetchone()[0] == 0
+
+def test_import_rejects_case_variant_duplicates_within_the_file(db, user):
+    user_id, _ = user
+    title = f'Imported {uuid.uuid4().hex}'
+    records = [
+        {'title': title, 'author_id': user_id, 'ingredients': [{'name': 'salt'}], 'steps': [{'description': 'Cook'}]},
+        {'title': title.upper(), 'author_id': user_id, 'ingredients': [{'name': 'salt'}], 'steps': [{'description': 'Cook'}]},
+    ]
+    with pytest.raises(RecipeImportError) as error:
+        import_recipes(db, records)
+    assert any('duplicate title' in message for message in error.value.errors)
@@ -0,0 +1,21 @@
+"""Statement counts of list routes, which must not grow with the number of rows they return"""
+from query_trace import query_budget
+
+
+def test_saved_menus_load_in_one_statement(client, user, menus):
+    _, auth = user
+    # The ETag's table versions, then the menus with their dishes
+    with query_budget(2, repeat_limit=1):
+        response = client.get('/savedMenus', headers=auth)
+    assert response.status_code == 200
+    assert [menu['id'] for menu in response.get_json()] == menus
+    assert all(len(menu['recipes']) == 3 for menu in response.get_json())
+
+def test_recipe_details_batch_does_not_query_per_recipe(client, dishes):
+    # Dishes, steps and ingredients: one statement each, whatever the batch size
+    with query_budget(3, repeat_limit=1):
+        response = client.post('/recipeDetails/batch', json={'recipeIds': dishes})
+    assert response.status_code == 200
+    recipes = response.get_json()
+    assert [recipe['id'] for recipe in recipes] == dishes
+    assert all(len(recipe['steps']) == 2 and len(recipe['ingredients']) == 1 for recipe in recipes)
@@ -0,0 +1,37 @@
+"""Optimistic versioning and diffing of PUT /recipes/<id>"""
+import uuid
+
+
+def test_stale_version_is_rejected(client, user, dishes):
+    _, auth = user
+    version = client.get(f'/recipes/{dishes[0]}', headers=auth).get_json()['version']
+
+    saved = client.put(f'/recipes/{dishes[0]}', headers=auth, json={'title': f'First {uuid.uuid4().hex}', 'version': version})
+    assert saved.status_code == 200
+    assert saved.get_json()['changed'] is True
+    new_version = saved.get_json()['version']
+    assert new_version != version
+
+    stale = client.put(f'/recipes/{dishes[0]}', headers=auth, json={'title': f'Second {uuid.uuid4().hex}', 'version': version})
+    assert stale.status_code == 409
+    assert stale.get_json()['version'] == new_version
+
+    # A second save with the version returned by the first one goes through
+    again = client.put(f'/recipes/{dishes[0]}', headers=auth, json={'title': f'Second {uuid.uuid4().hex}', 'version': new_version})
+    assert again.status_code == 200
+
+def test_unchanged_ingredients_with_null_is_main_are_not_rewritten(client, user, dishes):
+    _, auth = user
+    recipe = client.get(f'/recipes/{dishes[0]}', headers=auth).get_json()
+    assert recipe['ingredients'][0]['is_main'] is None
+
+    response = client.put(f'/recipes/{dishes[0]}', headers=auth, json={
+        'ingredients': recipe['ingredients'], 'steps': recipe['steps'], 'version': recipe['version'],
+    })
+    assert response.status_code == 200
+    assert response.get_json() == {'message': 'Recipe updated successfully', 'changed': False, 'version': recipe['version']}
+
+def test_ingredients_must_be_a_list(client, user, dishes):
+    _, auth = user
+    response = client.put(f'/recipes/{dishes[0]}', headers=auth, json={'ingredients': 'salt'})
+    assert response.status_code == 400
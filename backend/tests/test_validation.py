@@ -0,0 +1,37 @@
+"""Malformed request bodies are answered with 400 before any database work"""
+import pytest
+
+
+@pytest.mark.parametrize('body', [
+    {'dinnerCategory': 'family', 'dinnerTime': 'today'},
+    {'dinnerCategory': 'family', 'dinnerTime': 'today', 'cookingTime': 'soon'},
+    {'dinnerCategory': 'family', 'dinnerTime': 'today', 'cookingTime': True},
+    {'variants': 2, 'dinnerCategory': 'family', 'dinnerTime': 'today', 'cookingTime': None},
+    {'combinations': [{'dinnerCategory': 'family', 'dinnerTime': 'today', 'cookingTime': [2]}]},
+])
+def test_create_menu_rejects_bad_cooking_time(client, body):
+    response = client.post('/createMenu', json=body)
+    assert response.status_code == 400
+    assert 'cookingTime' in response.get_json()['error']
+
+@pytest.mark.parametrize('body', [
+    {'variants': True, 'cookingTime': 2},
+    {'combinations': 'family', 'cookingTime': 2},
+    {'combinations': [1, 2]},
+])
+def test_create_menu_rejects_bad_variants_and_combinations(client, body):
+    assert client.post('/createMenu', json=body).status_code == 400
+
+@pytest.mark.parametrize('body', [
+    {'recipeIds': '123'},
+    {'recipeIds': 5},
+    {'recipeIds': [1, True]},
+    {'recipeIds': [1], 'fields': 'title'},
+    {'recipeIds': [1], 'fields': [['title']]},
+    {'recipeIds': [1], 'fields': ['title', 'author']},
+])
+def test_recipe_details_batch_rejects_bad_ids_and_fields(client, body):
+    assert client.post('/recipeDetails/batch', json=body).status_code == 400
+
+def test_pantry_dishes_rejects_boolean_limit(client):
+    assert client.post('/pantryDishes', json={'ingredients': ['egg'], 'limit': True}).status_code == 400
@@ -0,0 +1,85 @@
+import logging
+import time
+from db import db_setting, get_pool
+from models.aggregate_ingredients import AGGREGATE_QUERY
+from models.availability import LOGIN_QUERY, titles, usernames
+from models.dish_catalog import catalog as dish_catalog
+from models.ingredient_dictionary import inflect_engine
+from models.recipe_details import DISHES_QUERY, INGREDIENTS_QUERY, STEPS_QUERY
+
+logger = logging.getLogger('tastyspace.boot')
+
+# psycopg2 has no client-side prepared statements; planning the hot statements
+# once per connection instead loads the relation, index and statistics metadata
+# they need into that backend's caches without running them
+WARMUP_STATEMENTS = (
+    (LOGIN_QUERY, ('', '')),
+    (AGGREGATE_QUERY, ([0],)),
+    (DISHES_QUERY, ([0],)),
+    (STEPS_QUERY, ([0],)),
+    (INGREDIENTS_QUERY, ([0],)),
+)
+
+
+def warm_connections(pool, count):
+    """Open `count` pooled connections at once and plan WARMUP_STATEMENTS on each"""
+    connections = []
+    try:
+        for _ in range(min(count, pool.maxconn)):
+            connections.append(pool.getconn())
+        for conn in connections:
+            with conn.cursor() as cursor:
+                for query, params in WARMUP_STATEMENTS:
+                    cursor.execute('EXPLAIN ' + query, params)
+    finally:
+        for conn in connections:
+            pool.putconn(conn)
+    return len(connections)
+
+def warm_up(app, connections=None, started=None):
+    """Load what the first requests of a worker would otherwise pay for.
+
+    Opens `connections` pooled connections (DB_POOL_MIN by default), loads the
+    dish catalog, the availability filters and the inflect engine. Call it in the serving process, after
+    any fork. Returns the seconds spent per phase plus 'total', measured from
+    `started` (a time.monotonic() value, e.g. the fork) when given; a total
+    above COLD_START_TARGET_MS is logged as a warning.
+    """
+    timings = {}
+    begin = time.monotonic()
+    with app.app_context():
+        start = time.monotonic()
+        pool = get_pool()
+        opened = warm_connections(pool, connections or int(db_setting("DB_POOL_MIN", 1)))
+        timings['pool'] = time.monotonic() - start
+
+        start = time.monotonic()
+        conn = pool.getconn()
+        try:
+            dish_catalog.load(conn)
+        finally:
+            pool.putconn(conn)
+        timings['catalog'] = time.monotonic() - start
+
+        start = time.monotonic()
+        conn = pool.getconn()
+        try:
+            usernames.load(conn)
+            titles.load(conn)
+        finally:
+            pool.putconn(conn)
+        timings['availability'] = time.monotonic() - start
+
+        start = time.monotonic()
+        inflect_engine().singular_noun('tomatoes')
+        timings['ingredient_dictionary'] = time.monotonic() - start
+
+        timings['total'] = time.monotonic() - (begin if started is None else started)
+        target_ms = float(app.config.get('COLD_START_TARGET_MS', 2000))
+
+    summary = ', '.join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in timings.items())
+    if timings['total'] * 1000 > target_ms:
+        logger.warning("warm-up over the %.0f ms target (%d connections): %s", target_ms, opened, summary)
+    else:
+        logger.info("warm-up done (%d connections): %s", opened, summary)
+    return timings
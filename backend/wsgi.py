@@ -0,0 +1,15 @@
+"""WSGI entry point for production servers, see gunicorn.conf.py:
+
+    gunicorn -c gunicorn.conf.py
+
+`flask run` finds main.create_app on its own and reads .env itself; other
+servers do not, so it is loaded here.
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+
+from main import create_app
+
+app = create_app()
@@ -22,6 +22,7 @@ export type Recipe = {
     title: string;
     description?: string;
     image_url?: string;
+    version?: string;
     ingredients: Ingredient[];
     steps: Step[];
 };
@@ -33,6 +33,8 @@ export type Recipe = {
   author: string;
   created: string;
   edited?: string;
+  // Returned by GET /recipes/:id and sent back with updates; a stale one gets a 409
+  version?: string;
   ingredients: Ingredient[];
   steps: Step[];
 };
@@ -118,6 +120,8 @@ export default function NewRecipes({ updateActionButtons }: NewRecipesProps) {
           console.log('Recipe updated successfully');
           const updatedRecipeWithImage = {
             ...updatedRecipe,
+            // The next save of this recipe must carry the version of this one
+            version: data.version,
             image_url: updatedRecipe.image_url ? `/images/${updatedRecipe.image_url}` : defaultImageUrl
           };
           setSelectedRecipe(updatedRecipeWithImage); // Обновляем для текущего просмотра